@@ -0,0 +1 @@
+"""Benchmarks of the ETL project, run against local stand-ins of the source and backup databases."""
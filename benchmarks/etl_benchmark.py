@@ -0,0 +1,408 @@
+"""Benchmark of the extract and load path of the ETL, run against local databases.
+
+The source is a SQLite file (or any database given with --source-url, such as a local PostgreSQL)
+filled with generated users and roles, and the backup is a libsql file (or SQLite if libsql is not installed).
+Every scenario streams the users and roles out of the source and loads them in the backup through the
+same pipeline as `main.load_user_data`, in its own process so that its peak RSS is measured alone.
+
+Usage:
+    python -m benchmarks.etl_benchmark --users 100000 --modes plain,rsa,envelope
+"""
+
+import argparse
+import json
+import logging
+import math
+import multiprocessing
+import os
+import platform
+import random
+import resource
+import subprocess  # nosec used to read the current git commit only
+import sys
+import tempfile
+import uuid
+from datetime import datetime, timedelta
+from os.path import join
+from time import perf_counter
+
+from sqlalchemy import create_engine, text
+
+from config.default import (
+    BASE_DIR,
+    FIELD_NAME_2,
+    FIELD_NAME_3,
+    FIELD_NAME_4,
+    FIELD_NAME_5,
+    FIELD_NAME_6,
+    FIELD_NAME_7,
+    FIELD_NAME_8,
+    FIELD_NAME_9,
+    FIELD_NAME_10,
+    FIELD_NAME_12,
+    FIELD_NAME_13,
+    FIELD_NAME_14,
+    LOAD_BATCH_SIZE,
+    TABLE_NAME_1,
+    TABLE_NAME_2,
+)
+from core.models.iam_gateway import User, UserRole
+
+logger = logging.getLogger("__main__")
+
+MODES = ("plain", "rsa", "envelope")
+_ROLES = ("Admin", "Editor", "Viewer", "Auditor")
+
+
+def _create_tables(connection) -> None:
+    """Create the user and user role tables, with the columns of both the source and the backup."""
+    user_columns = ", ".join(
+        f"{field} TEXT"
+        for field in (
+            FIELD_NAME_2,
+            FIELD_NAME_3,
+            FIELD_NAME_4,
+            FIELD_NAME_5,
+            FIELD_NAME_6,
+            FIELD_NAME_7,
+            FIELD_NAME_8,
+            FIELD_NAME_9,
+            FIELD_NAME_10,
+        )
+    )
+    role_columns = ", ".join(
+        f"{field} TEXT" for field in (FIELD_NAME_12, FIELD_NAME_13, FIELD_NAME_14)
+    )
+    connection.execute(text(f"DROP TABLE IF EXISTS {TABLE_NAME_2}"))
+    connection.execute(text(f"DROP TABLE IF EXISTS {TABLE_NAME_1}"))
+    connection.execute(
+        text(
+            f"CREATE TABLE {TABLE_NAME_1} (id TEXT PRIMARY KEY, {user_columns}, password TEXT, date_insertion TEXT)"
+        )
+    )
+    connection.execute(
+        text(
+            f"CREATE TABLE {TABLE_NAME_2} (id INTEGER PRIMARY KEY, {role_columns}, date_insertion TEXT)"
+        )
+    )
+    connection.commit()
+
+
+def generate_users(count: int, seed: int = 0):
+    """Generate users with reproducible values.
+
+    Args:
+        count: The number of users.
+        seed: The seed of the random generator.
+    Yields:
+        User: The generated users.
+    """
+    generator = random.Random(seed)  # nosec not used for security
+    start = datetime(2025, 1, 1)
+    for index in range(count):
+        created = start + timedelta(seconds=generator.randrange(31_536_000))
+        yield User(
+            str(uuid.UUID(int=generator.getrandbits(128))),
+            f"user{index}",
+            f"user{index}@example.com",
+            created.isoformat(),
+            str(uuid.UUID(int=generator.getrandbits(128))),
+            generator.random() < 0.9,
+            (created + timedelta(hours=1)).isoformat(),
+            None,
+            generator.random() < 0.05,
+            generator.random() < 0.01,
+        )
+
+
+def generate_user_roles(users, roles_per_user: int, seed: int = 0):
+    """Generate the roles of users with reproducible values.
+
+    Args:
+        users: The users the roles belong to.
+        roles_per_user: The number of roles of every user.
+        seed: The seed of the random generator.
+    Yields:
+        UserRole: The generated user roles.
+    """
+    generator = random.Random(seed)  # nosec not used for security
+    role_id = 0
+    for user in users:
+        for _ in range(roles_per_user):
+            role_id += 1
+            yield UserRole(
+                role_id, user.id, generator.choice(_ROLES), user.date_created
+            )
+
+
+def populate_source(source_url: str, users: int, roles_per_user: int) -> None:
+    """Create and fill the source tables.
+
+    Args:
+        source_url: The SQLAlchemy URL of the source database.
+        users: The number of users to generate.
+        roles_per_user: The number of roles of every user.
+    """
+    from core.load.iam_gateway import record_user_roles, record_users
+
+    with create_engine(source_url).connect() as connection:
+        _create_tables(connection)
+        record_users(connection, generate_users(users))
+        record_user_roles(
+            connection, generate_user_roles(generate_users(users), roles_per_user)
+        )
+
+
+def _destination_engine(destination_url: str):
+    """Create the engine of the backup database."""
+    if destination_url.startswith("sqlite+libsql"):
+        return create_engine(destination_url, connect_args={"auth_token": ""})
+    return create_engine(destination_url)
+
+
+def percentile(values: list[float], fraction: float) -> float:
+    """Return the nearest-rank percentile of a list of values, 0 when it is empty."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(1, math.ceil(fraction * len(ordered)))
+    return ordered[min(rank, len(ordered)) - 1]
+
+
+def _load_table(connection, records, to_row, insert, name: str, batch_size: int):
+    """Load records through the pipeline and return the load latency of every batch."""
+    from core.helpers.batching import chunked
+    from core.pipeline.runner import run_pipeline
+
+    latencies = []
+
+    def timed_insert(rows):
+        started = perf_counter()
+        inserted = insert(connection, rows)
+        latencies.append(perf_counter() - started)
+        return inserted
+
+    run_pipeline(
+        name,
+        chunked(records, batch_size),
+        lambda batch: [to_row(record) for record in batch],
+        timed_insert,
+    )
+    connection.commit()
+    return latencies
+
+
+def run_scenario(
+    mode: str, source_url: str, destination_url: str, batch_size: int, workdir: str
+) -> dict:
+    """Run one scenario, meant to be called in a fresh process.
+
+    Args:
+        mode: The encryption of the sensitive fields, 'plain', 'rsa' or 'envelope'.
+        source_url: The SQLAlchemy URL of the source database.
+        destination_url: The SQLAlchemy URL of the backup database.
+        batch_size: The number of rows per batch.
+        workdir: The directory holding the RSA keys of the benchmark.
+    Returns:
+        dict: The measures of the scenario.
+    """
+    os.chdir(workdir)
+    from core.extract.iam_gateway import iter_user_roles, iter_users
+    from core.load.iam_gateway import (
+        insert_user_role_rows,
+        insert_user_rows,
+        prepare_data_key,
+        user_role_to_row,
+        user_to_row,
+    )
+    from core.rsa_encrypt_decrypt.rsa_manager import encrypt
+
+    to_encrypt = mode != "plain"
+    if to_encrypt:
+        # the keys are generated or loaded before the clock starts
+        encrypt("warm-up", "rsa_keys")
+
+    destination_engine = _destination_engine(destination_url)
+    with destination_engine.connect() as destination:
+        _create_tables(destination)
+    with (
+        create_engine(source_url).connect() as source,
+        destination_engine.connect() as destination,
+    ):
+        data_key = prepare_data_key(destination, to_encrypt)
+        started = perf_counter()
+        user_latencies = _load_table(
+            destination,
+            iter_users(source),
+            lambda user: user_to_row(user, to_encrypt, data_key),
+            insert_user_rows,
+            TABLE_NAME_1,
+            batch_size,
+        )
+        users_seconds = perf_counter() - started
+        started = perf_counter()
+        role_latencies = _load_table(
+            destination,
+            iter_user_roles(source),
+            user_role_to_row,
+            insert_user_role_rows,
+            TABLE_NAME_2,
+            batch_size,
+        )
+        roles_seconds = perf_counter() - started
+        rows = {
+            table_name: (
+                destination.execute(text(f"SELECT COUNT(*) FROM {table_name}")).scalar()
+            )
+            for table_name in (TABLE_NAME_1, TABLE_NAME_2)
+        }
+
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    peak_rss_mb = peak_rss / (1024 * 1024 if sys.platform == "darwin" else 1024)
+    return {
+        "mode": mode,
+        "peak_rss_mb": round(peak_rss_mb, 1),
+        "tables": {
+            TABLE_NAME_1: _table_measures(
+                rows[TABLE_NAME_1], users_seconds, user_latencies
+            ),
+            TABLE_NAME_2: _table_measures(
+                rows[TABLE_NAME_2], roles_seconds, role_latencies
+            ),
+        },
+    }
+
+
+def _table_measures(rows: int, seconds: float, latencies: list[float]) -> dict:
+    """Return the throughput and batch latencies of a table load."""
+    return {
+        "rows": rows,
+        "seconds": round(seconds, 3),
+        "rows_per_second": round(rows / seconds, 1) if seconds else None,
+        "batches": len(latencies),
+        "batch_latency_ms": {
+            "p50": round(percentile(latencies, 0.5) * 1000, 3),
+            "p99": round(percentile(latencies, 0.99) * 1000, 3),
+        },
+    }
+
+
+def _git_commit() -> str | None:
+    """Return the current git commit of the repository, None outside of a git checkout."""
+    try:
+        return subprocess.run(  # nosec the command is fixed
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=BASE_DIR,
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _default_destination_url(workdir: str) -> str:
+    """Return the URL of a libsql file in the working directory, or of a SQLite file without libsql."""
+    try:
+        import sqlalchemy_libsql  # noqa: F401
+    except ImportError:
+        return f"sqlite:///{join(workdir, 'backup.db')}"
+    return f"sqlite+libsql:///{join(workdir, 'backup.db')}"
+
+
+def parse_arguments(arguments: list[str] | None = None) -> argparse.Namespace:
+    """Parse the command line of the benchmark."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--users", type=int, default=10_000)
+    parser.add_argument("--roles-per-user", type=int, default=1)
+    parser.add_argument("--batch-size", type=int, default=LOAD_BATCH_SIZE)
+    parser.add_argument(
+        "--modes",
+        default=",".join(MODES),
+        help="Comma separated encryption modes among plain, rsa and envelope.",
+    )
+    parser.add_argument("--source-url", help="Defaults to a SQLite file.")
+    parser.add_argument("--destination-url", help="Defaults to a libsql file.")
+    parser.add_argument(
+        "--workdir", help="Directory of the database files and RSA keys."
+    )
+    parser.add_argument(
+        "--output",
+        help="JSON results file, defaults to benchmarks/results/<date>-<commit>.json.",
+    )
+    return parser.parse_args(arguments)
+
+
+def main(arguments: list[str] | None = None) -> dict:
+    """Run the benchmark and save its results as JSON.
+
+    Args:
+        arguments: The command line arguments, those of the process by default.
+    Returns:
+        dict: The results of the benchmark.
+    """
+    options = parse_arguments(arguments)
+    modes = [mode for mode in options.modes.split(",") if mode]
+    for mode in modes:
+        if mode not in MODES:
+            raise ValueError(f"Unknown mode: {mode}")
+    workdir = options.workdir or tempfile.mkdtemp(prefix="etl-benchmark-")
+    os.makedirs(workdir, exist_ok=True)
+    source_url = options.source_url or f"sqlite:///{join(workdir, 'source.db')}"
+    destination_url = options.destination_url or _default_destination_url(workdir)
+
+    started = perf_counter()
+    populate_source(source_url, options.users, options.roles_per_user)
+    print(f"source populated in {perf_counter() - started:.1f}s")
+
+    scenarios = []
+    context = multiprocessing.get_context("spawn")
+    for mode in modes:
+        # the encryption mode is read from the environment when the configuration is imported
+        os.environ["ENCRYPTION_MODE"] = "envelope" if mode == "envelope" else "rsa"
+        with context.Pool(1) as pool:
+            scenario = pool.apply(
+                run_scenario,
+                (mode, source_url, destination_url, options.batch_size, workdir),
+            )
+        scenarios.append(scenario)
+        for table_name, measures in scenario["tables"].items():
+            print(
+                f"{mode:>8} {table_name:>16}: {measures['rows_per_second']} rows/s, "
+                f"p50 {measures['batch_latency_ms']['p50']} ms, "
+                f"p99 {measures['batch_latency_ms']['p99']} ms, "
+                f"peak RSS {scenario['peak_rss_mb']} MB"
+            )
+
+    commit = _git_commit()
+    date = datetime.now()
+    results = {
+        "commit": commit,
+        "date": date.isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "parameters": {
+            "users": options.users,
+            "roles_per_user": options.roles_per_user,
+            "batch_size": options.batch_size,
+            "source": source_url.split(":", 1)[0],
+            "destination": destination_url.split(":", 1)[0],
+        },
+        "scenarios": scenarios,
+    }
+    output = options.output or join(
+        BASE_DIR,
+        "benchmarks",
+        "results",
+        f"{date:%Y%m%d-%H%M%S}-{commit or 'unknown'}.json",
+    )
+    os.makedirs(os.path.dirname(output), exist_ok=True)
+    with open(output, "w", encoding="utf-8") as file:
+        json.dump(results, file, indent=2)
+    print(f"results saved in {output}")
+    return results
+
+
+if __name__ == "__main__":
+    main()
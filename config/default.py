@@ -23,6 +23,9 @@ APP_VERSION = env.get("APP_VERSION", "0.0.1")
 
 # Logs
 LOG_FORMAT = "%(asctime)s - %(name)s - %(levelname)s - %(message)s"
+LOG_MAX_BYTES = int(env.get("LOG_MAX_BYTES", str(10 * 1024 * 1024)))
+LOG_BACKUP_COUNT = int(env.get("LOG_BACKUP_COUNT", "5"))
+LOG_SAMPLE_EVERY = int(env.get("LOG_SAMPLE_EVERY", "1"))
 
 # database configuration
 TABLE_NAME_1 = env["TABLE_NAME_1"]
@@ -41,3 +44,96 @@ FIELD_NAME_11 = env["FIELD_NAME_11"]
 FIELD_NAME_12 = env["FIELD_NAME_12"]
 FIELD_NAME_13 = env["FIELD_NAME_13"]
 FIELD_NAME_14 = env["FIELD_NAME_14"]
+# TOML file declaring the copied tables, the tables above are copied when empty
+TABLE_MAPPINGS_FILE = env.get("TABLE_MAPPINGS_FILE", "")
+
+# ETL tuning
+EXTRACT_FETCH_SIZE = int(env.get("EXTRACT_FETCH_SIZE", "1000"))
+EXTRACT_PARTITIONS = int(env.get("EXTRACT_PARTITIONS", "1"))
+# Extraction through a server-side cursor ('cursor') or a COPY stream ('copy')
+EXTRACT_METHOD = env.get("EXTRACT_METHOD", "cursor")
+COPY_BUFFER_SIZE = int(env.get("COPY_BUFFER_SIZE", "65536"))
+PIPELINE_QUEUE_SIZE = int(env.get("PIPELINE_QUEUE_SIZE", "4"))
+PIPELINE_TRANSFORM_WORKERS = int(env.get("PIPELINE_TRANSFORM_WORKERS", "1"))
+LOAD_BATCH_SIZE = int(env.get("LOAD_BATCH_SIZE", "500"))
+# Adaptive batch sizing (AIMD), LOAD_BATCH_SIZE being the initial size
+# The statements are also capped to 32766 bound values (SQLite limit), 3276 rows of the users table
+LOAD_BATCH_ADAPTIVE = env.get("LOAD_BATCH_ADAPTIVE", "true").lower() == "true"
+LOAD_BATCH_MIN_SIZE = int(env.get("LOAD_BATCH_MIN_SIZE", "50"))
+LOAD_BATCH_MAX_SIZE = int(env.get("LOAD_BATCH_MAX_SIZE", "5000"))
+LOAD_BATCH_MAX_BYTES = int(env.get("LOAD_BATCH_MAX_BYTES", "4000000"))
+LOAD_BATCH_TARGET_SECONDS = float(env.get("LOAD_BATCH_TARGET_SECONDS", "1"))
+LOAD_BATCH_INCREASE = int(env.get("LOAD_BATCH_INCREASE", "100"))
+
+# Connections
+DB_POOL_SIZE = int(env.get("DB_POOL_SIZE", "5"))
+DB_MAX_OVERFLOW = int(env.get("DB_MAX_OVERFLOW", "5"))
+DB_POOL_TIMEOUT = float(env.get("DB_POOL_TIMEOUT", "30"))
+DB_POOL_RECYCLE = int(env.get("DB_POOL_RECYCLE", "1800"))
+# Timeout of the PostgreSQL connections and of the Turso checkouts, in seconds
+DB_CONNECT_TIMEOUT = int(env.get("DB_CONNECT_TIMEOUT", "10"))
+DB_STATEMENT_TIMEOUT = int(env.get("DB_STATEMENT_TIMEOUT", "0"))
+RETRY_ATTEMPTS = int(env.get("RETRY_ATTEMPTS", "5"))
+RETRY_BASE_DELAY = float(env.get("RETRY_BASE_DELAY", "0.5"))
+RETRY_MAX_DELAY = float(env.get("RETRY_MAX_DELAY", "30"))
+
+# Local write path ('remote' writes to Turso, 'local' loads a local file pushed to Turso in bulk)
+TURSO_WRITE_MODE = env.get("TURSO_WRITE_MODE", "remote")
+LOCAL_SNAPSHOT_FILE = env.get(
+    "LOCAL_SNAPSHOT_FILE", join(BASE_DIR, "logs", "turso_snapshot.db")
+)
+LOCAL_JOURNAL_MODE = env.get("LOCAL_JOURNAL_MODE", "WAL")
+LOCAL_SYNCHRONOUS = env.get("LOCAL_SYNCHRONOUS", "OFF")
+LOCAL_CACHE_SIZE = int(env.get("LOCAL_CACHE_SIZE", "-65536"))
+PUSH_BATCH_SIZE = int(env.get("PUSH_BATCH_SIZE", "1000"))
+
+# Metrics
+METRICS_DIR = env.get("METRICS_DIR", join(BASE_DIR, "logs"))
+RUN_BUDGET_SECONDS = float(env.get("RUN_BUDGET_SECONDS", "120"))
+
+# Daemon
+DAEMON_INTERVAL = float(env.get("DAEMON_INTERVAL", "120"))
+DAEMON_CRON = env.get("DAEMON_CRON", "")
+DAEMON_LOCK_FILE = env.get("DAEMON_LOCK_FILE", join(BASE_DIR, "logs", "etl.lock"))
+
+# Synchronization
+SYNC_MODE = env.get("SYNC_MODE", "full")
+LOAD_MODE = env.get("LOAD_MODE", "swap")
+CHANGE_DETECTION = env.get("CHANGE_DETECTION", "stats")
+SYNC_STATE_TABLE = env.get("SYNC_STATE_TABLE", "etl_sync_state")
+# Detection of the rows deleted from the source by the incremental mode ('keys', 'count' or 'none').
+# 'count' only compares the keys when the row counts differ: a row committed late with an older watermark
+# is missed by the upserts and hides a deletion of the same window.
+INCREMENTAL_DELETE_DETECTION = env.get("INCREMENTAL_DELETE_DETECTION", "keys")
+SYNC_WATERMARK_FIELDS_1 = env.get(
+    "SYNC_WATERMARK_FIELDS_1", f"{FIELD_NAME_4},{FIELD_NAME_7},{FIELD_NAME_8}"
+).split(",")
+LOAD_CHECKPOINTS = env.get("LOAD_CHECKPOINTS", "true").lower() == "true"
+CHECKPOINTS_TABLE = env.get("CHECKPOINTS_TABLE", "etl_load_checkpoints")
+ROW_HASHES_TABLE = env.get("ROW_HASHES_TABLE", "etl_row_hashes")
+MERKLE_FANOUT = int(env.get("MERKLE_FANOUT", "16"))
+MERKLE_LEAF_SIZE = int(env.get("MERKLE_LEAF_SIZE", "1000"))
+SYNC_WATERMARK_FIELDS_2 = env.get("SYNC_WATERMARK_FIELDS_2", FIELD_NAME_14).split(",")
+
+# Change data capture
+CDC_CHANGELOG_TABLE = env.get("CDC_CHANGELOG_TABLE", "etl_changelog")
+CDC_CHANNEL = env.get("CDC_CHANNEL", "etl_changes")
+CDC_BATCH_SIZE = int(env.get("CDC_BATCH_SIZE", "500"))
+CDC_POLL_INTERVAL = float(env.get("CDC_POLL_INTERVAL", "5"))
+CDC_LISTEN = env.get("CDC_LISTEN", "true").lower() == "true"
+
+# Bulk load tuning of the backup database
+BULK_LOAD_PRAGMAS = env.get(
+    "BULK_LOAD_PRAGMAS", "synchronous=OFF,temp_store=MEMORY,cache_size=-65536"
+)
+LOAD_DEFER_INDEXES = env.get("LOAD_DEFER_INDEXES", "true").lower() == "true"
+LOAD_ANALYZE = env.get("LOAD_ANALYZE", "true").lower() == "true"
+
+# Rows rejected by the backup database
+DEAD_LETTERS_TABLE = env.get("DEAD_LETTERS_TABLE", "etl_dead_letters")
+
+# Encryption of the backup database ('rsa' or 'envelope')
+ENCRYPTION_MODE = env.get("ENCRYPTION_MODE", "rsa")
+DATA_KEYS_TABLE = env.get("DATA_KEYS_TABLE", "etl_data_keys")
+# Storage of the encrypted values ('blob' or 'base64')
+CIPHERTEXT_CODEC = env.get("CIPHERTEXT_CODEC", "blob")
@@ -1,63 +1,204 @@
 """This file is part of the ETL project for PostgreSQL to Turso migration.
 
 It handles the database connection managers of the source and destination databases.
+Connections are checked out of a pool, one per thread, and opening them is retried on transient errors.
 """
 
 import logging
-
-from sqlalchemy import create_engine
+import threading
+from concurrent.futures import Future
+
+from sqlalchemy import create_engine, event
+
+from config.default import (
+    DB_CONNECT_TIMEOUT,
+    DB_MAX_OVERFLOW,
+    DB_POOL_RECYCLE,
+    DB_POOL_SIZE,
+    DB_POOL_TIMEOUT,
+    DB_STATEMENT_TIMEOUT,
+    LOCAL_CACHE_SIZE,
+    LOCAL_JOURNAL_MODE,
+    LOCAL_SYNCHRONOUS,
+)
+from core.helpers.retry import retry
 
 logger = logging.getLogger("__main__")
 
 
-class TursoDBConnectionManager:
-    """TursoDBConnectionManager class to manage connections to a Turso database."""
+def _pool_options() -> dict:
+    """Return the pool settings shared by the engines of both databases."""
+    return {
+        "pool_size": DB_POOL_SIZE,
+        "max_overflow": DB_MAX_OVERFLOW,
+        "pool_timeout": DB_POOL_TIMEOUT,
+        "pool_recycle": DB_POOL_RECYCLE,
+        "pool_pre_ping": True,
+    }
 
-    def __init__(self, sql_connection_string: str, auth_token: str):
-        """Initialize the TursoDBConnectionManager with a connection string and authentication token."""
-        self.engine = create_engine(
-            sql_connection_string,
-            connect_args={
-                "auth_token": auth_token,
-            },
-        )
-        logger.debug("Turso db engine initialized")
+
+class BaseDBConnectionManager:
+    """BaseDBConnectionManager class to manage the pooled connections of a database, one per thread."""
+
+    def __init__(self, engine, connect_timeout: float | None = None):
+        """Initialize the manager with the engine whose pool the connections are checked out of.
+
+        The `connect_timeout` bounds the checkouts of the engines whose driver has no connect timeout.
+        """
+        self.engine = engine
+        self.connect_timeout = connect_timeout
+        self._local = threading.local()
+        self._connections = []
+        self._lock = threading.Lock()
+
+    @property
+    def connection(self):
+        """Return the connection of the calling thread, None if it has not connected."""
+        return getattr(self._local, "connection", None)
 
     def get_current_connection(self):
-        """Get the current database connection."""
-        if not hasattr(self, "connection"):
-            self.connection = self.connect()
+        """Get the connection of the calling thread, establishing it if necessary."""
+        if self.connection is None or self.connection.closed:
+            return self.connect()
+        if self.connection.invalidated:
+            # the connection was lost, the pre-ping of the next checkout replaces it
+            self.connection.close()
+            return self.connect()
         return self.connection
 
+    def checkout(self):
+        """Check out a connection of the pool, retrying on transient errors, without binding it to the thread.
+
+        The caller closes it, usually with a `with` block, to return it to the pool.
+        """
+        if not self.connect_timeout:
+            return retry(self.engine.connect)
+        return retry(lambda: _connect_within(self.engine, self.connect_timeout))
+
+    def warm_up(self):
+        """Open a connection and return it to the pool, so the next checkout does not wait for the server."""
+        self.checkout().close()
+        logger.debug("%s connected", type(self).__name__)
+
     def connect(self):
-        """Establish a connection to the Turso database and return the connection object."""
-        self.connection = self.engine.connect()
-        return self.connection
+        """Check out a connection for the calling thread, retrying on transient errors, and return it."""
+        connection = self.checkout()
+        self._local.connection = connection
+        with self._lock:
+            self._connections = [
+                known for known in self._connections if not known.closed
+            ]
+            self._connections.append(connection)
+        return connection
 
     def disconnect(self):
-        """Close the current database connection."""
-        self.connection.close()
+        """Close the connection of the calling thread, returning it to the pool."""
+        if self.connection is not None:
+            self.connection.close()
+            self._local.connection = None
+
+    def dispose(self):
+        """Close the connections of every thread and the connections of the pool."""
+        with self._lock:
+            for connection in self._connections:
+                connection.close()
+            self._connections = []
+        self._local = threading.local()
+        self.engine.dispose()
+
+
+class TursoDBConnectionManager(BaseDBConnectionManager):
+    """TursoDBConnectionManager class to manage connections to a Turso database."""
+
+    def __init__(self, sql_connection_string: str, auth_token: str):
+        """Initialize the TursoDBConnectionManager with a connection string and authentication token."""
+        super().__init__(
+            create_engine(
+                sql_connection_string,
+                connect_args={
+                    "auth_token": auth_token,
+                    # pooled connections are handed to one thread at a time, but not always the same one
+                    "check_same_thread": False,
+                },
+                **_pool_options(),
+            ),
+            # the libsql driver has no connect timeout
+            connect_timeout=DB_CONNECT_TIMEOUT,
+        )
+        logger.debug("Turso db engine initialized")
 
 
-class PgSQLDBConnectionManager:
+class PgSQLDBConnectionManager(BaseDBConnectionManager):
     """PgSQLDBConnectionManager class to manage connections to a PostgreSQL database."""
 
     def __init__(self, sql_connection_string: str):
         """Initialize the PgSQLDBConnectionManager with a connection string."""
-        self.engine = create_engine(sql_connection_string)
+        connect_args = {"connect_timeout": DB_CONNECT_TIMEOUT}
+        if DB_STATEMENT_TIMEOUT:
+            connect_args["options"] = f"-c statement_timeout={DB_STATEMENT_TIMEOUT}"
+        super().__init__(
+            create_engine(
+                sql_connection_string, connect_args=connect_args, **_pool_options()
+            )
+        )
         logger.debug("PgSQL db engine initialized")
 
-    def get_current_connection(self):
-        """Get the current database connection, establishing it if necessary."""
-        if not hasattr(self, "connection"):
-            self.connection = self.connect()
-        return self.connection
 
-    def connect(self):
-        """Connect to the PostgreSQL database and return the connection object."""
-        self.connection = self.engine.connect()
-        return self.connection
+class LocalFileDBConnectionManager(BaseDBConnectionManager):
+    """LocalFileDBConnectionManager class to manage connections to a local SQLite file loaded in bulk.
 
-    def disconnect(self):
-        """Close the current database connection."""
-        self.connection.close()
+    The file is loaded without network round trips, then pushed to the Turso database in one step,
+    and kept as a snapshot of the last load.
+    """
+
+    def __init__(self, path: str):
+        """Initialize the LocalFileDBConnectionManager with the path of the file, created if missing."""
+        super().__init__(
+            create_engine(
+                f"sqlite:///{path}",
+                connect_args={"check_same_thread": False},
+                **_pool_options(),
+            )
+        )
+        self.path = path
+        event.listen(self.engine, "connect", _set_bulk_load_pragmas)
+        logger.debug("Local db engine initialized on %s", path)
+
+
+def _connect_within(engine, timeout: float):
+    """Check out a connection of an engine from another thread, giving up after `timeout` seconds.
+
+    Raises:
+        TimeoutError: If no connection was checked out in time, a transient error which is retried.
+    """
+    future = Future()
+
+    def connect():
+        try:
+            future.set_result(engine.connect())
+        except Exception as e:
+            future.set_exception(e)
+
+    threading.Thread(target=connect, name="connect", daemon=True).start()
+    try:
+        return future.result(timeout)
+    except TimeoutError:
+        # a connection checked out after the timeout is returned to the pool
+        future.add_done_callback(_close_late_connection)
+        raise TimeoutError(f"No connection within {timeout}s") from None
+
+
+def _close_late_connection(future: Future) -> None:
+    """Close the connection of a checkout that timed out, if it succeeded."""
+    if future.exception() is None:
+        future.result().close()
+
+
+def _set_bulk_load_pragmas(dbapi_connection, connection_record) -> None:
+    """Tune a new SQLite connection for bulk loads, trading durability for speed."""
+    cursor = dbapi_connection.cursor()
+    cursor.execute(f"PRAGMA journal_mode = {LOCAL_JOURNAL_MODE}")
+    cursor.execute(f"PRAGMA synchronous = {LOCAL_SYNCHRONOUS}")
+    cursor.execute(f"PRAGMA cache_size = {LOCAL_CACHE_SIZE}")
+    cursor.execute("PRAGMA temp_store = MEMORY")
+    cursor.close()
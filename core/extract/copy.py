@@ -0,0 +1,273 @@
+"""This module provides an extractor streaming source tables with PostgreSQL `COPY ... TO STDOUT`.
+
+COPY sends the rows as a single text stream instead of result sets fetched through a cursor, which is
+much cheaper for the server and for the client on large tables. The stream is written by psycopg2's
+`copy_expert` in a background thread, and parsed line by line as it arrives into plain tuples,
+the values being converted back to the Python types psycopg2 would have returned.
+The arrays, intervals and ranges are not parsed, the mappings copying them must use the cursor extraction.
+The errors of the driver are raised wrapped in SQLAlchemy's DBAPIError, like the errors of the cursor extraction.
+"""
+
+import codecs
+import json
+import logging
+import queue
+import re
+import threading
+import uuid
+from contextlib import contextmanager
+from datetime import date, datetime, time
+from decimal import Decimal
+from typing import Callable, Iterator
+
+from sqlalchemy import text
+from sqlalchemy.exc import DBAPIError
+
+from config.default import COPY_BUFFER_SIZE
+from core.extract.queries import query_parameters
+from core.mapping.engine import build_extract_query
+from core.mapping.tables import TableMapping
+
+logger = logging.getLogger("__main__")
+
+_END = object()
+_POLL_INTERVAL = 0.1
+_NULL = "\\N"
+_ESCAPE = re.compile(r"\\(?:([0-7]{1,3})|x([0-9a-fA-F]{1,2})|(.))")
+_ESCAPED_CHARACTERS = {
+    "b": "\b",
+    "f": "\f",
+    "n": "\n",
+    "r": "\r",
+    "t": "\t",
+    "v": "\v",
+}
+
+
+def _unescape_character(match: re.Match) -> str:
+    """Return the character of an escape sequence of the COPY text format."""
+    octal, hexadecimal, character = match.groups()
+    if octal is not None:
+        return chr(int(octal, 8))
+    if hexadecimal is not None:
+        return chr(int(hexadecimal, 16))
+    return _ESCAPED_CHARACTERS.get(character, character)
+
+
+def unescape(value: str) -> str:
+    """Decode the backslash escape sequences of a value of the COPY text format."""
+    if "\\" not in value:
+        return value
+    return _ESCAPE.sub(_unescape_character, value)
+
+
+def _to_bool(value: str) -> bool:
+    """Parse a boolean of the COPY text format."""
+    return value == "t"
+
+
+def _to_bytes(value: str) -> bytes:
+    """Parse a bytea of the COPY text format, in the hex or the escape output format."""
+    if value.startswith("\\x"):
+        return bytes.fromhex(value[2:])
+    return codecs.escape_decode(value.encode("latin-1"))[0]
+
+
+# Parsers of the text representation of the types, by type OID, the other types being kept as strings
+_PARSERS: dict[int, Callable[[str], object]] = {
+    16: _to_bool,
+    20: int,
+    21: int,
+    23: int,
+    26: int,
+    700: float,
+    701: float,
+    1700: Decimal,
+    17: _to_bytes,
+    114: json.loads,
+    3802: json.loads,
+    1082: date.fromisoformat,
+    1083: time.fromisoformat,
+    1114: datetime.fromisoformat,
+    1184: datetime.fromisoformat,
+    2950: uuid.UUID,
+}
+# Categories of the types whose text representation is not parsed: arrays, ranges and intervals
+_UNSUPPORTED_CATEGORIES = {"A": "array", "R": "range", "T": "interval"}
+
+
+def _identity(value: str) -> str:
+    """Return a value unchanged."""
+    return value
+
+
+@contextmanager
+def _wrap_driver_errors(connection, statement: str):
+    """Raise the errors of the driver wrapped in SQLAlchemy's DBAPIError, so they are classified like the others."""
+    dbapi_error = connection.dialect.loaded_dbapi.Error
+    try:
+        yield
+    except dbapi_error as error:
+        raise DBAPIError.instance(
+            statement, None, error, dbapi_error, dialect=connection.dialect
+        ) from error
+
+
+def get_column_parsers(cursor, select: str) -> tuple[Callable, ...]:
+    """Return the parser of every column of a SELECT statement, from the types reported by the server.
+
+    Args:
+        cursor: A psycopg2 cursor.
+        select: The SELECT statement.
+    Returns:
+        tuple[Callable, ...]: The function converting the text of every column to a Python value.
+    Raises:
+        ValueError: If a column is an array, a range or an interval, whose text is not parsed.
+    """
+    cursor.execute(f"SELECT * FROM ({select}) AS copied LIMIT 0")
+    columns = cursor.description
+    unknown_types = sorted(
+        {column.type_code for column in columns if column.type_code not in _PARSERS}
+    )
+    if unknown_types:
+        cursor.execute(
+            "SELECT oid, typcategory FROM pg_type WHERE oid = ANY(%s)", (unknown_types,)
+        )
+        for type_code, category in cursor.fetchall():
+            if category in _UNSUPPORTED_CATEGORIES:
+                names = [
+                    column.name for column in columns if column.type_code == type_code
+                ]
+                raise ValueError(
+                    f"The {_UNSUPPORTED_CATEGORIES[category]} columns {', '.join(names)} cannot be extracted with COPY, use EXTRACT_METHOD=cursor."
+                )
+    return tuple(_PARSERS.get(column.type_code, _identity) for column in columns)
+
+
+def parse_line(line: str, parsers: tuple[Callable, ...]) -> tuple:
+    """Parse a line of the COPY text format into a row.
+
+    Args:
+        line: The line, without its newline.
+        parsers: The parser of every column.
+    Returns:
+        tuple: The values of the row, None for the NULL values.
+    """
+    return tuple(
+        None if value == _NULL else parse(unescape(value))
+        for parse, value in zip(parsers, line.split("\t"))
+    )
+
+
+class _QueueWriter:
+    """File-like object handing the chunks written by `copy_expert` to a bounded queue."""
+
+    def __init__(self, chunks: queue.Queue, stop: threading.Event):
+        """Initialize the writer with its queue and the event aborting the copy."""
+        self.chunks = chunks
+        self.stop = stop
+
+    def write(self, data) -> int:
+        """Queue a chunk, waiting for room, and abort the copy once the reader has stopped."""
+        while True:
+            if self.stop.is_set():
+                raise InterruptedError("The COPY stream reader has stopped.")
+            try:
+                self.chunks.put(data, timeout=_POLL_INTERVAL)
+                return len(data)
+            except queue.Full:
+                continue
+
+
+def _build_select(
+    connection, mapping: TableMapping, since, key_range, after, ordered: bool
+) -> str:
+    """Render the SELECT statement of a COPY, with its parameters inlined by the driver."""
+    lower, upper = key_range if key_range is not None else (None, None)
+    select = build_extract_query(
+        mapping, since is not None, lower is not None, upper is not None
+    ).text
+    parameters = query_parameters(since, key_range)
+    if after is not None:
+        select += (" AND " if " WHERE " in select else " WHERE ") + (
+            f"{mapping.key} > :after"
+        )
+        parameters["after"] = after
+    if ordered:
+        select += f" ORDER BY {mapping.key}"
+    compiled = text(select).compile(dialect=connection.dialect)
+    with _wrap_driver_errors(connection, select):
+        with connection.connection.cursor() as cursor:
+            return cursor.mogrify(str(compiled), parameters).decode()
+
+
+def iter_rows_copy(
+    connection,
+    mapping: TableMapping,
+    since=None,
+    key_range=None,
+    after=None,
+    ordered: bool = False,
+    buffer_size: int = COPY_BUFFER_SIZE,
+) -> Iterator[tuple]:
+    """Stream the mapped columns of the rows of a source table with `COPY ... TO STDOUT`.
+
+    Args:
+        connection: The source database connection object, on the psycopg2 driver.
+        mapping: The mapping of the table.
+        since: Only stream the rows whose watermark fields are greater or equal to this high-water mark.
+        key_range: Only stream the rows whose key is within this (lower included, upper excluded) range.
+        after: Only stream the rows whose key is greater than this key.
+        ordered: Whether the rows are streamed in key order.
+        buffer_size: The size of the chunks read from the server, in bytes.
+    Yields:
+        tuple: The source values of every row, ordered like the columns of the mapping.
+    """
+    select = _build_select(connection, mapping, since, key_range, after, ordered)
+    raw_connection = connection.connection
+    with _wrap_driver_errors(connection, select):
+        with raw_connection.cursor() as cursor:
+            parsers = get_column_parsers(cursor, select)
+    statement = f"COPY ({select}) TO STDOUT WITH (FORMAT text, ENCODING 'UTF8')"
+
+    chunks = queue.Queue(maxsize=8)
+    stop = threading.Event()
+    errors = []
+
+    def copy() -> None:
+        try:
+            with _wrap_driver_errors(connection, statement):
+                with raw_connection.cursor() as cursor:
+                    cursor.copy_expert(
+                        statement, _QueueWriter(chunks, stop), buffer_size
+                    )
+        except BaseException as error:
+            errors.append(error)
+        finally:
+            while not stop.is_set():
+                try:
+                    chunks.put(_END, timeout=_POLL_INTERVAL)
+                    break
+                except queue.Full:
+                    continue
+
+    writer = threading.Thread(target=copy, name=f"{mapping.source_table}-copy")
+    writer.start()
+    rows = 0
+    try:
+        remainder = b""
+        while (chunk := chunks.get()) is not _END:
+            lines = (remainder + bytes(chunk)).split(b"\n")
+            remainder = lines.pop()
+            for line in lines:
+                yield parse_line(line.decode("utf-8"), parsers)
+            rows += len(lines)
+    finally:
+        stop.set()
+        writer.join()
+        if errors and isinstance(errors[0], InterruptedError):
+            # the aborted COPY leaves the transaction failed
+            raw_connection.rollback()
+    if errors and not isinstance(errors[0], InterruptedError):
+        raise errors[0]
+    logger.info("%d rows of %s have been copied", rows, mapping.source_table)
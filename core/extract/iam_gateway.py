@@ -1,10 +1,12 @@
 """This module provides functions to extract user and user role data from a source database."""
 
 import logging
+from typing import Iterator
 
 from sqlalchemy import text
 
 from config.default import (
+    EXTRACT_FETCH_SIZE,
     FIELD_NAME_2,
     FIELD_NAME_3,
     FIELD_NAME_4,
@@ -17,14 +19,71 @@ from config.default import (
     FIELD_NAME_12,
     FIELD_NAME_13,
     FIELD_NAME_14,
+    SYNC_WATERMARK_FIELDS_1,
+    SYNC_WATERMARK_FIELDS_2,
     TABLE_NAME_1,
     TABLE_NAME_2,
 )
+from core.extract.queries import query_parameters, where_clause
 from core.models.iam_gateway import User, UserRole
 
 logger = logging.getLogger("__main__")
 
 
+def iter_users(
+    connection, fetch_size: int = EXTRACT_FETCH_SIZE, since=None, key_range=None
+) -> Iterator[User]:
+    """Stream all users from the database.
+
+    The rows are read through a server-side cursor, `fetch_size` rows at a time, and yielded lazily
+    as User objects, so the memory used does not grow with the size of the table.
+    Args:
+        connection: The database connection object.
+        fetch_size: The number of rows fetched from the server per round trip.
+        since: Only stream the users whose watermark fields are greater or equal to this high-water mark.
+        key_range: Only stream the users whose id is within this (lower included, upper excluded) range.
+    Yields:
+        User: The users of the database.
+    """
+    result = connection.execute(
+        text(
+            f"SELECT id, {FIELD_NAME_2}, {FIELD_NAME_3}, {FIELD_NAME_4}, {FIELD_NAME_5}, {FIELD_NAME_6}, {FIELD_NAME_7}, {FIELD_NAME_8}, {FIELD_NAME_9}, {FIELD_NAME_10} FROM {TABLE_NAME_1}"  # nosec ignore SQL injection risk, as the input data is sanitized
+            + where_clause(SYNC_WATERMARK_FIELDS_1, since, key_range)
+        ).execution_options(stream_results=True, yield_per=fetch_size),
+        query_parameters(since, key_range),
+    )
+    for user in result:
+        yield User.from_row(user)
+    logger.info("Users have been retrieved from %s", TABLE_NAME_1)
+
+
+def iter_user_roles(
+    connection, fetch_size: int = EXTRACT_FETCH_SIZE, since=None, key_range=None
+) -> Iterator[UserRole]:
+    """Stream all user roles from the database.
+
+    The rows are read through a server-side cursor, `fetch_size` rows at a time, and yielded lazily
+    as UserRole objects.
+    Args:
+        connection: The database connection object.
+        fetch_size: The number of rows fetched from the server per round trip.
+        since: Only stream the user roles whose watermark fields are greater or equal to this high-water mark.
+        key_range: Only stream the user roles whose id is within this (lower included, upper excluded) range.
+    Yields:
+        UserRole: The user roles of the database.
+    """
+    result = connection.execute(
+        text(
+            f"SELECT id, {FIELD_NAME_12}, {FIELD_NAME_13}, {FIELD_NAME_14} FROM {TABLE_NAME_2}"  # nosec ignore SQL injection risk, as the input data is sanitized
+            + where_clause(SYNC_WATERMARK_FIELDS_2, since, key_range)
+        ).execution_options(stream_results=True, yield_per=fetch_size),
+        query_parameters(since, key_range),
+    )
+    for role in result:
+        yield UserRole.from_row(role)
+    logger.info("User roles have been retrieved from %s", TABLE_NAME_2)
+
+
 def get_all_users(connection) -> list[User]:
     """Fetch all users from the database.
 
@@ -34,29 +93,7 @@ def get_all_users(connection) -> list[User]:
     Returns:
         list[User]: A list of User objects representing all users in the database.
     """
-    result = connection.execute(
-        text(
-            f"SELECT id, {FIELD_NAME_2}, {FIELD_NAME_3}, {FIELD_NAME_4}, {FIELD_NAME_5}, {FIELD_NAME_6}, {FIELD_NAME_7}, {FIELD_NAME_8}, {FIELD_NAME_9}, {FIELD_NAME_10} FROM {TABLE_NAME_1}"  # nosec ignore SQL injection risk, as the input data is sanitized
-        )
-    ).fetchall()
-    logger.info("All users have been retrieved from %s", TABLE_NAME_1)
-    return [
-        User(
-            **{
-                "id": user.id,
-                "username": user.__getattribute__(FIELD_NAME_2),
-                "email": user.__getattribute__(FIELD_NAME_3),
-                "date_created": user.__getattribute__(FIELD_NAME_4),
-                "token_activation": user.__getattribute__(FIELD_NAME_5),
-                "active": user.__getattribute__(FIELD_NAME_6),
-                "date_activated": user.__getattribute__(FIELD_NAME_7),
-                "date_deactivated": user.__getattribute__(FIELD_NAME_8),
-                "deleted": user.__getattribute__(FIELD_NAME_9),
-                "admin": user.__getattribute__(FIELD_NAME_10),
-            }
-        )
-        for user in result
-    ]
+    return list(iter_users(connection))
 
 
 def get_all_user_roles(connection) -> list[UserRole]:
@@ -68,20 +105,4 @@ def get_all_user_roles(connection) -> list[UserRole]:
     Returns:
         list[UserRole]: A list of UserRole objects representing all user roles in the database.
     """
-    result = connection.execute(
-        text(
-            f"SELECT id, {FIELD_NAME_12}, {FIELD_NAME_13}, {FIELD_NAME_14} FROM {TABLE_NAME_2}"  # nosec ignore SQL injection risk, as the input data is sanitized
-        )
-    ).fetchall()
-    logger.info("All user roles have been retrieved from %s", TABLE_NAME_2)
-    return [
-        UserRole(
-            **{
-                "id": role.id,
-                "user_id": role.__getattribute__(FIELD_NAME_12),
-                "role_id": role.__getattribute__(FIELD_NAME_13),
-                "date_created": role.__getattribute__(FIELD_NAME_14),
-            }
-        )
-        for role in result
-    ]
+    return list(iter_user_roles(connection))
@@ -0,0 +1,242 @@
+"""This module provides a partitioned extractor reading large source tables over several connections.
+
+The key space of a table is split into ranges read concurrently by worker threads. Every worker imports
+the snapshot exported by a coordinator transaction, so the combined result is still a point-in-time copy.
+"""
+
+import logging
+import queue
+import threading
+from typing import Callable, Iterator
+
+from sqlalchemy import text
+
+from config.default import (
+    EXTRACT_FETCH_SIZE,
+    EXTRACT_PARTITIONS,
+    TABLE_NAME_1,
+    TABLE_NAME_2,
+)
+from core.extract.iam_gateway import iter_user_roles, iter_users
+from core.helpers.batching import chunked
+from core.models.iam_gateway import User, UserRole
+
+logger = logging.getLogger("__main__")
+
+_END = object()
+_POLL_INTERVAL = 0.1
+
+
+def export_snapshot(connection) -> str:
+    """Start a REPEATABLE READ transaction and export its snapshot.
+
+    The connection must stay in its transaction while the snapshot is imported by other connections.
+    Args:
+        connection: A connection without an open transaction.
+    Returns:
+        str: The id of the exported snapshot.
+    """
+    connection.execute(text("SET TRANSACTION ISOLATION LEVEL REPEATABLE READ"))
+    return connection.execute(text("SELECT pg_export_snapshot()")).scalar()
+
+
+def import_snapshot(connection, snapshot_id: str) -> None:
+    """Start a REPEATABLE READ transaction reading the data of an exported snapshot.
+
+    Args:
+        connection: A connection without an open transaction.
+        snapshot_id: The id returned by `export_snapshot`.
+    """
+    connection.execute(text("SET TRANSACTION ISOLATION LEVEL REPEATABLE READ"))
+    connection.execute(
+        text("SET TRANSACTION SNAPSHOT :snapshot_id"), {"snapshot_id": snapshot_id}
+    )
+
+
+def key_range_clause(key_range: tuple, key_column: str = "id") -> str:
+    """Build the SQL condition selecting the keys within a range, bound to the `:lower` and `:upper` parameters.
+
+    Args:
+        key_range: The (lower included, upper excluded) key range, None meaning unbounded.
+        key_column: The key column of the table.
+    Returns:
+        str: The SQL condition, always true for an unbounded range.
+    """
+    lower, upper = key_range
+    conditions = []
+    if lower is not None:
+        conditions.append(f"{key_column} >= :lower")
+    if upper is not None:
+        conditions.append(f"{key_column} < :upper")
+    return " AND ".join(conditions) if conditions else "1 = 1"
+
+
+def get_key_ranges(
+    connection,
+    table_name: str,
+    partitions: int,
+    key_column: str = "id",
+    key_range: tuple = (None, None),
+) -> list[tuple]:
+    """Split the keys of a table into ranges holding about the same number of rows.
+
+    The boundaries are quantiles of the key computed by the server, so they work for any sortable key type.
+    Args:
+        connection: The database connection object.
+        table_name: The table to split.
+        partitions: The number of ranges wanted.
+        key_column: The primary key column of the table.
+        key_range: The range of keys to split, the whole table by default.
+    Returns:
+        list[tuple]: The (lower included, upper excluded) key ranges, None meaning unbounded.
+    """
+    if partitions < 2:
+        return [key_range]
+    lower, upper = key_range
+    fractions = ", ".join(str(index / partitions) for index in range(1, partitions))
+    boundaries = connection.execute(
+        text(
+            f"SELECT percentile_disc(ARRAY[{fractions}]) WITHIN GROUP (ORDER BY {key_column}) FROM {table_name} WHERE {key_range_clause(key_range, key_column)}"  # nosec ignore SQL injection risk, as the input data is sanitized
+        ),
+        {"lower": lower, "upper": upper},
+    ).scalar()
+    boundaries = sorted(
+        {
+            boundary
+            for boundary in boundaries or []
+            if boundary is not None and boundary != lower
+        }
+    )
+    bounds = [lower, *boundaries, upper]
+    return list(zip(bounds[:-1], bounds[1:]))
+
+
+def iter_partitioned(
+    pgsql_db_manager,
+    table_name: str,
+    extract: Callable[[object, tuple], Iterator],
+    partitions: int = EXTRACT_PARTITIONS,
+    fetch_size: int = EXTRACT_FETCH_SIZE,
+    key_column: str = "id",
+) -> Iterator:
+    """Stream the records of a table read concurrently by key ranges.
+
+    One worker thread per range reads its records on its own connection, all of them sharing
+    the snapshot exported by a coordinator connection. Records are yielded as they arrive, in no particular order.
+    Args:
+        pgsql_db_manager: The PgSQLDBConnectionManager of the source database.
+        table_name: The table to read.
+        extract: The function streaming the records of a key range from a connection.
+        partitions: The number of key ranges read concurrently.
+        fetch_size: The number of records passed at once from a worker to the consumer.
+        key_column: The column whose values are split into ranges.
+    Yields:
+        The records of the table.
+    """
+    records = queue.Queue(maxsize=partitions * 2)
+    stop = threading.Event()
+    errors = []
+
+    def put(item) -> bool:
+        while not stop.is_set():
+            try:
+                records.put(item, timeout=_POLL_INTERVAL)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def read_range(snapshot_id: str, key_range: tuple) -> None:
+        try:
+            with pgsql_db_manager.checkout() as connection:
+                import_snapshot(connection, snapshot_id)
+                for batch in chunked(extract(connection, key_range), fetch_size):
+                    if not put(batch):
+                        return
+        except BaseException as error:
+            errors.append(error)
+            stop.set()
+        finally:
+            put(_END)
+
+    with pgsql_db_manager.checkout() as coordinator:
+        snapshot_id = export_snapshot(coordinator)
+        key_ranges = get_key_ranges(
+            coordinator, table_name, partitions, key_column=key_column
+        )
+        logger.info(
+            "Reading %s in %d key ranges from snapshot %s",
+            table_name,
+            len(key_ranges),
+            snapshot_id,
+        )
+        workers = [
+            threading.Thread(
+                target=read_range,
+                args=(snapshot_id, key_range),
+                name=f"{table_name}-partition-{index}",
+            )
+            for index, key_range in enumerate(key_ranges)
+        ]
+        for worker in workers:
+            worker.start()
+
+        try:
+            running = len(workers)
+            while running:
+                try:
+                    batch = records.get(timeout=_POLL_INTERVAL)
+                except queue.Empty:
+                    if stop.is_set():
+                        break
+                    continue
+                if batch is _END:
+                    running -= 1
+                    continue
+                yield from batch
+        finally:
+            stop.set()
+            for worker in workers:
+                worker.join()
+            coordinator.rollback()
+
+    if errors:
+        raise errors[0]
+
+
+def iter_users_partitioned(
+    pgsql_db_manager, partitions: int = EXTRACT_PARTITIONS
+) -> Iterator[User]:
+    """Stream all users read concurrently by key ranges from a single snapshot.
+
+    Args:
+        pgsql_db_manager: The PgSQLDBConnectionManager of the source database.
+        partitions: The number of key ranges read concurrently.
+    Yields:
+        User: The users of the database.
+    """
+    yield from iter_partitioned(
+        pgsql_db_manager,
+        TABLE_NAME_1,
+        lambda connection, key_range: iter_users(connection, key_range=key_range),
+        partitions,
+    )
+
+
+def iter_user_roles_partitioned(
+    pgsql_db_manager, partitions: int = EXTRACT_PARTITIONS
+) -> Iterator[UserRole]:
+    """Stream all user roles read concurrently by key ranges from a single snapshot.
+
+    Args:
+        pgsql_db_manager: The PgSQLDBConnectionManager of the source database.
+        partitions: The number of key ranges read concurrently.
+    Yields:
+        UserRole: The user roles of the database.
+    """
+    yield from iter_partitioned(
+        pgsql_db_manager,
+        TABLE_NAME_2,
+        lambda connection, key_range: iter_user_roles(connection, key_range=key_range),
+        partitions,
+    )
@@ -0,0 +1,60 @@
+"""This module provides the SQL helpers shared by the extractors of the source tables.
+
+They build the WHERE clauses of the incremental and partitioned reads and read the high-water marks.
+"""
+
+from sqlalchemy import text
+
+
+def where_clause(
+    watermark_fields: list[str], since, key_range, key_column: str = "id"
+) -> str:
+    """Build the WHERE clause selecting the rows changed since a high-water mark and within a key range.
+
+    Args:
+        watermark_fields: The columns compared with the :since high-water mark.
+        since: The high-water mark, None to select every row.
+        key_range: The (lower included, upper excluded) range of keys, None or unbounded ends to not restrict them.
+        key_column: The key column of the table.
+    Returns:
+        str: The clause, with a leading space, empty when nothing is filtered.
+    """
+    conditions = []
+    if since is not None:
+        conditions.append(
+            "(" + " OR ".join(f"{field} >= :since" for field in watermark_fields) + ")"
+        )
+    if key_range is not None:
+        lower, upper = key_range
+        if lower is not None:
+            conditions.append(f"{key_column} >= :lower")
+        if upper is not None:
+            conditions.append(f"{key_column} < :upper")
+    return " WHERE " + " AND ".join(conditions) if conditions else ""
+
+
+def query_parameters(since, key_range) -> dict:
+    """Return the bind parameters of a clause built by `where_clause` with the same high-water mark and key range."""
+    lower, upper = key_range if key_range is not None else (None, None)
+    return {"since": since, "lower": lower, "upper": upper}
+
+
+def select_high_water_mark(connection, table_name: str, watermark_fields: list[str]):
+    """Return the greatest value of the watermark fields of a table.
+
+    Args:
+        connection: The source database connection object.
+        table_name: The table to read.
+        watermark_fields: The columns holding the modification times of the rows.
+    Returns:
+        The greatest value, None if the table is empty.
+    """
+    if len(watermark_fields) == 1:
+        expression = watermark_fields[0]
+    else:
+        expression = f"GREATEST({', '.join(watermark_fields)})"
+    return connection.execute(
+        text(
+            f"SELECT MAX({expression}) FROM {table_name}"  # nosec ignore SQL injection risk, as the input data is sanitized
+        )
+    ).scalar()
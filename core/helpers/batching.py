@@ -0,0 +1,28 @@
+"""This module provides helpers to split a stream of records into batches.
+
+It is used by the load functions to send rows to the backup database in chunks instead of one by one.
+"""
+
+from itertools import islice
+from typing import Iterable, Iterator, TypeVar
+
+T = TypeVar("T")
+
+
+def chunked(iterable: Iterable[T], size: int) -> Iterator[list[T]]:
+    """Split an iterable into lists of at most `size` items.
+
+    The iterable is consumed lazily so a generator of records is never fully materialized.
+    Args:
+        iterable (Iterable): The records to split.
+        size (int): The maximum number of records per batch.
+    Returns:
+        Iterator[list]: An iterator over the batches.
+    Raises:
+        ValueError: If the batch size is not a positive integer.
+    """
+    if size < 1:
+        raise ValueError("The batch size must be a positive integer.")
+    iterator = iter(iterable)
+    while batch := list(islice(iterator, size)):
+        yield batch
@@ -1,12 +1,34 @@
 """This module provides utility functions to convert between bytes and SQL string representations.
 
-It includes functions to convert encrypted data to a SQL string and vice versa.
+It includes functions to convert encrypted data to a SQL string and vice versa,
+and helpers to build the parameterized multi-row statements used by the bulk loads.
+
+Encrypted data is stored as a native BLOB, or as a base64 string prefixed by `b64:` with the 'base64' codec.
+Envelope encrypted data starts with ENVELOPE_VERSION, which marks its BLOBs, and its base64 strings are
+prefixed by `env:` instead.
+Values written by `convert_bytes_to_sql_string` in older backups are still decoded by `decode_ciphertext`.
 """
 
 import codecs
+from base64 import b64decode, b64encode
+from functools import lru_cache
+from typing import Iterable, Sequence
+
+from sqlalchemy import TextClause, text
+
+from config.default import CIPHERTEXT_CODEC
+from core.rsa_encrypt_decrypt.rsa_manager import (
+    ENVELOPE_VERSION,
+    EnvelopeCiphertext,
+)
 
 _SINGLE_QUOTE = "SINGLE_QUOTE"
 _COLON = "COLON"
+# legacy values never hold a colon, it is replaced by the COLON token
+_BASE64_PREFIX = "b64:"
+_ENVELOPE_PREFIX = "env:"
+# SQLite rejects the statements binding more parameters than SQLITE_MAX_VARIABLE_NUMBER, 32766 by default
+MAX_BOUND_PARAMETERS = 32766
 
 
 def convert_bytes_to_sql_string(encrypted_data: bytes) -> str:
@@ -38,3 +60,166 @@ def convert_sql_string_to_bytes(sql_string: str) -> bytes:
     return codecs.escape_decode(r"{}".format(sql_string))[
         0
     ]  # Using escape_decode to handle any special characters
+
+
+def encode_ciphertext(
+    encrypted_data: bytes, codec: str = CIPHERTEXT_CODEC
+) -> bytes | str:
+    """
+    Encode encrypted data to the value stored in the database.
+
+    Args:
+        encrypted_data (bytes): The encrypted data to store.
+        codec (str): 'blob' to bind the bytes as a BLOB, 'base64' to store a prefixed base64 string.
+    Returns:
+        bytes | str: The value to bind in the SQL statement.
+    Raises:
+        ValueError: If the codec is unknown.
+    """
+    return encode_ciphertexts([encrypted_data], codec)[0]
+
+
+def encode_ciphertexts(
+    encrypted_data: Iterable[bytes], codec: str = CIPHERTEXT_CODEC
+) -> list[bytes | str]:
+    """
+    Encode a batch of encrypted data to the values stored in the database.
+
+    Args:
+        encrypted_data (Iterable[bytes]): The encrypted data to store.
+        codec (str): 'blob' to bind the bytes as BLOBs, 'base64' to store prefixed base64 strings.
+    Returns:
+        list[bytes | str]: The values to bind in the SQL statement, in the same order.
+    Raises:
+        ValueError: If the codec is unknown.
+    """
+    if codec not in ("blob", "base64"):
+        raise ValueError(f"Unknown ciphertext codec {codec}.")
+    values = []
+    for value in encrypted_data:
+        if codec == "blob":
+            values.append(bytes(value))
+        elif isinstance(value, EnvelopeCiphertext):
+            values.append(_ENVELOPE_PREFIX + b64encode(value).decode("ascii"))
+        else:
+            values.append(_BASE64_PREFIX + b64encode(value).decode("ascii"))
+    return values
+
+
+def decode_ciphertext(value: bytes | str) -> bytes:
+    """
+    Decode a value stored in the database back to the encrypted data.
+
+    BLOB values, base64 strings and the escaped strings of `convert_bytes_to_sql_string` are all supported.
+    The BLOBs starting with ENVELOPE_VERSION are returned as envelope data, which is decrypted with RSA
+    when it turns out to be a RSA ciphertext starting with the same byte.
+    Args:
+        value (bytes | str): The value read from the database.
+    Returns:
+        bytes: The encrypted data, an `EnvelopeCiphertext` for envelope encrypted data.
+    """
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        value = bytes(value)
+        if value.startswith(ENVELOPE_VERSION):
+            return EnvelopeCiphertext(value)
+        return value
+    if value.startswith(_ENVELOPE_PREFIX):
+        return EnvelopeCiphertext(b64decode(value[len(_ENVELOPE_PREFIX) :]))
+    if value.startswith(_BASE64_PREFIX):
+        return b64decode(value[len(_BASE64_PREFIX) :])
+    return convert_sql_string_to_bytes(value)
+
+
+def decode_ciphertexts(values: Iterable[bytes | str]) -> list[bytes]:
+    """
+    Decode a batch of values stored in the database back to the encrypted data.
+
+    Args:
+        values (Iterable[bytes | str]): The values read from the database.
+    Returns:
+        list[bytes]: The encrypted data, in the same order.
+    """
+    return [decode_ciphertext(value) for value in values]
+
+
+def _parameter_name(row_index: int, column_index: int) -> str:
+    """Return the bind parameter name of a value in a multi-row statement."""
+    return f"r{row_index}c{column_index}"
+
+
+def max_rows_per_statement(column_count: int) -> int:
+    """
+    Return the greatest number of rows of a multi-row statement binding `column_count` values per row.
+
+    Args:
+        column_count (int): The number of bound columns per row.
+    Returns:
+        int: The number of rows binding at most MAX_BOUND_PARAMETERS parameters, at least one.
+    """
+    return max(1, MAX_BOUND_PARAMETERS // max(1, column_count))
+
+
+@lru_cache(maxsize=256)
+def build_insert_query(
+    table_name: str,
+    columns: tuple[str, ...],
+    row_count: int,
+    constant_values: tuple[tuple[str, str], ...] = (),
+    conflict_columns: tuple[str, ...] = (),
+) -> TextClause:
+    """
+    Build a parameterized multi-row INSERT statement.
+
+    Statements are cached per table, columns and number of rows so that each batch shape is compiled only once.
+    When conflict columns are given, the statement is an upsert updating every other column of the existing row.
+    Args:
+        table_name (str): The table to insert into.
+        columns (tuple[str, ...]): The columns bound from the row values.
+        row_count (int): The number of rows in the VALUES clause.
+        constant_values (tuple[tuple[str, str], ...]): Extra (column, SQL literal) pairs set on every row.
+        conflict_columns (tuple[str, ...]): The unique key of the table used to upsert the rows.
+    Returns:
+        TextClause: The compiled statement to execute with `bind_rows`.
+    """
+    all_columns = columns + tuple(name for name, _ in constant_values)
+    column_list = ", ".join(all_columns)
+    constants = "".join(f", {literal}" for _, literal in constant_values)
+    values = ", ".join(
+        "({}{})".format(
+            ", ".join(
+                f":{_parameter_name(row_index, column_index)}"
+                for column_index in range(len(columns))
+            ),
+            constants,
+        )
+        for row_index in range(row_count)
+    )
+    on_conflict = ""
+    if conflict_columns:
+        updates = ", ".join(
+            f"{column} = excluded.{column}"
+            for column in all_columns
+            if column not in conflict_columns
+        )
+        on_conflict = (
+            f" ON CONFLICT ({', '.join(conflict_columns)}) DO UPDATE SET {updates}"
+        )
+    return text(
+        f"INSERT INTO {table_name} ({column_list}) VALUES {values}{on_conflict}"  # nosec ignore SQL injection here as values are bound parameters
+    )
+
+
+def bind_rows(rows: Sequence[Sequence]) -> dict:
+    """
+    Flatten row values into the bind parameters of a statement built by `build_insert_query`.
+
+    Args:
+        rows (Sequence[Sequence]): The rows, each one ordered like the statement columns.
+    Returns:
+        dict: The bind parameters of the statement.
+    """
+    return {
+        _parameter_name(row_index, column_index): value
+        for row_index, row in enumerate(rows)
+        for column_index, value in enumerate(row)
+    }
@@ -0,0 +1,68 @@
+"""This module configures a logging that stays off the hot path of the loads.
+
+Records are put in an in-memory queue by the threads logging them, and written to the console and to a
+rotating log file by a listener thread. Frequent debug and info messages can be sampled, the warnings
+and errors are always kept.
+"""
+
+import logging
+import queue
+import threading
+from logging.handlers import QueueHandler, QueueListener
+
+logger = logging.getLogger("__main__")
+
+
+class SamplingFilter(logging.Filter):
+    """SamplingFilter class to keep one record out of `every` for each message below WARNING."""
+
+    def __init__(self, every: int = 1):
+        """Initialize the filter with the sampling period, 1 keeping every record."""
+        super().__init__()
+        self.every = max(1, every)
+        self._counts = {}
+        self._lock = threading.Lock()
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        """Tell whether a record is kept, counting the records by message template."""
+        if self.every == 1 or record.levelno >= logging.WARNING:
+            return True
+        key = (record.name, record.msg)
+        with self._lock:
+            count = self._counts.get(key, 0)
+            self._counts[key] = count + 1
+        return count % self.every == 0
+
+
+class _DeferredQueueHandler(QueueHandler):
+    """QueueHandler leaving the formatting of the records to the listener thread."""
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        """Return the record unchanged, as the queue is in-process and never pickles it."""
+        return record
+
+
+def configure_queue_logging(
+    target: logging.Logger,
+    handlers: list[logging.Handler],
+    level,
+    sample_every: int = 1,
+) -> QueueListener:
+    """Make a logger hand its records to a listener thread writing them with the given handlers.
+
+    Args:
+        target: The logger to configure.
+        handlers: The handlers writing the records, called from the listener thread only.
+        level: The level of the logger.
+        sample_every: Keep one debug or info record out of this number, per message.
+    Returns:
+        QueueListener: The started listener, to stop at exit so the queued records are flushed.
+    """
+    records = queue.SimpleQueue()
+    queue_handler = _DeferredQueueHandler(records)
+    queue_handler.addFilter(SamplingFilter(sample_every))
+    target.addHandler(queue_handler)
+    target.setLevel(level)
+    listener = QueueListener(records, *handlers, respect_handler_level=True)
+    listener.start()
+    return listener
@@ -0,0 +1,239 @@
+"""This module collects the metrics of a synchronization cycle and writes its run report.
+
+Every stage of a cycle records its wall time, row count, transferred bytes and batch count, and the cycle
+records its retries, encryption time and rejected rows. At the end of the cycle, the report is written as JSON
+and as a Prometheus textfile-collector file. The stages of a pipelined load overlap, so their times do not add up.
+"""
+
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Iterable, Iterator
+
+logger = logging.getLogger("__main__")
+
+_STAGE_COUNTERS = ("seconds", "rows", "bytes", "batches")
+_RUN_COUNTERS = ("retries", "encryption_seconds", "rejected_rows")
+
+
+def payload_size(rows: Iterable[tuple]) -> int:
+    """Return the approximate number of bytes of the values of rows sent to a database."""
+    return sum(
+        len(value) if isinstance(value, (str, bytes)) else 8
+        for row in rows
+        for value in row
+        if value is not None
+    )
+
+
+class RunMetrics:
+    """RunMetrics class to collect the stage and run counters of a cycle, from any thread."""
+
+    def __init__(self):
+        """Initialize empty metrics."""
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self) -> None:
+        """Forget the counters of the previous cycle and start timing a new one."""
+        with self._lock:
+            self.stages = {}
+            self.counters = dict.fromkeys(_RUN_COUNTERS, 0)
+            self.started = time.time()
+            self._started_counter = time.perf_counter()
+
+    def add(self, stage: str, **counters) -> None:
+        """Add values to the counters of a stage, such as `rows=500, batches=1`."""
+        with self._lock:
+            values = self.stages.setdefault(stage, dict.fromkeys(_STAGE_COUNTERS, 0))
+            for name, value in counters.items():
+                values[name] += value
+
+    def increment(self, counter: str, value: float = 1) -> None:
+        """Add a value to a counter of the run, 'retries', 'encryption_seconds' or 'rejected_rows'."""
+        with self._lock:
+            self.counters[counter] += value
+
+    @contextmanager
+    def stage(self, name: str):
+        """Time the block of a stage, adding its wall time to the stage even if it fails."""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, seconds=time.perf_counter() - started)
+
+    @contextmanager
+    def timer(self, counter: str):
+        """Time a block, adding its duration to a counter of the run."""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.increment(counter, time.perf_counter() - started)
+
+    def count_iter(self, stage: str, iterable: Iterable) -> Iterator:
+        """Stream the items of an iterable, counting them and the time spent producing them in a stage.
+
+        The counts are kept locally and added to the stage once, when the stream ends or is closed,
+        so the extraction does not take the lock for every row.
+        """
+        iterator = iter(iterable)
+        rows = 0
+        seconds = 0.0
+        try:
+            while True:
+                started = time.perf_counter()
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    seconds += time.perf_counter() - started
+                    return
+                seconds += time.perf_counter() - started
+                rows += 1
+                yield item
+        finally:
+            self.add(stage, seconds=seconds, rows=rows)
+
+    def report(self, status: str, budget: float | None = None) -> dict:
+        """Return the report of the cycle.
+
+        Args:
+            status: The outcome of the cycle, 'success', 'failure' or 'skipped'.
+            budget: The time budget of a cycle, in seconds.
+        Returns:
+            dict: The run counters and the counters of every stage, with the rows/sec of the stages.
+        """
+        with self._lock:
+            duration = time.perf_counter() - self._started_counter
+            stages = {}
+            for name, values in self.stages.items():
+                stages[name] = dict(values)
+                stages[name]["rows_per_second"] = (
+                    values["rows"] / values["seconds"] if values["seconds"] else 0
+                )
+            return {
+                "status": status,
+                "started": self.started,
+                "duration_seconds": duration,
+                "budget_seconds": budget,
+                "over_budget": budget is not None and duration > budget,
+                **self.counters,
+                "stages": stages,
+            }
+
+    def write_reports(
+        self, directory: str, status: str, budget: float | None = None
+    ) -> dict:
+        """Write the report of the cycle as `etl_metrics.json` and `etl_metrics.prom` in a directory.
+
+        The files are replaced atomically, so a collector never reads a partial report.
+        Args:
+            directory: The directory of the reports, such as the directory of a textfile collector.
+            status: The outcome of the cycle, 'success', 'failure' or 'skipped'.
+            budget: The time budget of a cycle, in seconds.
+        Returns:
+            dict: The written report.
+        """
+        report = self.report(status, budget)
+        os.makedirs(directory, exist_ok=True)
+        _write_atomically(
+            os.path.join(directory, "etl_metrics.json"), json.dumps(report, indent=2)
+        )
+        _write_atomically(
+            os.path.join(directory, "etl_metrics.prom"), to_prometheus(report)
+        )
+        if report["over_budget"]:
+            logger.warning(
+                "The cycle took %.1fs, over its budget of %.1fs",
+                report["duration_seconds"],
+                budget,
+            )
+        return report
+
+
+def _write_atomically(path: str, content: str) -> None:
+    """Write a file through a temporary file renamed over it."""
+    temporary_path = f"{path}.tmp"
+    with open(temporary_path, "w", encoding="utf-8") as file:
+        file.write(content)
+    os.replace(temporary_path, path)
+
+
+def to_prometheus(report: dict) -> str:
+    """Format a run report in the Prometheus text exposition format.
+
+    Args:
+        report: The report returned by `RunMetrics.report`.
+    Returns:
+        str: The metrics of the report, one gauge per line.
+    """
+    lines = []
+
+    def gauge(name: str, help_text: str, samples: list[tuple[str, float]]) -> None:
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} gauge")
+        lines.extend(f"{name}{labels} {value}" for labels, value in samples)
+
+    gauge(
+        "etl_run_last_timestamp_seconds",
+        "Start time of the last cycle.",
+        [("", report["started"])],
+    )
+    gauge(
+        "etl_run_duration_seconds",
+        "Wall time of the last cycle.",
+        [("", report["duration_seconds"])],
+    )
+    gauge(
+        "etl_run_success",
+        "Whether the last cycle succeeded or was skipped.",
+        [("", int(report["status"] != "failure"))],
+    )
+    gauge(
+        "etl_run_skipped",
+        "Whether the last cycle was skipped as the source had not changed.",
+        [("", int(report["status"] == "skipped"))],
+    )
+    gauge(
+        "etl_run_over_budget",
+        "Whether the last cycle exceeded its time budget.",
+        [("", int(report["over_budget"]))],
+    )
+    gauge(
+        "etl_run_retries",
+        "Retries of the last cycle.",
+        [("", report["retries"])],
+    )
+    gauge(
+        "etl_run_encryption_seconds",
+        "Time spent encrypting during the last cycle.",
+        [("", report["encryption_seconds"])],
+    )
+    gauge(
+        "etl_run_rejected_rows",
+        "Rows moved to the dead-letter table during the last cycle.",
+        [("", report["rejected_rows"])],
+    )
+    for counter, help_text in (
+        ("seconds", "Wall time of a stage of the last cycle."),
+        ("rows", "Rows processed by a stage of the last cycle."),
+        ("bytes", "Approximate bytes sent by a stage of the last cycle."),
+        ("batches", "Batches processed by a stage of the last cycle."),
+        ("rows_per_second", "Throughput of a stage of the last cycle."),
+    ):
+        gauge(
+            f"etl_stage_{counter}",
+            help_text,
+            [
+                (f'{{stage="{stage}"}}', values[counter])
+                for stage, values in report["stages"].items()
+            ],
+        )
+    return "\n".join(lines) + "\n"
+
+
+metrics = RunMetrics()
@@ -0,0 +1,135 @@
+"""This module provides helpers to retry database operations failing on transient errors.
+
+The delays grow exponentially with "full jitter", so clients failing together do not retry together.
+"""
+
+import logging
+import random
+import re
+import time
+from typing import Callable, TypeVar
+
+from sqlalchemy.exc import DBAPIError
+
+from config.default import RETRY_ATTEMPTS, RETRY_BASE_DELAY, RETRY_MAX_DELAY
+from core.helpers.metrics import metrics
+
+logger = logging.getLogger("__main__")
+
+T = TypeVar("T")
+
+# Messages of the drivers (libsql, Hrana, psycopg2) for errors of the connection or of a busy database
+_TRANSIENT_MARKERS = (
+    "database is locked",
+    "database is busy",
+    "database table is locked",
+    "connection refused",
+    "connection reset",
+    "connection timed out",
+    "could not connect",
+    "server closed the connection",
+    "timeout",
+    "timed out",
+    "temporarily unavailable",
+    "too many connections",
+)
+# HTTP statuses of the Turso gateway, as reported by the libsql client
+_TRANSIENT_STATUSES = re.compile(r"\b(?:429|502|503|504)\b")
+# SQLite primary result codes of a database busy with another connection: SQLITE_BUSY, SQLITE_LOCKED
+_TRANSIENT_SQLITE_CODES = frozenset((5, 6))
+# PostgreSQL SQLSTATE of connection exceptions, serialization failures, deadlocks,
+# insufficient resources, shutdowns and lock timeouts
+_TRANSIENT_SQLSTATES = (
+    "08",
+    "40001",
+    "40P01",
+    "53",
+    "57P01",
+    "57P02",
+    "57P03",
+    "55P03",
+)
+
+
+def is_transient_error(error: BaseException) -> bool:
+    """Tell whether an error is worth retrying: a dropped connection, a timeout, a locked database or a 5xx.
+
+    The errors wrapped by SQLAlchemy are classified on the error of the driver only, as their message
+    also holds the statement and its parameters, which may contain anything.
+    Args:
+        error: The raised exception.
+    Returns:
+        bool: True if the operation may succeed when retried.
+    """
+    if isinstance(error, DBAPIError) and error.connection_invalidated:
+        return True
+    driver_error = getattr(error, "orig", None) or error
+    if isinstance(driver_error, (ConnectionError, TimeoutError)):
+        return True
+    sqlstate = getattr(driver_error, "pgcode", None)
+    if sqlstate:
+        return sqlstate.startswith(_TRANSIENT_SQLSTATES)
+    sqlite_code = getattr(driver_error, "sqlite_errorcode", None)
+    if sqlite_code is not None and sqlite_code & 0xFF in _TRANSIENT_SQLITE_CODES:
+        return True
+    message = str(driver_error).lower()
+    return any(marker in message for marker in _TRANSIENT_MARKERS) or bool(
+        _TRANSIENT_STATUSES.search(message)
+    )
+
+
+def backoff_delay(
+    attempt: int,
+    base_delay: float = RETRY_BASE_DELAY,
+    max_delay: float = RETRY_MAX_DELAY,
+) -> float:
+    """Return a random delay between 0 and the exponential backoff of an attempt, capped to `max_delay`.
+
+    Args:
+        attempt: The number of the failed attempt, starting at 0.
+        base_delay: The backoff of the first attempt, in seconds.
+        max_delay: The greatest backoff, in seconds.
+    Returns:
+        float: The delay to wait before the next attempt, in seconds.
+    """
+    backoff = min(max_delay, base_delay * 2**attempt)
+    return random.uniform(0, backoff)  # nosec the jitter is not used for security
+
+
+def retry(
+    operation: Callable[[], T],
+    attempts: int = RETRY_ATTEMPTS,
+    base_delay: float = RETRY_BASE_DELAY,
+    max_delay: float = RETRY_MAX_DELAY,
+    is_retryable: Callable[[BaseException], bool] = is_transient_error,
+) -> T:
+    """Call an operation until it succeeds, waiting a jittered exponential backoff after each transient error.
+
+    Only idempotent operations, such as opening a connection or running a whole transaction, should be retried.
+    Args:
+        operation: The function to call, without arguments.
+        attempts: The greatest number of calls.
+        base_delay: The backoff of the first retry, in seconds.
+        max_delay: The greatest backoff, in seconds.
+        is_retryable: The function telling whether an error is transient.
+    Returns:
+        The result of the operation.
+    Raises:
+        Exception: The last error, once the attempts are exhausted, or the first error that is not transient.
+    """
+    for attempt in range(attempts):
+        try:
+            return operation()
+        except Exception as e:
+            if attempt == attempts - 1 or not is_retryable(e):
+                raise
+            delay = backoff_delay(attempt, base_delay, max_delay)
+            logger.warning(
+                "Attempt %d/%d failed (%s), retrying in %.2fs",
+                attempt + 1,
+                attempts,
+                e,
+                delay,
+            )
+            metrics.increment("retries")
+            time.sleep(delay)
@@ -0,0 +1,149 @@
+"""This file is part of the ETL project for PostgreSQL to Turso migration.
+
+It sizes the batches written to the backup database from the latency of the previous ones (AIMD).
+Every batch committed within LOAD_BATCH_TARGET_SECONDS grows the next ones by LOAD_BATCH_INCREASE rows,
+and a slower or failed batch halves them, always within LOAD_BATCH_MIN_SIZE and LOAD_BATCH_MAX_SIZE rows
+and LOAD_BATCH_MAX_BYTES bytes. The sizers are kept per table for the life of the process, so the loads of a
+daemon start from the size the previous cycles settled on.
+"""
+
+import logging
+import threading
+from itertools import islice
+from typing import Iterable, Iterator
+
+from config.default import (
+    LOAD_BATCH_ADAPTIVE,
+    LOAD_BATCH_INCREASE,
+    LOAD_BATCH_MAX_BYTES,
+    LOAD_BATCH_MAX_SIZE,
+    LOAD_BATCH_MIN_SIZE,
+    LOAD_BATCH_SIZE,
+    LOAD_BATCH_TARGET_SECONDS,
+)
+
+logger = logging.getLogger("__main__")
+
+_DECREASE_FACTOR = 0.5
+
+
+class AdaptiveBatchSizer:
+    """AdaptiveBatchSizer class to adjust the number of rows per batch from the observed write latency."""
+
+    def __init__(
+        self,
+        name: str,
+        initial: int = LOAD_BATCH_SIZE,
+        minimum: int = LOAD_BATCH_MIN_SIZE,
+        maximum: int = LOAD_BATCH_MAX_SIZE,
+        max_bytes: int = LOAD_BATCH_MAX_BYTES,
+        target_seconds: float = LOAD_BATCH_TARGET_SECONDS,
+        increase: int = LOAD_BATCH_INCREASE,
+    ):
+        """Initialize the sizer of a table with its initial size and its limits.
+
+        Raises:
+            ValueError: If the limits are not positive or the minimum is greater than the maximum.
+        """
+        if not 1 <= minimum <= maximum or max_bytes < 1:
+            raise ValueError("The batch size limits must be positive and ordered.")
+        self.name = name
+        self.minimum = minimum
+        self.maximum = maximum
+        self.max_bytes = max_bytes
+        self.target_seconds = target_seconds
+        self.increase = increase
+        self._size = min(maximum, max(minimum, initial))
+        self._row_bytes = 0.0
+        self._lock = threading.Lock()
+
+    @property
+    def size(self) -> int:
+        """Return the number of rows of the next batch, capped by the byte limit."""
+        with self._lock:
+            if self._row_bytes:
+                return max(
+                    self.minimum, min(self._size, int(self.max_bytes / self._row_bytes))
+                )
+            return self._size
+
+    def record_success(self, rows: int, size: int, seconds: float) -> None:
+        """Grow the batches after a batch written within the target latency, shrink them otherwise.
+
+        Args:
+            rows: The number of rows of the batch.
+            size: The size of the batch, in bytes.
+            seconds: The time spent writing the batch.
+        """
+        if not rows:
+            return
+        with self._lock:
+            row_bytes = size / rows
+            self._row_bytes = (
+                row_bytes
+                if not self._row_bytes
+                else 0.8 * self._row_bytes + 0.2 * row_bytes
+            )
+            if seconds <= self.target_seconds:
+                self._size = min(self.maximum, self._size + self.increase)
+                return
+        self._decrease(f"{seconds:.2f}s to write {rows} rows")
+
+    def record_failure(self, error: BaseException) -> None:
+        """Shrink the batches after a failed batch.
+
+        Args:
+            error: The error raised by the batch.
+        """
+        self._decrease(str(error))
+
+    def _decrease(self, reason: str) -> None:
+        """Halve the batch size, down to the minimum."""
+        with self._lock:
+            previous = self._size
+            self._size = max(self.minimum, int(self._size * _DECREASE_FACTOR))
+        if self._size < previous:
+            logger.info(
+                "%s: batch size reduced from %d to %d rows (%s)",
+                self.name,
+                previous,
+                self._size,
+                reason,
+            )
+
+    def batches(self, iterable: Iterable) -> Iterator[list]:
+        """Split an iterable into lists of the current batch size, read lazily.
+
+        Args:
+            iterable: The records to split.
+        Returns:
+            Iterator[list]: An iterator over the batches.
+        """
+        iterator = iter(iterable)
+        while batch := list(islice(iterator, self.size)):
+            yield batch
+
+    def log_settled(self) -> None:
+        """Log the batch size reached by the sizer."""
+        logger.info("%s: batch size settled at %d rows", self.name, self.size)
+
+
+_sizers: dict[str, AdaptiveBatchSizer] = {}
+_sizers_lock = threading.Lock()
+
+
+def get_batch_sizer(
+    name: str, initial: int = LOAD_BATCH_SIZE
+) -> AdaptiveBatchSizer | None:
+    """Return the batch sizer of a table, created on first use, None if LOAD_BATCH_ADAPTIVE is disabled.
+
+    Args:
+        name: The name of the sized table.
+        initial: The initial batch size of a new sizer.
+    """
+    if not LOAD_BATCH_ADAPTIVE:
+        return None
+    with _sizers_lock:
+        if name not in _sizers:
+            _sizers[name] = AdaptiveBatchSizer(name, initial)
+        return _sizers[name]
@@ -0,0 +1,176 @@
+"""This file is part of the ETL project for PostgreSQL to Turso migration.
+
+It records the progress of the full loads, so an interrupted load resumes where it stopped.
+A load reads every table by keyset pagination, ordered by its key, and commits every batch together with the
+last key it holds in the checkpoint table. While a load is running, its run id is kept in the sync-state table,
+and the next cycle resumes it from the last committed key of every table instead of starting over.
+"""
+
+import logging
+import threading
+import uuid
+
+from sqlalchemy import text
+
+from config.default import CHECKPOINTS_TABLE
+from core.sync.state import create_sync_state_table, get_state, set_state
+
+logger = logging.getLogger("__main__")
+
+_RUN_STATE_KEY = "full_load.run_id"
+
+
+def create_checkpoints_table(connection) -> None:
+    """Create the checkpoint table in the backup database if it does not exist.
+
+    Args:
+        connection: The database connection object.
+    """
+    connection.execute(
+        text(
+            f"CREATE TABLE IF NOT EXISTS {CHECKPOINTS_TABLE} (run_id TEXT NOT NULL, table_name TEXT NOT NULL, last_key TEXT, rows_loaded INTEGER NOT NULL DEFAULT 0, completed INTEGER NOT NULL DEFAULT 0, date_updated TEXT, PRIMARY KEY (run_id, table_name))"  # nosec ignore SQL injection here as no input data is being inserted
+        )
+    )
+
+
+def get_unfinished_run(connection) -> str | None:
+    """Return the run id of the load interrupted before its end, None if the last load finished.
+
+    Args:
+        connection: The database connection object.
+    """
+    create_sync_state_table(connection)
+    create_checkpoints_table(connection)
+    return get_state(connection, _RUN_STATE_KEY)
+
+
+def start_run(connection) -> str:
+    """Start a new load, forgetting the checkpoints of any previous one, and commit it.
+
+    Args:
+        connection: The database connection object.
+    Returns:
+        str: The run id of the new load.
+    """
+    create_sync_state_table(connection)
+    create_checkpoints_table(connection)
+    connection.execute(
+        text(
+            f"DELETE FROM {CHECKPOINTS_TABLE}"  # nosec ignore SQL injection here as no input data is being inserted
+        )
+    )
+    run_id = str(uuid.uuid4())
+    set_state(connection, _RUN_STATE_KEY, run_id)
+    connection.commit()
+    logger.info("Load %s started", run_id)
+    return run_id
+
+
+def finish_run(connection, run_id: str) -> None:
+    """Forget the checkpoints of a finished load and commit it.
+
+    Args:
+        connection: The database connection object.
+        run_id: The run id of the load.
+    """
+    connection.execute(
+        text(
+            f"DELETE FROM {CHECKPOINTS_TABLE} WHERE run_id = :run_id"  # nosec ignore SQL injection here as values are bound parameters
+        ),
+        {"run_id": run_id},
+    )
+    set_state(connection, _RUN_STATE_KEY, None)
+    connection.commit()
+    logger.info("Load %s finished", run_id)
+
+
+def get_checkpoint(
+    connection, run_id: str, table_name: str
+) -> tuple[str | None, int, bool]:
+    """Read the progress of a table in a load.
+
+    Args:
+        connection: The database connection object.
+        run_id: The run id of the load.
+        table_name: The destination table.
+    Returns:
+        tuple[str | None, int, bool]: The last committed key, None if no batch was committed,
+            the number of rows loaded and whether the table is complete.
+    """
+    checkpoint = connection.execute(
+        text(
+            f"SELECT last_key, rows_loaded, completed FROM {CHECKPOINTS_TABLE} WHERE run_id = :run_id AND table_name = :table_name"  # nosec ignore SQL injection here as values are bound parameters
+        ),
+        {"run_id": run_id, "table_name": table_name},
+    ).one_or_none()
+    if checkpoint is None:
+        return None, 0, False
+    last_key, rows_loaded, completed = checkpoint
+    return last_key, rows_loaded, bool(completed)
+
+
+def save_checkpoint(
+    connection,
+    run_id: str,
+    table_name: str,
+    last_key,
+    rows_loaded: int,
+    completed: bool = False,
+) -> None:
+    """Write the progress of a table in a load.
+
+    The checkpoint is not committed, so it is saved in the same transaction as the batch it describes.
+    Args:
+        connection: The database connection object.
+        run_id: The run id of the load.
+        table_name: The destination table.
+        last_key: The greatest key committed, every smaller key being committed too.
+        rows_loaded: The number of rows loaded.
+        completed: Whether every row of the table is loaded.
+    """
+    connection.execute(
+        text(
+            f"INSERT INTO {CHECKPOINTS_TABLE} (run_id, table_name, last_key, rows_loaded, completed, date_updated) VALUES (:run_id, :table_name, :last_key, :rows_loaded, :completed, CURRENT_TIMESTAMP) ON CONFLICT (run_id, table_name) DO UPDATE SET last_key = excluded.last_key, rows_loaded = excluded.rows_loaded, completed = excluded.completed, date_updated = excluded.date_updated"  # nosec ignore SQL injection here as values are bound parameters
+        ),
+        {
+            "run_id": run_id,
+            "table_name": table_name,
+            "last_key": None if last_key is None else str(last_key),
+            "rows_loaded": rows_loaded,
+            "completed": int(completed),
+        },
+    )
+
+
+class CheckpointTracker:
+    """CheckpointTracker class to find the last key below which every batch of a load is committed.
+
+    Batches are numbered in key order when read, but may be committed out of order by a pipeline
+    with several transform threads.
+    """
+
+    def __init__(self, last_key=None, rows_loaded: int = 0):
+        """Initialize the tracker with the progress of a resumed load."""
+        self.last_key = last_key
+        self.rows_loaded = rows_loaded
+        self._next_sequence = 0
+        self._committed = {}
+        self._lock = threading.Lock()
+
+    def commit(self, sequence: int, last_key, rows: int):
+        """Record a committed batch.
+
+        Args:
+            sequence: The number of the batch, counted from 0 in key order.
+            last_key: The greatest key of the batch.
+            rows: The number of rows of the batch.
+        Returns:
+            The last key below which every batch is committed.
+        """
+        with self._lock:
+            self.rows_loaded += rows
+            self._committed[sequence] = last_key
+            while self._next_sequence in self._committed:
+                self.last_key = self._committed.pop(self._next_sequence)
+                self._next_sequence += 1
+            return self.last_key
@@ -0,0 +1,73 @@
+"""This file is part of the ETL project for PostgreSQL to Turso migration.
+
+It stores the wrapped data keys of the envelope encryption in the backup database,
+so the encrypted backups can be decrypted with the RSA private key alone.
+"""
+
+import logging
+from typing import Callable
+
+from sqlalchemy import text
+
+from config.default import DATA_KEYS_TABLE
+from core.helpers.common_sql import decode_ciphertext, encode_ciphertext
+from core.rsa_encrypt_decrypt.rsa_manager import DataKey
+
+logger = logging.getLogger("__main__")
+
+
+def create_data_keys_table(connection) -> None:
+    """Create the data keys table in the backup database if it does not exist.
+
+    Args:
+        connection: The database connection object.
+    """
+    connection.execute(
+        text(
+            f"CREATE TABLE IF NOT EXISTS {DATA_KEYS_TABLE} (key_id TEXT PRIMARY KEY, wrapped_key TEXT NOT NULL, date_created TEXT)"  # nosec ignore SQL injection here as no input data is being inserted
+        )
+    )
+
+
+def store_data_key(connection, data_key: DataKey) -> None:
+    """Store the wrapped value of a data key, without committing it.
+
+    Args:
+        connection: The database connection object.
+        data_key: The data key whose wrapped value is stored.
+    """
+    create_data_keys_table(connection)
+    connection.execute(
+        text(
+            f"INSERT INTO {DATA_KEYS_TABLE} (key_id, wrapped_key, date_created) VALUES (:key_id, :wrapped_key, CURRENT_TIMESTAMP)"  # nosec ignore SQL injection here as values are bound parameters
+        ),
+        {
+            "key_id": data_key.key_id.hex(),
+            "wrapped_key": encode_ciphertext(data_key.wrapped_key),
+        },
+    )
+    logger.info("Data key %s stored in %s", data_key.key_id.hex(), DATA_KEYS_TABLE)
+
+
+def get_wrapped_key_lookup(connection) -> Callable[[str], bytes]:
+    """Return a function reading the wrapped data keys from the backup database.
+
+    The function is meant to be passed to `rsa_manager.decrypt` to decrypt envelope messages.
+    Args:
+        connection: The database connection object.
+    Returns:
+        Callable[[str], bytes]: A function returning the wrapped key of a hex key id.
+    """
+
+    def lookup(key_id: str) -> bytes:
+        wrapped_key = connection.execute(
+            text(
+                f"SELECT wrapped_key FROM {DATA_KEYS_TABLE} WHERE key_id = :key_id"  # nosec ignore SQL injection here as values are bound parameters
+            ),
+            {"key_id": key_id},
+        ).scalar()
+        if wrapped_key is None:
+            raise KeyError(f"Unknown data key {key_id}.")
+        return decode_ciphertext(wrapped_key)
+
+    return lookup
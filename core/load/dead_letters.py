@@ -0,0 +1,98 @@
+"""This file is part of the ETL project for PostgreSQL to Turso migration.
+
+It keeps the rows rejected by the backup database in a dead-letter table, with the error that rejected them,
+so a bad row (a constraint violation, a value the driver cannot encode) costs a few extra statements
+instead of failing the whole load. The rejected rows are written in the transaction of their batch.
+"""
+
+import json
+import logging
+import uuid
+
+from sqlalchemy import text
+from sqlalchemy.exc import DataError, IntegrityError
+
+from config.default import DEAD_LETTERS_TABLE
+
+logger = logging.getLogger("__main__")
+
+# Errors raised by the values of a row rather than by the statement, the database or the connection
+_ROW_ERROR_MARKERS = (
+    "constraint failed",
+    "datatype mismatch",
+    "unsupported parameter type",
+    "codec can't encode",
+    "surrogates not allowed",
+)
+
+
+def is_row_error(error: BaseException) -> bool:
+    """Tell whether an error is caused by the values of a row, so the other rows of its batch can be written.
+
+    Args:
+        error: The raised exception.
+    Returns:
+        bool: True if rejecting the offending rows lets the batch succeed.
+    """
+    if isinstance(error, (IntegrityError, DataError, UnicodeError)):
+        return True
+    # The errors wrapped by SQLAlchemy repeat the statement and its parameters, which may contain a marker
+    message = str(getattr(error, "orig", None) or error).lower()
+    return any(marker in message for marker in _ROW_ERROR_MARKERS)
+
+
+def create_dead_letters_table(connection) -> None:
+    """Create the dead-letter table in the backup database if it does not exist.
+
+    Args:
+        connection: The database connection object.
+    """
+    connection.execute(
+        text(
+            f"CREATE TABLE IF NOT EXISTS {DEAD_LETTERS_TABLE} (letter_id TEXT PRIMARY KEY, table_name TEXT NOT NULL, row_key TEXT, row_data TEXT NOT NULL, error TEXT NOT NULL, date_created TEXT)"  # nosec ignore SQL injection here as no input data is being inserted
+        )
+    )
+
+
+def record_dead_letter(
+    connection,
+    table_name: str,
+    columns: tuple[str, ...],
+    row: tuple,
+    key_column: str | None,
+    error: BaseException,
+) -> None:
+    """Store a rejected row with its error, without committing it.
+
+    Args:
+        connection: The database connection object.
+        table_name: The table the row was written to.
+        columns: The columns of the row values.
+        row: The rejected row, ordered like `columns`.
+        key_column: The key column of the table, None if it has none.
+        error: The error that rejected the row.
+    """
+    values = dict(zip(columns, row))
+    row_key = values.get(key_column) if key_column else None
+    # The errors wrapped by SQLAlchemy repeat the statement and its parameters
+    message = str(getattr(error, "orig", None) or error)
+    create_dead_letters_table(connection)
+    connection.execute(
+        text(
+            f"INSERT INTO {DEAD_LETTERS_TABLE} (letter_id, table_name, row_key, row_data, error, date_created) VALUES (:letter_id, :table_name, :row_key, :row_data, :error, CURRENT_TIMESTAMP)"  # nosec ignore SQL injection here as values are bound parameters
+        ),
+        {
+            "letter_id": str(uuid.uuid4()),
+            "table_name": table_name,
+            "row_key": None if row_key is None else str(row_key),
+            "row_data": json.dumps(values, default=str),
+            "error": message,
+        },
+    )
+    logger.warning(
+        "Row %s of %s rejected and stored in %s: %s",
+        row_key,
+        table_name,
+        DEAD_LETTERS_TABLE,
+        message,
+    )
@@ -4,12 +4,15 @@ It contains the IAM gateway application for handling backing up user and user ro
 """
 
 import logging
+import time
 from os import environ as env
+from typing import Iterable
 
 import arrow
-from sqlalchemy import text
+from sqlalchemy import bindparam, text
 
 from config.default import (
+    ENCRYPTION_MODE,
     FIELD_NAME_1,
     FIELD_NAME_2,
     FIELD_NAME_3,
@@ -24,16 +27,409 @@ from config.default import (
     FIELD_NAME_12,
     FIELD_NAME_13,
     FIELD_NAME_14,
+    LOAD_BATCH_SIZE,
     TABLE_NAME_1,
     TABLE_NAME_2,
 )
-from core.helpers.common_sql import convert_bytes_to_sql_string
+from core.helpers.batching import chunked
+from core.helpers.common_sql import (
+    bind_rows,
+    build_insert_query,
+    encode_ciphertexts,
+    max_rows_per_statement,
+)
+from core.helpers.metrics import metrics, payload_size
+from core.load.batch_sizing import AdaptiveBatchSizer
+from core.load.data_keys import store_data_key
+from core.load.dead_letters import is_row_error, record_dead_letter
 from core.models.iam_gateway import User, UserRole
-from core.rsa_encrypt_decrypt.rsa_manager import encrypt
+from core.rsa_encrypt_decrypt.rsa_manager import (
+    DataKey,
+    encrypt_many,
+    envelope_encrypt_many,
+    new_data_key,
+)
 
 logger = logging.getLogger("__main__")
 
 
+_USER_COLUMNS = (
+    FIELD_NAME_1,
+    FIELD_NAME_2,
+    FIELD_NAME_3,
+    FIELD_NAME_4,
+    FIELD_NAME_5,
+    FIELD_NAME_6,
+    FIELD_NAME_7,
+    FIELD_NAME_8,
+    FIELD_NAME_9,
+    FIELD_NAME_10,
+)
+_USER_CONSTANT_VALUES = (("password", "'ABCD123.4'"),)
+_USER_ROLE_COLUMNS = (FIELD_NAME_11, FIELD_NAME_12, FIELD_NAME_13, FIELD_NAME_14)
+# upserted rows are stamped as they are written, set_timestamp would rewrite the whole table
+_UPSERT_CONSTANT_VALUES = (("date_insertion", "CURRENT_TIMESTAMP"),)
+
+# Errors of a statement too large for the database, which only fail the statement and not its transaction
+_BATCH_TOO_LARGE_MARKERS = ("too many sql variables", "too big", "too large")
+
+
+def _to_sql_value(value):
+    """Convert a record value to the string representation stored in the backup DB."""
+    return None if value is None else str(value)
+
+
+def user_to_row(
+    user: User, to_encrypt_database: bool = False, data_key: DataKey | None = None
+) -> tuple:
+    """Convert a user to the row values inserted in the backup DB.
+
+    Args:
+        user: An instance of the User class containing user details.
+        to_encrypt_database: Whether to encrypt the sensitive fields of the user.
+        data_key: The data key of the envelope encryption, the fields are encrypted with RSA when None.
+    Returns:
+        tuple: The values ordered like the columns of the user table.
+    """
+    sensitive_values = (user.username, user.email, user.token_activation)
+    if to_encrypt_database:
+        with metrics.timer("encryption_seconds"):
+            encrypted_values = (
+                envelope_encrypt_many(sensitive_values, data_key)
+                if data_key is not None
+                else encrypt_many(sensitive_values, "rsa_keys")
+            )
+        username, email, token_activation = encode_ciphertexts(encrypted_values)
+    else:
+        username, email, token_activation = (
+            _to_sql_value(value) for value in sensitive_values
+        )
+    return (
+        _to_sql_value(user.id),
+        username,
+        email,
+        _to_sql_value(user.date_created),
+        token_activation,
+        _to_sql_value(user.active),
+        _to_sql_value(user.date_activated),
+        _to_sql_value(user.date_deactivated),
+        _to_sql_value(user.deleted),
+        _to_sql_value(user.admin),
+    )
+
+
+def user_role_to_row(user_role: UserRole) -> tuple:
+    """Convert a user role to the row values inserted in the backup DB.
+
+    Args:
+        user_role: An instance of the UserRole class containing user role details.
+    Returns:
+        tuple: The values ordered like the columns of the user role table.
+    """
+    return (
+        _to_sql_value(user_role.id),
+        _to_sql_value(user_role.user_id),
+        _to_sql_value(user_role.role_id),
+        _to_sql_value(user_role.date_created),
+    )
+
+
+def insert_rows(
+    connection,
+    table_name: str,
+    columns: tuple[str, ...],
+    rows: list[tuple],
+    constant_values: tuple[tuple[str, str], ...] = (),
+    conflict_columns: tuple[str, ...] = (),
+) -> int:
+    """Insert a batch of rows with a single parameterized multi-row statement.
+
+    Args:
+        connection: The database connection object.
+        table_name: The table to insert into.
+        columns: The columns bound from the row values.
+        rows: The rows to insert, each one ordered like `columns`.
+        constant_values: Extra (column, SQL literal) pairs set on every row.
+        conflict_columns: The unique key used to upsert the rows, plain inserts when empty.
+    Returns:
+        int: The number of rows inserted.
+    """
+    if not rows:
+        return 0
+    query = build_insert_query(
+        table_name, columns, len(rows), constant_values, conflict_columns
+    )
+    connection.execute(query, bind_rows(rows))
+    return len(rows)
+
+
+def insert_rows_isolating(
+    connection,
+    table_name: str,
+    columns: tuple[str, ...],
+    rows: list[tuple],
+    constant_values: tuple[tuple[str, str], ...] = (),
+    conflict_columns: tuple[str, ...] = (),
+) -> int:
+    """Insert a batch of rows, moving the rows rejected by the database to the dead-letter table.
+
+    A batch failing on the values of a row is bisected until the offending rows are isolated, which takes
+    about two statements per bad row and halving. A failed statement does not end its transaction,
+    so the accepted rows are committed along with the rejected ones.
+    Args:
+        connection: The database connection object.
+        table_name: The table to insert into.
+        columns: The columns bound from the row values.
+        rows: The rows to insert, each one ordered like `columns`.
+        constant_values: Extra (column, SQL literal) pairs set on every row.
+        conflict_columns: The unique key used to upsert the rows, plain inserts when empty.
+    Returns:
+        int: The number of rows inserted, the rejected rows excluded.
+    Raises:
+        Exception: The errors which are not caused by the values of a row.
+    """
+    try:
+        return insert_rows(
+            connection, table_name, columns, rows, constant_values, conflict_columns
+        )
+    except Exception as e:
+        if not is_row_error(e):
+            raise
+        if len(rows) == 1:
+            record_dead_letter(
+                connection,
+                table_name,
+                columns,
+                rows[0],
+                conflict_columns[0] if conflict_columns else None,
+                e,
+            )
+            metrics.increment("rejected_rows")
+            return 0
+    middle = len(rows) // 2
+    return insert_rows_isolating(
+        connection,
+        table_name,
+        columns,
+        rows[:middle],
+        constant_values,
+        conflict_columns,
+    ) + insert_rows_isolating(
+        connection,
+        table_name,
+        columns,
+        rows[middle:],
+        constant_values,
+        conflict_columns,
+    )
+
+
+def insert_rows_adaptive(
+    connection,
+    table_name: str,
+    columns: tuple[str, ...],
+    rows: list[tuple],
+    sizer: AdaptiveBatchSizer,
+    constant_values: tuple[tuple[str, str], ...] = (),
+    conflict_columns: tuple[str, ...] = (),
+) -> int:
+    """Insert rows by statements of the size chosen by a batch sizer, timing each one to adjust the next.
+
+    The rows rejected by the database are moved to the dead-letter table by `insert_rows_isolating`.
+    The statements never bind more than MAX_BOUND_PARAMETERS values, whatever the size of the sizer.
+    A statement rejected as too large is split in halves and retried, as it leaves the transaction open.
+    Any other error shrinks the batch size of the next attempt and is raised.
+    Args:
+        connection: The database connection object.
+        table_name: The table to insert into.
+        columns: The columns bound from the row values.
+        rows: The rows to insert, each one ordered like `columns`.
+        sizer: The batch sizer of the table.
+        constant_values: Extra (column, SQL literal) pairs set on every row.
+        conflict_columns: The unique key used to upsert the rows, plain inserts when empty.
+    Returns:
+        int: The number of rows inserted, the rejected rows excluded.
+    """
+    inserted = accepted = 0
+    max_rows = max_rows_per_statement(len(columns))
+    limit = None
+    while inserted < len(rows):
+        size = min(sizer.size, max_rows if limit is None else limit)
+        batch = rows[inserted : inserted + size]
+        started = time.perf_counter()
+        try:
+            accepted += insert_rows_isolating(
+                connection,
+                table_name,
+                columns,
+                batch,
+                constant_values,
+                conflict_columns,
+            )
+        except Exception as e:
+            sizer.record_failure(e)
+            # The errors wrapped by SQLAlchemy repeat the statement and its parameters, which may contain a marker
+            message = str(getattr(e, "orig", None) or e).lower()
+            too_large = any(marker in message for marker in _BATCH_TOO_LARGE_MARKERS)
+            if too_large and len(batch) > 1:
+                limit = len(batch) // 2
+                continue
+            raise
+        sizer.record_success(
+            len(batch), payload_size(batch), time.perf_counter() - started
+        )
+        inserted += len(batch)
+        limit = None
+    return accepted
+
+
+def insert_user_rows(
+    connection, rows: list[tuple], upsert: bool = False, table_name: str = TABLE_NAME_1
+) -> int:
+    """Insert a batch of rows built by `user_to_row` in the user table.
+
+    Args:
+        connection: The database connection object.
+        rows: The user rows to insert.
+        upsert: Whether to update the users already recorded and stamp the written rows.
+        table_name: The table to insert into, the user table or its staging table.
+    Returns:
+        int: The number of users inserted.
+    """
+    if upsert:
+        return insert_rows(
+            connection,
+            table_name,
+            _USER_COLUMNS,
+            rows,
+            _USER_CONSTANT_VALUES + _UPSERT_CONSTANT_VALUES,
+            (FIELD_NAME_1,),
+        )
+    return insert_rows(
+        connection, table_name, _USER_COLUMNS, rows, _USER_CONSTANT_VALUES
+    )
+
+
+def insert_user_role_rows(
+    connection, rows: list[tuple], upsert: bool = False, table_name: str = TABLE_NAME_2
+) -> int:
+    """Insert a batch of rows built by `user_role_to_row` in the user role table.
+
+    Args:
+        connection: The database connection object.
+        rows: The user role rows to insert.
+        upsert: Whether to update the user roles already recorded and stamp the written rows.
+        table_name: The table to insert into, the user role table or its staging table.
+    Returns:
+        int: The number of user roles inserted.
+    """
+    if upsert:
+        return insert_rows(
+            connection,
+            table_name,
+            _USER_ROLE_COLUMNS,
+            rows,
+            _UPSERT_CONSTANT_VALUES,
+            (FIELD_NAME_11,),
+        )
+    return insert_rows(connection, table_name, _USER_ROLE_COLUMNS, rows)
+
+
+def prepare_data_key(connection, to_encrypt_database: bool) -> DataKey | None:
+    """Generate and store the data key of a load when the envelope encryption is enabled.
+
+    Args:
+        connection: The database connection object.
+        to_encrypt_database: Whether the loaded data is encrypted.
+    Returns:
+        DataKey | None: The stored data key, None when the fields are not envelope encrypted.
+    """
+    if not to_encrypt_database or ENCRYPTION_MODE != "envelope":
+        return None
+    data_key = new_data_key("rsa_keys")
+    store_data_key(connection, data_key)
+    return data_key
+
+
+def record_users(
+    connection,
+    users: Iterable[User],
+    commit: bool = True,
+    to_encrypt_database: bool = False,
+    batch_size: int = LOAD_BATCH_SIZE,
+    upsert: bool = False,
+    data_key: DataKey | None = None,
+) -> int:
+    """Record users in the database by batches.
+
+    Each batch of users is written with one multi-row INSERT statement, so the number of round trips
+    to the database is divided by the batch size.
+    With the 'envelope' ENCRYPTION_MODE, a data key is generated and stored for the call unless one is given.
+    Args:
+        connection: The database connection object.
+        users: A list or an iterator of User instances.
+        commit: Whether to commit the transaction after inserting the records.
+        to_encrypt_database: Whether to encrypt the user data before storing it in the database.
+        batch_size: The maximum number of users inserted per statement.
+        upsert: Whether to update the users already recorded and stamp the written rows.
+        data_key: The data key of the envelope encryption, already stored in the database.
+    Returns:
+        int: The number of users recorded.
+    """
+    recorded = 0
+    for batch in chunked(users, batch_size):
+        if data_key is None:
+            data_key = prepare_data_key(connection, to_encrypt_database)
+        recorded += insert_user_rows(
+            connection,
+            [user_to_row(user, to_encrypt_database, data_key) for user in batch],
+            upsert,
+        )
+        logger.debug("Inserted a batch of %d users in %s", len(batch), TABLE_NAME_1)
+
+    if commit:
+        connection.commit()
+    logger.info("%d users recorded in %s", recorded, TABLE_NAME_1)
+    return recorded
+
+
+def record_user_roles(
+    connection,
+    user_roles: Iterable[UserRole],
+    commit: bool = True,
+    to_encrypt_database: bool = False,
+    batch_size: int = LOAD_BATCH_SIZE,
+    upsert: bool = False,
+) -> int:
+    """Record user roles in the database by batches.
+
+    Each batch of user roles is written with one multi-row INSERT statement.
+    Args:
+        connection: The database connection object.
+        user_roles: A list or an iterator of UserRole instances.
+        commit: Whether to commit the transaction after inserting the records.
+        to_encrypt_database: Whether to encrypt the user role data before storing it in the database.
+        batch_size: The maximum number of user roles inserted per statement.
+        upsert: Whether to update the user roles already recorded and stamp the written rows.
+    Returns:
+        int: The number of user roles recorded.
+    """
+    # user roles hold no sensitive field, to_encrypt_database is kept for API symmetry with record_users
+    recorded = 0
+    for batch in chunked(user_roles, batch_size):
+        recorded += insert_user_role_rows(
+            connection, [user_role_to_row(user_role) for user_role in batch], upsert
+        )
+        logger.debug(
+            "Inserted a batch of %d user roles in %s", len(batch), TABLE_NAME_2
+        )
+
+    if commit:
+        connection.commit()
+    logger.info("%d user roles recorded in %s", recorded, TABLE_NAME_2)
+    return recorded
+
+
 def record_user(
     connection, user: User, commit: bool = True, to_encrypt_database: bool = False
 ) -> bool:
@@ -48,52 +444,7 @@ def record_user(
     Returns:
         bool: True if the user was recorded successfully, False otherwise.
     """
-    # id = convert_bytes_to_sql_string(encrypt(user.id, "rsa_keys")) if to_encrypt_database else user.id
-    username = (
-        convert_bytes_to_sql_string(encrypt(user.username, "rsa_keys"))
-        if to_encrypt_database
-        else user.username
-    )
-    email = (
-        convert_bytes_to_sql_string(encrypt(user.email, "rsa_keys"))
-        if to_encrypt_database
-        else user.email
-    )
-    token_activation = (
-        convert_bytes_to_sql_string(encrypt(user.token_activation, "rsa_keys"))
-        if to_encrypt_database
-        else user.token_activation
-    )
-
-    s_query = "INSERT INTO {} ({},{},{},{},{},{},{},{},{},{}, password) VALUES ('{}', '{}', '{}', '{}', '{}', '{}', '{}', '{}', '{}', '{}', 'ABCD123.4')".format(  # nosec ignore SQL injection here as input data is sanitized
-        TABLE_NAME_1,
-        FIELD_NAME_1,
-        FIELD_NAME_2,
-        FIELD_NAME_3,
-        FIELD_NAME_4,
-        FIELD_NAME_5,
-        FIELD_NAME_6,
-        FIELD_NAME_7,
-        FIELD_NAME_8,
-        FIELD_NAME_9,
-        FIELD_NAME_10,
-        user.id,  # id,
-        username,
-        email,
-        user.date_created,
-        token_activation,
-        user.active,
-        user.date_activated,
-        user.date_deactivated,
-        user.deleted,
-        user.admin,
-    )
-    logger.info("Insert user data in backup DB with query: %s", s_query)
-    connection.execute(text(s_query))
-
-    if commit:
-        connection.commit()
-    return True
+    return record_users(connection, [user], commit, to_encrypt_database) == 1
 
 
 def record_user_role(
@@ -113,66 +464,119 @@ def record_user_role(
     Returns:
         bool: True if the user role was recorded successfully, False otherwise.
     """
-    # uid = convert_bytes_to_sql_string(encrypt(user_role.user_id, "rsa_keys")) if to_encrypt_database else user_role.user_id
-
-    s_query = "INSERT INTO {} ({},{},{},{}) VALUES ('{}', '{}', '{}', '{}')".format(  # nosec ignore SQL injection here as input data is sanitized
-        TABLE_NAME_2,
-        FIELD_NAME_11,
-        FIELD_NAME_12,
-        FIELD_NAME_13,
-        FIELD_NAME_14,
-        user_role.id,
-        user_role.user_id,  # uid,
-        user_role.role_id,
-        user_role.date_created,
-    )
-    logger.info("Insert user role data in backup DB with query: %s", s_query)
-    connection.execute(text(s_query))
+    return record_user_roles(connection, [user_role], commit, to_encrypt_database) == 1
 
-    if commit:
-        connection.commit()
-    return True
 
+def delete_rows(
+    connection,
+    table_name: str,
+    key_column: str,
+    keys: Iterable,
+    batch_size: int = LOAD_BATCH_SIZE,
+) -> int:
+    """Delete the rows of a table by key, without committing.
 
-def set_timestamp(connection) -> bool:
+    Args:
+        connection: The database connection object.
+        table_name: The table to delete from.
+        key_column: The primary key column of the table.
+        keys: The keys of the rows to delete.
+        batch_size: The maximum number of rows deleted per statement.
+    Returns:
+        int: The number of keys processed.
+    """
+    deleted = 0
+    for batch in chunked(keys, batch_size):
+        connection.execute(
+            text(
+                f"DELETE FROM {table_name} WHERE {key_column} IN :keys"  # nosec ignore SQL injection here as keys are bound parameters
+            ).bindparams(bindparam("keys", expanding=True)),
+            {"keys": batch},
+        )
+        deleted += len(batch)
+    return deleted
+
+
+def delete_missing_rows(
+    connection,
+    table_name: str,
+    key_column: str,
+    source_keys: Iterable,
+    batch_size: int = LOAD_BATCH_SIZE,
+) -> int:
+    """Delete the rows of the backup DB whose key no longer exists in the source DB.
+
+    Only the keys are compared, so the cost of the comparison stays small even for large tables.
+    Args:
+        connection: The database connection object.
+        table_name: The table to clean up.
+        key_column: The primary key column of the table.
+        source_keys: The keys of all the rows currently in the source table.
+        batch_size: The maximum number of rows deleted per statement.
+    Returns:
+        int: The number of rows deleted.
+    """
+    stale_keys = {
+        str(key)
+        for key in connection.execute(
+            text(
+                f"SELECT {key_column} FROM {table_name}"  # nosec ignore SQL injection here as no input data is being inserted
+            )
+        ).scalars()
+    }
+    stale_keys.difference_update(str(key) for key in source_keys)
+
+    deleted = delete_rows(
+        connection, table_name, key_column, sorted(stale_keys), batch_size
+    )
+    if deleted:
+        logger.info("%d rows deleted from %s", deleted, table_name)
+    return deleted
+
+
+def set_timestamp(
+    connection, table_names: Iterable[str] = (TABLE_NAME_1, TABLE_NAME_2)
+) -> bool:
     """Set the timestamp for the user and user_role tables.
 
     Args:
         connection: The database connection object.
+        table_names: The tables to stamp, the user and user_role tables or their staging tables.
 
     Returns:
         bool: True if the timestamps were set successfully, False otherwise.
     """
     try:
-        s_query = f"UPDATE {TABLE_NAME_1} SET date_insertion = '{arrow.utcnow().format('YYYY-MM-DD HH:mm:ss')}'"  # nosec ignore SQL injection here as no input data is being inserted
-        connection.execute(text(s_query))
-        s_query = f"UPDATE {TABLE_NAME_2} SET date_insertion = '{arrow.utcnow().format('YYYY-MM-DD HH:mm:ss')}'"  # nosec ignore SQL injection here as no input data is being inserted
-        connection.execute(text(s_query))
+        for table_name in table_names:
+            s_query = f"UPDATE {table_name} SET date_insertion = '{arrow.utcnow().format('YYYY-MM-DD HH:mm:ss')}'"  # nosec ignore SQL injection here as no input data is being inserted
+            connection.execute(text(s_query))
         connection.commit()
         return True
     except Exception as e:
         connection.rollback()
-        print(f"Error setting timestamps: {e}")
+        logger.exception("Error setting timestamps: %s", e)
         return False
 
 
-def truncate_tables(connection) -> bool:
+def truncate_tables(
+    connection, table_names: Iterable[str] = (TABLE_NAME_1, TABLE_NAME_2)
+) -> bool:
     """Truncate the user and user_role tables.
 
     Args:
         connection: The database connection object.
+        table_names: The tables to truncate, referenced tables first, so they are emptied in reverse order.
 
     Returns:
         bool: True if the tables were truncated successfully, False otherwise.
     """
     try:
-        s_query = f"DELETE FROM {TABLE_NAME_2}"  # nosec ignore SQL injection here as no data is being inserted
-        connection.execute(text(s_query))
-        s_query = f"DELETE FROM {TABLE_NAME_1}"  # nosec ignore SQL injection here as no data is being inserted
-        connection.execute(text(s_query))
+        for table_name in reversed(tuple(table_names)):
+            s_query = f"DELETE FROM {table_name}"  # nosec ignore SQL injection here as no data is being inserted
+            connection.execute(text(s_query))
         connection.commit()
         return True
     except Exception as e:
         connection.rollback()
-        print(f"Error truncating tables: {e}")
+        logger.exception("Error truncating tables: %s", e)
         return False
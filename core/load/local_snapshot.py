@@ -0,0 +1,217 @@
+"""This file is part of the ETL project for PostgreSQL to Turso migration.
+
+It implements the local write path of the full loads. The tables are created in a local SQLite file with the
+definition of the backup tables, loaded there without any network round trip, indexed once loaded, then pushed
+to the backup database in large batches. The pushed rows land in staging tables swapped with the live tables,
+so the backup switches to the new load at once. The local file is kept as a snapshot of the last load.
+
+libsql embedded replicas forward their writes to the remote database, so they cannot take the bulk writes
+themselves: the push copies the rows with multi-row statements instead.
+"""
+
+import logging
+from typing import Iterable
+
+from sqlalchemy import text
+
+from config.default import DATA_KEYS_TABLE, DEAD_LETTERS_TABLE, PUSH_BATCH_SIZE
+from core.helpers.batching import chunked
+from core.load.batch_sizing import get_batch_sizer
+from core.load.data_keys import create_data_keys_table
+from core.load.dead_letters import create_dead_letters_table
+from core.load.iam_gateway import insert_rows, insert_rows_adaptive
+from core.load.schema import (
+    build_staging_indexes,
+    create_staging_tables,
+    swap_staging_tables,
+)
+
+logger = logging.getLogger("__main__")
+
+
+def _get_definitions(connection, object_type: str, table_name: str) -> list[tuple]:
+    """Return the (name, sql) definitions of the tables or indexes of a table."""
+    return connection.execute(
+        text(
+            "SELECT name, sql FROM sqlite_master WHERE type = :type AND tbl_name = :name AND sql IS NOT NULL"
+        ),
+        {"type": object_type, "name": table_name},
+    ).all()
+
+
+def copy_table_definitions(
+    remote_connection, local_connection, table_names: Iterable[str]
+) -> None:
+    """Create in the local file empty tables defined like the backup tables, without their indexes.
+
+    The tables of a previous load are dropped first.
+    Args:
+        remote_connection: The backup database connection object.
+        local_connection: The local file connection object.
+        table_names: The tables to create, referenced tables first.
+    Raises:
+        ValueError: If a table does not exist in the backup database.
+    """
+    table_names = list(table_names)
+    for table_name in reversed(table_names):
+        local_connection.execute(
+            text(
+                f"DROP TABLE IF EXISTS {table_name}"  # nosec ignore SQL injection here as no input data is being inserted
+            )
+        )
+    for table_name in table_names:
+        definitions = _get_definitions(remote_connection, "table", table_name)
+        if not definitions:
+            raise ValueError(f"Table {table_name} does not exist.")
+        local_connection.execute(text(definitions[0][1]))
+    local_connection.commit()
+    logger.info("Local tables created: %s", ", ".join(table_names))
+
+
+def build_local_indexes(
+    remote_connection, local_connection, table_names: Iterable[str]
+) -> None:
+    """Build on the loaded local tables the secondary indexes of the backup tables.
+
+    Args:
+        remote_connection: The backup database connection object.
+        local_connection: The local file connection object.
+        table_names: The indexed tables.
+    """
+    for table_name in table_names:
+        for index_name, ddl in _get_definitions(remote_connection, "index", table_name):
+            local_connection.execute(
+                text(
+                    f"DROP INDEX IF EXISTS {index_name}"  # nosec ignore SQL injection here as no input data is being inserted
+                )
+            )
+            local_connection.execute(text(ddl))
+    local_connection.commit()
+    logger.info("Local indexes built")
+
+
+def _copy_rows(
+    local_connection,
+    remote_connection,
+    source_table: str,
+    target_table: str,
+    batch_size: int,
+    conflict_columns: tuple[str, ...] = (),
+) -> int:
+    """Copy every row of a local table to a table of the backup database, committing each batch.
+
+    The batches are sized from the latency of the previous ones when LOAD_BATCH_ADAPTIVE is enabled,
+    `batch_size` being their initial size.
+    """
+    result = local_connection.execute(
+        text(
+            f"SELECT * FROM {source_table}"  # nosec ignore SQL injection here as no input data is being inserted
+        )
+    )
+    columns = tuple(result.keys())
+    sizer = get_batch_sizer(f"push_{source_table}", batch_size)
+    copied = 0
+    for batch in sizer.batches(result) if sizer else chunked(result, batch_size):
+        if sizer:
+            copied += insert_rows_adaptive(
+                remote_connection,
+                target_table,
+                columns,
+                batch,
+                sizer,
+                conflict_columns=conflict_columns,
+            )
+        else:
+            copied += insert_rows(
+                remote_connection,
+                target_table,
+                columns,
+                batch,
+                conflict_columns=conflict_columns,
+            )
+        remote_connection.commit()
+    if sizer:
+        sizer.log_settled()
+    return copied
+
+
+def push_data_keys(local_connection, remote_connection) -> int:
+    """Copy the data keys stored in the local file to the backup database, the known keys being kept.
+
+    Args:
+        local_connection: The local file connection object.
+        remote_connection: The backup database connection object.
+    Returns:
+        int: The number of data keys copied.
+    """
+    create_data_keys_table(local_connection)
+    create_data_keys_table(remote_connection)
+    return _copy_rows(
+        local_connection,
+        remote_connection,
+        DATA_KEYS_TABLE,
+        DATA_KEYS_TABLE,
+        PUSH_BATCH_SIZE,
+        ("key_id",),
+    )
+
+
+def push_dead_letters(local_connection, remote_connection) -> int:
+    """Move the rows rejected by the local file to the dead-letter table of the backup database.
+
+    Args:
+        local_connection: The local file connection object.
+        remote_connection: The backup database connection object.
+    Returns:
+        int: The number of rejected rows moved.
+    """
+    create_dead_letters_table(local_connection)
+    create_dead_letters_table(remote_connection)
+    moved = _copy_rows(
+        local_connection,
+        remote_connection,
+        DEAD_LETTERS_TABLE,
+        DEAD_LETTERS_TABLE,
+        PUSH_BATCH_SIZE,
+        ("letter_id",),
+    )
+    local_connection.execute(
+        text(
+            f"DELETE FROM {DEAD_LETTERS_TABLE}"  # nosec ignore SQL injection here as no input data is being inserted
+        )
+    )
+    local_connection.commit()
+    return moved
+
+
+def push_tables(
+    local_connection,
+    remote_connection,
+    table_names: Iterable[str],
+    batch_size: int = PUSH_BATCH_SIZE,
+) -> dict[str, int]:
+    """Replace the backup tables by the tables of the local file.
+
+    The data keys and the rejected rows are pushed first, then the rows are copied to staging tables, indexed and swapped with the
+    live tables in one transaction.
+    Args:
+        local_connection: The local file connection object.
+        remote_connection: The backup database connection object.
+        table_names: The pushed tables, referenced tables first.
+        batch_size: The number of rows written per statement.
+    Returns:
+        dict[str, int]: The number of rows pushed per table.
+    """
+    table_names = list(table_names)
+    push_data_keys(local_connection, remote_connection)
+    push_dead_letters(local_connection, remote_connection)
+    staging_tables = create_staging_tables(remote_connection, table_names)
+    counts = {}
+    for table_name, staging_table in zip(table_names, staging_tables):
+        counts[table_name] = _copy_rows(
+            local_connection, remote_connection, table_name, staging_table, batch_size
+        )
+        logger.info("%d rows of %s pushed", counts[table_name], table_name)
+    build_staging_indexes(remote_connection, table_names)
+    swap_staging_tables(remote_connection, table_names)
+    return counts
@@ -0,0 +1,404 @@
+"""This file is part of the ETL project for PostgreSQL to Turso migration.
+
+It manages the schema of the backup database. The destination tables of the mappings are created when
+they are missing and checked against their mapping otherwise. A full load writes into staging tables created
+like the live ones, builds their indexes, then swaps them with the live tables in one transaction,
+so readers never see an empty or partially loaded backup. A load into the live tables drops their secondary
+indexes first and rebuilds them at the end. The loads run under the BULK_LOAD_PRAGMAS the backend accepts,
+and the loaded tables are analyzed, so the query planner knows their new statistics.
+"""
+
+import json
+import logging
+import re
+from contextlib import contextmanager
+from typing import Iterable
+
+from sqlalchemy import text
+
+from config.default import BULK_LOAD_PRAGMAS
+from core.load.iam_gateway import _UPSERT_CONSTANT_VALUES
+from core.mapping.tables import TableMapping
+from core.sync.state import create_sync_state_table, get_state, set_state
+
+logger = logging.getLogger("__main__")
+
+_DEFERRED_INDEXES_STATE_KEY = "full_load.deferred_indexes"
+_COLUMN_TYPES = {"int": "INTEGER", "float": "REAL", "raw": ""}
+
+STAGING_SUFFIX = "__staging"
+OLD_SUFFIX = "__old"
+
+
+def staging_table_name(table_name: str) -> str:
+    """Return the name of the staging table of a table."""
+    return f"{table_name}{STAGING_SUFFIX}"
+
+
+def _old_table_name(table_name: str) -> str:
+    """Return the name a live table is renamed to when it is swapped out."""
+    return f"{table_name}{OLD_SUFFIX}"
+
+
+def _staging_index_name(index_name: str) -> str:
+    """Return the name of the copy of an index built on a staging table.
+
+    Index names cannot be renamed, so the generations alternate between the names with and without the suffix.
+    """
+    if index_name.endswith(STAGING_SUFFIX):
+        return index_name[: -len(STAGING_SUFFIX)]
+    return f"{index_name}{STAGING_SUFFIX}"
+
+
+def _rename_in_ddl(
+    ddl: str, pattern: str, old_name: str, new_name: str, count: int = 1
+) -> str:
+    """Replace the name following a DDL keyword pattern, quoted or not, by a new name."""
+    return re.sub(
+        rf'(\b{pattern}\s+)(["`\[]?){re.escape(old_name)}(["`\]]?)(?!\w)',
+        lambda match: f"{match.group(1)}{new_name}",
+        ddl,
+        count=count,
+        flags=re.IGNORECASE,
+    )
+
+
+def _drop_table(connection, table_name: str) -> None:
+    """Drop a table if it exists."""
+    connection.execute(
+        text(
+            f"DROP TABLE IF EXISTS {table_name}"  # nosec ignore SQL injection here as no input data is being inserted
+        )
+    )
+
+
+def staging_tables_exist(connection, table_names: Iterable[str]) -> bool:
+    """Tell whether the staging tables of every given live table exist, left by an interrupted load.
+
+    Args:
+        connection: The database connection object.
+        table_names: The live tables.
+    Returns:
+        bool: True if every staging table exists.
+    """
+    staging_names = {staging_table_name(table_name) for table_name in table_names}
+    existing_names = connection.execute(
+        text("SELECT name FROM sqlite_master WHERE type = 'table'")
+    ).scalars()
+    return staging_names <= set(existing_names)
+
+
+def create_staging_tables(connection, table_names: Iterable[str]) -> list[str]:
+    """Create empty staging tables with the same definition as the live tables, without their indexes.
+
+    The foreign keys between the given tables reference the staging tables, so the parent tables must come first.
+    The leftovers of an interrupted load are dropped first.
+    Args:
+        connection: The database connection object.
+        table_names: The live tables to create a staging table for.
+    Returns:
+        list[str]: The names of the staging tables, in the order of `table_names`.
+    """
+    table_names = list(table_names)
+    for table_name in reversed(table_names):
+        _drop_table(connection, staging_table_name(table_name))
+        _drop_table(connection, _old_table_name(table_name))
+    staging_names = []
+    for table_name in table_names:
+        ddl = connection.execute(
+            text("SELECT sql FROM sqlite_master WHERE type = 'table' AND name = :name"),
+            {"name": table_name},
+        ).scalar()
+        if ddl is None:
+            raise ValueError(f"Table {table_name} does not exist.")
+        staging_name = staging_table_name(table_name)
+        ddl = _rename_in_ddl(ddl, "CREATE TABLE", table_name, staging_name)
+        for referenced_name in table_names:
+            ddl = _rename_in_ddl(
+                ddl,
+                "REFERENCES",
+                referenced_name,
+                staging_table_name(referenced_name),
+                count=0,
+            )
+        connection.execute(text(ddl))
+        staging_names.append(staging_name)
+    connection.commit()
+    logger.info("Staging tables created: %s", ", ".join(staging_names))
+    return staging_names
+
+
+def build_staging_indexes(connection, table_names: Iterable[str]) -> None:
+    """Build on the staging tables the secondary indexes of the live tables.
+
+    Indexes are built once the staging tables are loaded, which is cheaper than maintaining them row by row.
+    Args:
+        connection: The database connection object.
+        table_names: The live tables whose staging table is indexed.
+    """
+    for table_name in table_names:
+        indexes = connection.execute(
+            text(
+                "SELECT name, sql FROM sqlite_master WHERE type = 'index' AND tbl_name = :name AND sql IS NOT NULL"
+            ),
+            {"name": table_name},
+        ).all()
+        for index_name, ddl in indexes:
+            ddl = _rename_in_ddl(
+                ddl,
+                r"INDEX(?:\s+IF\s+NOT\s+EXISTS)?",
+                index_name,
+                _staging_index_name(index_name),
+            )
+            ddl = _rename_in_ddl(ddl, "ON", table_name, staging_table_name(table_name))
+            connection.execute(text(ddl))
+    connection.commit()
+    logger.info("Staging indexes built")
+
+
+def swap_staging_tables(connection, table_names: Iterable[str]) -> None:
+    """Replace the live tables by their staging tables in one transaction, then drop the old tables.
+
+    Renaming a table rewrites the foreign keys referencing it, so the references between staging tables
+    end up on the live names. Tables referencing a swapped table must be swapped along with it.
+    Args:
+        connection: The database connection object.
+        table_names: The live tables to replace by their staging table.
+    """
+    table_names = list(table_names)
+    connection.commit()
+    try:
+        # Most SQLite drivers run DDL outside of any implicit transaction, so it is opened explicitly
+        connection.execute(text("BEGIN"))
+        for table_name in table_names:
+            connection.execute(
+                text(
+                    f"ALTER TABLE {table_name} RENAME TO {_old_table_name(table_name)}"  # nosec ignore SQL injection here as no input data is being inserted
+                )
+            )
+            connection.execute(
+                text(
+                    f"ALTER TABLE {staging_table_name(table_name)} RENAME TO {table_name}"  # nosec ignore SQL injection here as no input data is being inserted
+                )
+            )
+        connection.commit()
+    except Exception:
+        connection.rollback()
+        raise
+    logger.info("Staging tables swapped in: %s", ", ".join(table_names))
+
+    for table_name in reversed(table_names):
+        _drop_table(connection, _old_table_name(table_name))
+    connection.commit()
+    logger.info("Previous tables dropped")
+
+
+def _get_columns(connection, table_name: str) -> list[str]:
+    """Return the column names of a table, an empty list if it does not exist."""
+    return [
+        column[1]
+        for column in connection.execute(
+            text(
+                f"PRAGMA table_info({table_name})"  # nosec ignore SQL injection here as no input data is being inserted
+            )
+        )
+    ]
+
+
+def _build_create_table(mapping: TableMapping) -> str:
+    """Build the statement creating the destination table of a mapping, typed from the value conversions."""
+    definitions = []
+    for column in mapping.columns:
+        column_type = _COLUMN_TYPES.get(column.convert, "TEXT")
+        definition = f"{column.destination} {column_type}".rstrip()
+        if column.destination == mapping.destination_key:
+            definition += " PRIMARY KEY"
+        definitions.append(definition)
+    for name, _ in mapping.constants + _UPSERT_CONSTANT_VALUES:
+        definitions.append(f"{name} TEXT")
+    return f"CREATE TABLE IF NOT EXISTS {mapping.destination_table} ({', '.join(definitions)})"
+
+
+def ensure_destination_schema(connection, mappings: Iterable[TableMapping]) -> None:
+    """Create the missing destination tables of the mappings, and check that the others have their columns.
+
+    Args:
+        connection: The database connection object.
+        mappings: The mappings of the loaded tables.
+    Raises:
+        ValueError: If an existing table lacks columns written by its mapping.
+    """
+    for mapping in mappings:
+        columns = _get_columns(connection, mapping.destination_table)
+        if not columns:
+            connection.execute(text(_build_create_table(mapping)))
+            logger.info("Table %s created", mapping.destination_table)
+            continue
+        expected = mapping.destination_columns + tuple(
+            name for name, _ in mapping.constants + _UPSERT_CONSTANT_VALUES
+        )
+        missing = [column for column in expected if column not in columns]
+        if missing:
+            raise ValueError(
+                f"Table {mapping.destination_table} lacks the columns {', '.join(missing)}."
+            )
+    connection.commit()
+
+
+def _get_secondary_indexes(connection, table_name: str) -> list[tuple[str, str]]:
+    """Return the (name, sql) definitions of the non-unique indexes created on a table."""
+    indexes = connection.execute(
+        text(
+            "SELECT name, sql FROM sqlite_master WHERE type = 'index' AND tbl_name = :name AND sql IS NOT NULL"
+        ),
+        {"name": table_name},
+    ).all()
+    return [
+        (index_name, ddl)
+        for index_name, ddl in indexes
+        if not re.match(r"\s*CREATE\s+UNIQUE\b", ddl, flags=re.IGNORECASE)
+    ]
+
+
+def drop_secondary_indexes(connection, table_names: Iterable[str]) -> list[str]:
+    """Drop the non-unique indexes of tables before loading them, and commit it.
+
+    The definitions of the indexes are committed in the sync-state table before they are dropped, so the
+    indexes of an interrupted load are still rebuilt by `rebuild_secondary_indexes`. The unique indexes are
+    kept, as they guard the upserts.
+    Args:
+        connection: The database connection object.
+        table_names: The loaded tables.
+    Returns:
+        list[str]: The names of the deferred indexes, including those of an interrupted load.
+    """
+    create_sync_state_table(connection)
+    saved = get_state(connection, _DEFERRED_INDEXES_STATE_KEY)
+    indexes = json.loads(saved) if saved else []
+    known_names = {index_name for index_name, _ in indexes}
+    for table_name in table_names:
+        for index_name, ddl in _get_secondary_indexes(connection, table_name):
+            if index_name not in known_names:
+                indexes.append([index_name, ddl])
+    set_state(connection, _DEFERRED_INDEXES_STATE_KEY, json.dumps(indexes))
+    connection.commit()
+    for index_name, _ in indexes:
+        connection.execute(
+            text(
+                f"DROP INDEX IF EXISTS {index_name}"  # nosec ignore SQL injection here as no input data is being inserted
+            )
+        )
+    connection.commit()
+    if indexes:
+        logger.info(
+            "Indexes deferred: %s", ", ".join(index_name for index_name, _ in indexes)
+        )
+    return [index_name for index_name, _ in indexes]
+
+
+def rebuild_secondary_indexes(connection) -> list[str]:
+    """Rebuild the indexes dropped by `drop_secondary_indexes`, and commit it.
+
+    Args:
+        connection: The database connection object.
+    Returns:
+        list[str]: The names of the rebuilt indexes.
+    """
+    create_sync_state_table(connection)
+    saved = get_state(connection, _DEFERRED_INDEXES_STATE_KEY)
+    if not saved:
+        return []
+    existing_names = set(
+        connection.execute(
+            text("SELECT name FROM sqlite_master WHERE type = 'index'")
+        ).scalars()
+    )
+    rebuilt = []
+    for index_name, ddl in json.loads(saved):
+        if index_name not in existing_names:
+            connection.execute(text(ddl))
+            rebuilt.append(index_name)
+    set_state(connection, _DEFERRED_INDEXES_STATE_KEY, None)
+    connection.commit()
+    if rebuilt:
+        logger.info("Indexes rebuilt: %s", ", ".join(rebuilt))
+    return rebuilt
+
+
+def _parse_pragmas(pragmas: str) -> list[tuple[str, str]]:
+    """Parse a comma-separated list of `name=value` PRAGMA settings."""
+    return [
+        tuple(part.strip() for part in setting.split("=", 1))
+        for setting in pragmas.split(",")
+        if "=" in setting
+    ]
+
+
+@contextmanager
+def bulk_load_pragmas(connection, pragmas: str = BULK_LOAD_PRAGMAS):
+    """Apply PRAGMA settings to a connection for the duration of a bulk load, then restore their values.
+
+    The settings the backend refuses, such as those of a remote Turso database, are skipped.
+    Args:
+        connection: The database connection object.
+        pragmas: The comma-separated `name=value` settings, such as 'synchronous=OFF,temp_store=MEMORY'.
+    """
+    connection.commit()
+    previous = []
+    for name, value in _parse_pragmas(pragmas):
+        try:
+            current = connection.execute(
+                text(
+                    f"PRAGMA {name}"  # nosec ignore SQL injection here as the settings are not input data
+                )
+            ).scalar()
+            connection.execute(
+                text(
+                    f"PRAGMA {name} = {value}"  # nosec ignore SQL injection here as the settings are not input data
+                )
+            )
+        except Exception as e:
+            logger.debug("PRAGMA %s is not applied: %s", name, e)
+            continue
+        if current is not None:
+            previous.append((name, current))
+    if previous:
+        logger.info(
+            "Bulk load PRAGMAs applied: %s", ", ".join(name for name, _ in previous)
+        )
+    try:
+        yield
+    finally:
+        for name, value in previous:
+            try:
+                connection.execute(
+                    text(
+                        f"PRAGMA {name} = {value}"  # nosec ignore SQL injection here as the settings are not input data
+                    )
+                )
+            except Exception as e:
+                logger.warning("PRAGMA %s could not be restored: %s", name, e)
+
+
+def analyze_tables(connection, table_names: Iterable[str]) -> None:
+    """Refresh the query planner statistics of loaded tables, and commit it.
+
+    The statistics only speed up the queries, so a backend refusing ANALYZE does not fail the load.
+    Args:
+        connection: The database connection object.
+        table_names: The loaded tables.
+    """
+    table_names = list(table_names)
+    try:
+        for table_name in table_names:
+            connection.execute(
+                text(
+                    f"ANALYZE {table_name}"  # nosec ignore SQL injection here as no input data is being inserted
+                )
+            )
+        connection.commit()
+    except Exception as e:
+        connection.rollback()
+        logger.warning("The tables could not be analyzed: %s", e)
+        return
+    logger.info("Tables analyzed: %s", ", ".join(table_names))
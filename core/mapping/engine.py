@@ -0,0 +1,338 @@
+"""This module copies any table declared by a TableMapping with one generic batched code path.
+
+The extract statement of a mapping is generated once and cached, like the multi-row INSERT statements
+of `build_insert_query`. The rows are read as tuples through a server-side cursor, converted and encrypted
+a whole batch at a time, and written with one parameterized multi-row statement per batch.
+"""
+
+import logging
+from functools import lru_cache
+from typing import Callable, Iterable, Iterator
+
+from sqlalchemy import TextClause, text
+
+from config.default import (
+    EXTRACT_FETCH_SIZE,
+    EXTRACT_PARTITIONS,
+    LOAD_BATCH_SIZE,
+)
+from core.extract.partitioned import iter_partitioned
+from core.extract.queries import (
+    query_parameters,
+    select_high_water_mark,
+    where_clause,
+)
+from core.helpers.batching import chunked
+from core.helpers.common_sql import encode_ciphertexts
+from core.helpers.metrics import metrics
+from core.load.batch_sizing import AdaptiveBatchSizer
+from core.load.iam_gateway import (
+    _UPSERT_CONSTANT_VALUES,
+    insert_rows_adaptive,
+    insert_rows_isolating,
+    prepare_data_key,
+)
+from core.mapping.tables import TableMapping
+from core.rsa_encrypt_decrypt.rsa_manager import (
+    DataKey,
+    encrypt_many,
+    envelope_encrypt_many,
+)
+
+logger = logging.getLogger("__main__")
+
+
+@lru_cache(maxsize=64)
+def build_extract_query(
+    mapping: TableMapping,
+    since: bool = False,
+    lower: bool = False,
+    upper: bool = False,
+) -> TextClause:
+    """Build the statement reading the mapped columns of a source table.
+
+    Statements are cached per mapping and per shape of their WHERE clause.
+    Args:
+        mapping: The mapping of the table.
+        since: Whether the rows are filtered by the :since high-water mark.
+        lower: Whether the rows are filtered by the :lower bound of a key range.
+        upper: Whether the rows are filtered by the :upper bound of a key range.
+    Returns:
+        TextClause: The statement, to execute with the parameters of `query_parameters`.
+    """
+    key_range = (0 if lower else None, 0 if upper else None)
+    return text(
+        f"SELECT {', '.join(mapping.source_columns)} FROM {mapping.source_table}"  # nosec ignore SQL injection risk, as the input data is sanitized
+        + where_clause(
+            list(mapping.watermark_fields), 0 if since else None, key_range, mapping.key
+        )
+    )
+
+
+def iter_rows(
+    connection,
+    mapping: TableMapping,
+    fetch_size: int = EXTRACT_FETCH_SIZE,
+    since=None,
+    key_range=None,
+) -> Iterator[tuple]:
+    """Stream the mapped columns of the rows of a source table.
+
+    Args:
+        connection: The source database connection object.
+        mapping: The mapping of the table.
+        fetch_size: The number of rows fetched from the server per round trip.
+        since: Only stream the rows whose watermark fields are greater or equal to this high-water mark.
+        key_range: Only stream the rows whose key is within this (lower included, upper excluded) range.
+    Yields:
+        tuple: The source values of every row, ordered like the columns of the mapping.
+    """
+    lower, upper = key_range if key_range is not None else (None, None)
+    query = build_extract_query(
+        mapping, since is not None, lower is not None, upper is not None
+    )
+    yield from connection.execute(
+        query.execution_options(stream_results=True, yield_per=fetch_size),
+        query_parameters(since, key_range),
+    )
+    logger.info("Rows of %s have been retrieved", mapping.source_table)
+
+
+def iter_keys(
+    connection, mapping: TableMapping, fetch_size: int = EXTRACT_FETCH_SIZE
+) -> Iterator:
+    """Stream the keys of all the rows of a source table.
+
+    Args:
+        connection: The source database connection object.
+        mapping: The mapping of the table.
+        fetch_size: The number of keys fetched from the server per round trip.
+    Yields:
+        The key of every row.
+    """
+    yield from connection.execute(
+        text(
+            f"SELECT {mapping.key} FROM {mapping.source_table}"  # nosec ignore SQL injection risk, as the input data is sanitized
+        ).execution_options(stream_results=True, yield_per=fetch_size)
+    ).scalars()
+
+
+def get_high_water_mark(connection, mapping: TableMapping):
+    """Return the high-water mark of a source table.
+
+    Args:
+        connection: The source database connection object.
+        mapping: The mapping of the table, declaring its watermark fields.
+    Returns:
+        The greatest value of the watermark fields, None if the table is empty.
+    """
+    return select_high_water_mark(
+        connection, mapping.source_table, list(mapping.watermark_fields)
+    )
+
+
+@lru_cache(maxsize=64)
+def build_page_query(mapping: TableMapping, after: bool = False) -> TextClause:
+    """Build the statement reading a page of a source table ordered by its key, for keyset pagination.
+
+    Args:
+        mapping: The mapping of the table.
+        after: Whether the page starts after the :after key, instead of at the first key.
+    Returns:
+        TextClause: The statement, to execute with the :after key and the :limit number of rows.
+    """
+    where = f" WHERE {mapping.key} > :after" if after else ""
+    return text(
+        f"SELECT {', '.join(mapping.source_columns)} FROM {mapping.source_table}{where} ORDER BY {mapping.key} LIMIT :limit"  # nosec ignore SQL injection risk, as the input data is sanitized
+    )
+
+
+def iter_row_pages(
+    connection, mapping: TableMapping, after=None, page_size: int = LOAD_BATCH_SIZE
+) -> Iterator[list[tuple]]:
+    """Stream the rows of a source table by pages ordered by key, starting after a key.
+
+    Every page is read by its own indexed range query, so a read can resume from any key.
+    Args:
+        connection: The source database connection object.
+        mapping: The mapping of the table.
+        after: The key to start after, the first key when None.
+        page_size: The number of rows of a page.
+    Yields:
+        list[tuple]: The source rows of every page, ordered like the columns of the mapping.
+    """
+    key_index = mapping.source_columns.index(mapping.key)
+    while True:
+        page = connection.execute(
+            build_page_query(mapping, after is not None),
+            {"after": after, "limit": page_size},
+        ).all()
+        if not page:
+            break
+        yield page
+        if len(page) < page_size:
+            break
+        after = page[-1][key_index]
+    logger.info("Rows of %s have been retrieved", mapping.source_table)
+
+
+def iter_rows_partitioned(
+    pgsql_db_manager,
+    mapping: TableMapping,
+    partitions: int = EXTRACT_PARTITIONS,
+    extract: Callable[..., Iterator[tuple]] = iter_rows,
+) -> Iterator[tuple]:
+    """Stream the rows of a source table read concurrently by key ranges from a single snapshot.
+
+    Args:
+        pgsql_db_manager: The PgSQLDBConnectionManager of the source database.
+        mapping: The mapping of the table.
+        partitions: The number of key ranges read concurrently.
+        extract: The function streaming the rows of a key range, `iter_rows` or `iter_rows_copy`.
+    Yields:
+        tuple: The source values of every row, ordered like the columns of the mapping.
+    """
+    yield from iter_partitioned(
+        pgsql_db_manager,
+        mapping.source_table,
+        lambda connection, key_range: extract(connection, mapping, key_range=key_range),
+        partitions,
+        key_column=mapping.key,
+    )
+
+
+def to_destination_rows(
+    mapping: TableMapping,
+    rows: Iterable[tuple],
+    to_encrypt_database: bool = False,
+    data_key: DataKey | None = None,
+) -> list[tuple]:
+    """Convert a batch of source rows to the rows written in the backup DB.
+
+    The encrypted columns of the whole batch are encrypted with a single call.
+    Args:
+        mapping: The mapping of the table.
+        rows: The source rows, ordered like the columns of the mapping.
+        to_encrypt_database: Whether to encrypt the encrypted columns of the mapping.
+        data_key: The data key of the envelope encryption, the values are encrypted with RSA when None.
+    Returns:
+        list[tuple]: The destination rows, ordered like the destination columns of the mapping.
+    """
+    converters = mapping.converters
+    converted = [
+        [convert(value) for convert, value in zip(converters, row)] for row in rows
+    ]
+    if not to_encrypt_database or not mapping.encrypted_indexes:
+        return [tuple(row) for row in converted]
+
+    positions = [
+        (row, index)
+        for row in converted
+        for index in mapping.encrypted_indexes
+        if row[index] is not None
+    ]
+    plain_values = [str(row[index]) for row, index in positions]
+    with metrics.timer("encryption_seconds"):
+        encrypted_values = (
+            envelope_encrypt_many(plain_values, data_key)
+            if data_key is not None
+            else encrypt_many(plain_values, "rsa_keys")
+        )
+    for (row, index), value in zip(positions, encode_ciphertexts(encrypted_values)):
+        row[index] = value
+    return [tuple(row) for row in converted]
+
+
+def insert_mapped_rows(
+    connection,
+    mapping: TableMapping,
+    rows: list[tuple],
+    upsert: bool = False,
+    table_name: str | None = None,
+    sizer: AdaptiveBatchSizer | None = None,
+) -> int:
+    """Insert a batch of rows built by `to_destination_rows` in the destination table of a mapping.
+
+    The rows rejected by the database are moved to the dead-letter table instead of failing the batch.
+
+    Args:
+        connection: The backup database connection object.
+        mapping: The mapping of the table.
+        rows: The destination rows to insert.
+        upsert: Whether to update the rows already recorded and stamp the written rows.
+        table_name: The table to insert into, the destination table of the mapping by default.
+        sizer: The batch sizer splitting the rows into statements, a single statement when None.
+    Returns:
+        int: The number of rows inserted.
+    """
+    constant_values = mapping.constants
+    conflict_columns = ()
+    if upsert:
+        constant_values += _UPSERT_CONSTANT_VALUES
+        conflict_columns = (mapping.destination_key,)
+    if sizer is not None:
+        return insert_rows_adaptive(
+            connection,
+            table_name or mapping.destination_table,
+            mapping.destination_columns,
+            rows,
+            sizer,
+            constant_values,
+            conflict_columns,
+        )
+    return insert_rows_isolating(
+        connection,
+        table_name or mapping.destination_table,
+        mapping.destination_columns,
+        rows,
+        constant_values,
+        conflict_columns,
+    )
+
+
+def record_rows(
+    connection,
+    mapping: TableMapping,
+    rows: Iterable[tuple],
+    commit: bool = True,
+    to_encrypt_database: bool = False,
+    batch_size: int = LOAD_BATCH_SIZE,
+    upsert: bool = False,
+    data_key: DataKey | None = None,
+    table_name: str | None = None,
+) -> int:
+    """Record the source rows of a table in the backup database by batches.
+
+    With the 'envelope' ENCRYPTION_MODE, a data key is generated and stored for the call unless one is given.
+    Args:
+        connection: The backup database connection object.
+        mapping: The mapping of the table.
+        rows: A list or an iterator of source rows, ordered like the columns of the mapping.
+        commit: Whether to commit the transaction after inserting the rows.
+        to_encrypt_database: Whether to encrypt the encrypted columns of the mapping.
+        batch_size: The maximum number of rows inserted per statement.
+        upsert: Whether to update the rows already recorded and stamp the written rows.
+        data_key: The data key of the envelope encryption, already stored in the database.
+        table_name: The table to insert into, the destination table of the mapping by default.
+    Returns:
+        int: The number of rows recorded.
+    """
+    to_encrypt_database = to_encrypt_database and bool(mapping.encrypted_indexes)
+    recorded = 0
+    for batch in chunked(rows, batch_size):
+        if data_key is None:
+            data_key = prepare_data_key(connection, to_encrypt_database)
+        recorded += insert_mapped_rows(
+            connection,
+            mapping,
+            to_destination_rows(mapping, batch, to_encrypt_database, data_key),
+            upsert,
+            table_name,
+        )
+
+    if commit:
+        connection.commit()
+    logger.info(
+        "%d rows recorded in %s", recorded, table_name or mapping.destination_table
+    )
+    return recorded
@@ -0,0 +1,271 @@
+"""This module describes the tables copied from the source database to the backup database.
+
+Every table is declared by a TableMapping listing its source and destination tables, its key, its columns,
+the columns encrypted in the backup and the conversion applied to every value. The default mappings are
+built from the TABLE_NAME_* and FIELD_NAME_* settings. When TABLE_MAPPINGS_FILE is set, the mappings are read
+from that TOML file instead, so a table is added by declaring it, without writing code:
+
+    [[tables]]
+    name = "users"
+    source_table = "iam_user"
+    destination_table = "iam_user"
+    key = "id"
+    constants = { password = "'ABCD123.4'" }
+    columns = ["id", { source = "email", encrypted = true }, { source = "active", convert = "int" }]
+
+The tables are loaded in the order of their declaration, so referenced tables must come first.
+"""
+
+import tomllib
+from datetime import date, datetime, time
+from functools import cache, cached_property
+from typing import Callable
+
+from config.default import (
+    FIELD_NAME_1,
+    FIELD_NAME_2,
+    FIELD_NAME_3,
+    FIELD_NAME_4,
+    FIELD_NAME_5,
+    FIELD_NAME_6,
+    FIELD_NAME_7,
+    FIELD_NAME_8,
+    FIELD_NAME_9,
+    FIELD_NAME_10,
+    FIELD_NAME_11,
+    FIELD_NAME_12,
+    FIELD_NAME_13,
+    FIELD_NAME_14,
+    SYNC_WATERMARK_FIELDS_1,
+    SYNC_WATERMARK_FIELDS_2,
+    TABLE_MAPPINGS_FILE,
+    TABLE_NAME_1,
+    TABLE_NAME_2,
+)
+
+
+def _to_str(value):
+    """Convert a value to its string representation, the storage of the historical backups."""
+    return None if value is None else str(value)
+
+
+def _to_int(value):
+    """Convert a value, such as a boolean, to an integer."""
+    return None if value is None else int(value)
+
+
+def _to_float(value):
+    """Convert a value, such as a decimal, to a float."""
+    return None if value is None else float(value)
+
+
+def _to_isoformat(value):
+    """Convert a date or a time to its ISO 8601 representation, any other value to a string."""
+    if isinstance(value, (date, datetime, time)):
+        return value.isoformat()
+    return _to_str(value)
+
+
+def _unchanged(value):
+    """Return a value unchanged, for the types bound natively by the backup database driver."""
+    return value
+
+
+CONVERTERS: dict[str, Callable] = {
+    "str": _to_str,
+    "int": _to_int,
+    "float": _to_float,
+    "isoformat": _to_isoformat,
+    "raw": _unchanged,
+}
+
+
+class ColumnMapping:
+    """ColumnMapping class to describe how a source column is copied to a destination column."""
+
+    __slots__ = ("source", "destination", "encrypted", "convert")
+
+    def __init__(
+        self,
+        source: str,
+        destination: str | None = None,
+        encrypted: bool = False,
+        convert: str = "str",
+    ):
+        """Initialize the mapping of a column, copied to a column of the same name by default.
+
+        Raises:
+            ValueError: If the conversion is unknown.
+        """
+        if convert not in CONVERTERS:
+            raise ValueError(f"Unknown conversion {convert} for the column {source}.")
+        self.source = source
+        self.destination = destination or source
+        self.encrypted = encrypted
+        self.convert = convert
+
+    @classmethod
+    def from_config(cls, column: str | dict) -> "ColumnMapping":
+        """Build a column mapping from a column name or a table of the mappings file."""
+        if isinstance(column, str):
+            return cls(column)
+        return cls(**column)
+
+    def __repr__(self) -> str:
+        """Return a string representation of the ColumnMapping instance."""
+        return f"ColumnMapping(source={self.source}, destination={self.destination}, encrypted={self.encrypted}, convert={self.convert})"
+
+
+class TableMapping:
+    """TableMapping class to describe how a source table is copied to a destination table."""
+
+    def __init__(
+        self,
+        name: str,
+        source_table: str,
+        destination_table: str,
+        columns: tuple[ColumnMapping, ...],
+        key: str = "id",
+        constants: tuple[tuple[str, str], ...] = (),
+        watermark_fields: tuple[str, ...] = (),
+    ):
+        """Initialize the mapping of a table.
+
+        Args:
+            name: The short name of the table, used in the logs and the metrics.
+            source_table: The table read from the source database.
+            destination_table: The table written in the backup database.
+            columns: The copied columns.
+            key: The source column identifying a row, one of the copied columns.
+            constants: Extra (destination column, SQL literal) pairs set on every written row.
+            watermark_fields: The source columns compared to the high-water mark of an incremental sync.
+        Raises:
+            ValueError: If the key is not a copied column.
+        """
+        self.name = name
+        self.source_table = source_table
+        self.destination_table = destination_table
+        self.columns = tuple(columns)
+        self.key = key
+        self.constants = tuple(constants)
+        self.watermark_fields = tuple(watermark_fields)
+        if key not in self.source_columns:
+            raise ValueError(f"The key {key} of the table {name} is not mapped.")
+
+    @classmethod
+    def from_config(cls, table: dict) -> "TableMapping":
+        """Build a table mapping from a table of the mappings file.
+
+        Raises:
+            ValueError: If a required setting is missing or a column is invalid.
+        """
+        try:
+            return cls(
+                name=table["name"],
+                source_table=table["source_table"],
+                destination_table=table.get("destination_table", table["source_table"]),
+                columns=tuple(
+                    ColumnMapping.from_config(column) for column in table["columns"]
+                ),
+                key=table.get("key", "id"),
+                constants=tuple(table.get("constants", {}).items()),
+                watermark_fields=tuple(table.get("watermark_fields", ())),
+            )
+        except (KeyError, TypeError) as e:
+            raise ValueError(f"Invalid table mapping {table.get('name')}: {e}") from e
+
+    @cached_property
+    def source_columns(self) -> tuple[str, ...]:
+        """Return the source columns, in the order of the mapping."""
+        return tuple(column.source for column in self.columns)
+
+    @cached_property
+    def destination_columns(self) -> tuple[str, ...]:
+        """Return the destination columns, in the order of the mapping."""
+        return tuple(column.destination for column in self.columns)
+
+    @cached_property
+    def destination_key(self) -> str:
+        """Return the destination column of the key."""
+        return self.columns[self.source_columns.index(self.key)].destination
+
+    @cached_property
+    def encrypted_indexes(self) -> tuple[int, ...]:
+        """Return the positions of the encrypted columns."""
+        return tuple(
+            index for index, column in enumerate(self.columns) if column.encrypted
+        )
+
+    @cached_property
+    def converters(self) -> tuple[Callable, ...]:
+        """Return the conversion function of every column, in the order of the mapping."""
+        return tuple(CONVERTERS[column.convert] for column in self.columns)
+
+    def __repr__(self) -> str:
+        """Return a string representation of the TableMapping instance."""
+        return f"TableMapping(name={self.name}, source_table={self.source_table}, destination_table={self.destination_table}, key={self.key})"
+
+
+def default_table_mappings() -> tuple[TableMapping, ...]:
+    """Return the mappings of the user and user role tables, built from the TABLE_NAME_* and FIELD_NAME_* settings."""
+    users = TableMapping(
+        name="users",
+        source_table=TABLE_NAME_1,
+        destination_table=TABLE_NAME_1,
+        columns=(
+            ColumnMapping("id", FIELD_NAME_1),
+            ColumnMapping(FIELD_NAME_2, encrypted=True),
+            ColumnMapping(FIELD_NAME_3, encrypted=True),
+            ColumnMapping(FIELD_NAME_4),
+            ColumnMapping(FIELD_NAME_5, encrypted=True),
+            ColumnMapping(FIELD_NAME_6),
+            ColumnMapping(FIELD_NAME_7),
+            ColumnMapping(FIELD_NAME_8),
+            ColumnMapping(FIELD_NAME_9),
+            ColumnMapping(FIELD_NAME_10),
+        ),
+        constants=(("password", "'ABCD123.4'"),),
+        watermark_fields=tuple(SYNC_WATERMARK_FIELDS_1),
+    )
+    user_roles = TableMapping(
+        name="roles",
+        source_table=TABLE_NAME_2,
+        destination_table=TABLE_NAME_2,
+        columns=(
+            ColumnMapping("id", FIELD_NAME_11),
+            ColumnMapping(FIELD_NAME_12),
+            ColumnMapping(FIELD_NAME_13),
+            ColumnMapping(FIELD_NAME_14),
+        ),
+        watermark_fields=tuple(SYNC_WATERMARK_FIELDS_2),
+    )
+    return users, user_roles
+
+
+def load_table_mappings(path: str) -> tuple[TableMapping, ...]:
+    """Read the table mappings declared in a TOML file.
+
+    Args:
+        path: The path of the mappings file, holding a `tables` array of tables.
+    Returns:
+        tuple[TableMapping, ...]: The mappings, in the order of the file.
+    Raises:
+        ValueError: If the file declares no table or an invalid one.
+    """
+    with open(path, "rb") as file:
+        tables = tomllib.load(file).get("tables", [])
+    if not tables:
+        raise ValueError(f"No table is declared in {path}.")
+    mappings = tuple(TableMapping.from_config(table) for table in tables)
+    names = [mapping.name for mapping in mappings]
+    if len(set(names)) != len(names):
+        raise ValueError(f"The tables declared in {path} must have distinct names.")
+    return mappings
+
+
+@cache
+def get_table_mappings() -> tuple[TableMapping, ...]:
+    """Return the mappings of the copied tables, read once from TABLE_MAPPINGS_FILE or built from the defaults."""
+    if TABLE_MAPPINGS_FILE:
+        return load_table_mappings(TABLE_MAPPINGS_FILE)
+    return default_table_mappings()
@@ -2,24 +2,57 @@
 
 These classes represent users and their roles within the system.
 It includes methods for initializing user and role instances with their attributes.
+Records use `__slots__` and can be built positionally from a row tuple.
 """
 
+from typing import Sequence
+
 
 class User:
     """User class to represent a user in the IAM system."""
 
-    def __init__(self, *args, **kwargs):
-        """Initialize a User instance with the provided attributes."""
-        self.id = kwargs.get("id")
-        self.username = kwargs.get("username")
-        self.email = kwargs.get("email")
-        self.date_created = kwargs.get("date_created")
-        self.token_activation = kwargs.get("token_activation")
-        self.active = kwargs.get("active")
-        self.date_activated = kwargs.get("date_activated")
-        self.date_deactivated = kwargs.get("date_deactivated")
-        self.deleted = kwargs.get("deleted")
-        self.admin = kwargs.get("admin")
+    __slots__ = (
+        "id",
+        "username",
+        "email",
+        "date_created",
+        "token_activation",
+        "active",
+        "date_activated",
+        "date_deactivated",
+        "deleted",
+        "admin",
+    )
+
+    def __init__(
+        self,
+        id=None,
+        username=None,
+        email=None,
+        date_created=None,
+        token_activation=None,
+        active=None,
+        date_activated=None,
+        date_deactivated=None,
+        deleted=None,
+        admin=None,
+    ):
+        """Initialize a User instance with the provided attributes, by position or by name."""
+        self.id = id
+        self.username = username
+        self.email = email
+        self.date_created = date_created
+        self.token_activation = token_activation
+        self.active = active
+        self.date_activated = date_activated
+        self.date_deactivated = date_deactivated
+        self.deleted = deleted
+        self.admin = admin
+
+    @classmethod
+    def from_row(cls, row: Sequence) -> "User":
+        """Build a User from a row whose values are ordered like the `__slots__`."""
+        return cls(*row)
 
     def __repr__(self) -> str:
         """Return a string representation of the User instance."""
@@ -29,9 +62,20 @@ class User:
 class UserRole:
     """UserRole class to represent a user role in the IAM system."""
 
-    def __init__(self, *args, **kwargs):
-        """Initialize a UserRole instance with the provided attributes."""
-        self.id = kwargs.get("id")
-        self.user_id = kwargs.get("user_id")
-        self.role_id = kwargs.get("role_id")
-        self.date_created = kwargs.get("date_created")
+    __slots__ = ("id", "user_id", "role_id", "date_created")
+
+    def __init__(self, id=None, user_id=None, role_id=None, date_created=None):
+        """Initialize a UserRole instance with the provided attributes, by position or by name."""
+        self.id = id
+        self.user_id = user_id
+        self.role_id = role_id
+        self.date_created = date_created
+
+    @classmethod
+    def from_row(cls, row: Sequence) -> "UserRole":
+        """Build a UserRole from a row whose values are ordered like the `__slots__`."""
+        return cls(*row)
+
+    def __repr__(self) -> str:
+        """Return a string representation of the UserRole instance."""
+        return f"UserRole(id={self.id}, user_id={self.user_id}, role_id={self.role_id}, date_created={self.date_created})"
@@ -0,0 +1,175 @@
+"""This file is part of the ETL project for PostgreSQL to Turso migration.
+
+It runs the extract, transform and load stages of a table concurrently: a producer thread reads
+batches from the source, transform threads convert (and encrypt) them, and loader threads write them
+to the backup. Stages are connected by bounded queues, so a slow stage holds back the faster ones.
+"""
+
+import logging
+import queue
+import threading
+from typing import Callable, Iterable
+
+from config.default import PIPELINE_QUEUE_SIZE, PIPELINE_TRANSFORM_WORKERS
+
+logger = logging.getLogger("__main__")
+
+_END = object()
+_POLL_INTERVAL = 0.1
+
+
+class Pipeline:
+    """Pipeline class to run the stages of a table load in worker threads."""
+
+    def __init__(
+        self,
+        name: str,
+        queue_size: int = PIPELINE_QUEUE_SIZE,
+        transform_workers: int = PIPELINE_TRANSFORM_WORKERS,
+    ):
+        """Initialize the pipeline with the size of its queues and the number of transform threads."""
+        self.name = name
+        self.transform_workers = transform_workers
+        self.load_workers = 0
+        self._transform_queue = queue.Queue(maxsize=queue_size)
+        self._load_queue = queue.Queue(maxsize=queue_size)
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+        self._errors = []
+        self._running_transforms = transform_workers
+        self._loaded = 0
+
+    def _fail(self, error: BaseException) -> None:
+        """Record the first error of a stage and ask every stage to stop."""
+        with self._lock:
+            self._errors.append(error)
+        self._stop.set()
+
+    def _put(self, target: queue.Queue, item) -> bool:
+        """Put an item in a queue, waiting for room unless the pipeline is stopping."""
+        while not self._stop.is_set():
+            try:
+                target.put(item, timeout=_POLL_INTERVAL)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _get(self, source: queue.Queue):
+        """Get an item from a queue, or the end marker if the pipeline is stopping."""
+        while not self._stop.is_set():
+            try:
+                return source.get(timeout=_POLL_INTERVAL)
+            except queue.Empty:
+                continue
+        return _END
+
+    def _produce(self, batches: Iterable[list]) -> None:
+        """Read the batches of the source and queue them for the transform stage."""
+        try:
+            for batch in batches:
+                if not self._put(self._transform_queue, batch):
+                    return
+        except BaseException as error:
+            self._fail(error)
+        finally:
+            for _ in range(self.transform_workers):
+                self._put(self._transform_queue, _END)
+
+    def _transform(self, transform: Callable[[list], list]) -> None:
+        """Transform the queued batches and queue the rows for the load stage."""
+        try:
+            while (batch := self._get(self._transform_queue)) is not _END:
+                if not self._put(self._load_queue, transform(batch)):
+                    return
+        except BaseException as error:
+            self._fail(error)
+        finally:
+            with self._lock:
+                self._running_transforms -= 1
+                last_transform = self._running_transforms == 0
+            if last_transform:
+                for _ in range(self.load_workers):
+                    self._put(self._load_queue, _END)
+
+    def _load(self, load: Callable[[list], int]) -> None:
+        """Write the queued rows to the backup database."""
+        try:
+            while (rows := self._get(self._load_queue)) is not _END:
+                loaded = load(rows)
+                with self._lock:
+                    self._loaded += loaded
+        except BaseException as error:
+            self._fail(error)
+
+    def run(
+        self,
+        batches: Iterable[list],
+        transform: Callable[[list], list],
+        loaders: list[Callable[[list], int]],
+    ) -> int:
+        """Run the pipeline until the source is exhausted or a stage fails.
+
+        Args:
+            batches: The batches of records read from the source, consumed by the producer thread.
+            transform: The function converting a batch of records to a batch of rows.
+            loaders: One load function per loader thread, each one returning the number of rows written.
+                Each loader needs its own connection, SQLAlchemy connections must not be shared between threads.
+        Returns:
+            int: The number of rows written by the loaders.
+        Raises:
+            Exception: The first error raised by a stage, once every thread has stopped.
+        """
+        self.load_workers = len(loaders)
+        threads = [
+            threading.Thread(
+                target=self._produce, args=(batches,), name=f"{self.name}-extract"
+            )
+        ]
+        threads += [
+            threading.Thread(
+                target=self._transform,
+                args=(transform,),
+                name=f"{self.name}-transform-{index}",
+            )
+            for index in range(self.transform_workers)
+        ]
+        threads += [
+            threading.Thread(
+                target=self._load, args=(load,), name=f"{self.name}-load-{index}"
+            )
+            for index, load in enumerate(loaders)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        if self._errors:
+            logger.error("Pipeline %s stopped on error: %s", self.name, self._errors[0])
+            raise self._errors[0]
+        logger.info("Pipeline %s loaded %d rows", self.name, self._loaded)
+        return self._loaded
+
+
+def run_pipeline(
+    name: str,
+    batches: Iterable[list],
+    transform: Callable[[list], list],
+    load: Callable[[list], int],
+    queue_size: int = PIPELINE_QUEUE_SIZE,
+    transform_workers: int = PIPELINE_TRANSFORM_WORKERS,
+) -> int:
+    """Run the extract, transform and load stages of a table with a single loader.
+
+    Args:
+        name: The name of the pipeline, used in thread names and logs.
+        batches: The batches of records read from the source.
+        transform: The function converting a batch of records to a batch of rows.
+        load: The function writing a batch of rows and returning the number of rows written.
+        queue_size: The maximum number of batches waiting between two stages.
+        transform_workers: The number of transform threads.
+    Returns:
+        int: The number of rows written.
+    """
+    return Pipeline(name, queue_size, transform_workers).run(batches, transform, [load])
@@ -1,15 +1,51 @@
 """This module provides functions to manage RSA encryption and decryption.
 
 It includes functions to generate, store, read keys, and encrypt/decrypt messages.
+Keys are loaded once per process by a key ring and reloaded only when their file changes.
+
+Messages are either encrypted with RSA directly, or with envelope encryption: a random AES-GCM
+data key encrypts the messages and only the data key is encrypted (wrapped) with the RSA public key.
+The envelope messages are `EnvelopeCiphertext` values starting with ENVELOPE_VERSION, so they are told from
+the RSA messages by their type. A BLOB read back from the database only has its first byte to tell them apart,
+and a RSA message may start with it too, so such a message is decrypted with RSA when its data key is unknown.
 """
 
 import os
+import threading
+from typing import Callable, Iterable
 
 import rsa
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
 from rsa import PrivateKey, PublicKey
 
 from config.default import BASE_DIR
 
+# First byte of the envelope messages, to change when their layout changes
+ENVELOPE_VERSION = b"\x01"
+_KEY_ID_SIZE = 16
+_NONCE_SIZE = 12
+_KEY_ID_END = len(ENVELOPE_VERSION) + _KEY_ID_SIZE
+_HEADER_SIZE = _KEY_ID_END + _NONCE_SIZE
+
+
+class EnvelopeCiphertext(bytes):
+    """EnvelopeCiphertext class to mark a message encrypted with a data key rather than with RSA."""
+
+
+class DataKey:
+    """DataKey class to represent a symmetric key used by the envelope encryption."""
+
+    def __init__(self, key_id: bytes, key: bytes, wrapped_key: bytes):
+        """Initialize a DataKey with its id, its plain value and its value wrapped by the RSA public key."""
+        self.key_id = key_id
+        self.key = key
+        self.wrapped_key = wrapped_key
+        self.cipher = AESGCM(key)
+
+    def __repr__(self) -> str:
+        """Return a string representation of the DataKey instance, without the key itself."""
+        return f"DataKey(key_id={self.key_id.hex()})"
+
 
 def generate_keys(bits: int = 2048) -> tuple[PublicKey, PrivateKey]:
     """Generate a pair of RSA keys.
@@ -55,6 +91,196 @@ def read_keys(key_path: str) -> tuple[PublicKey, PrivateKey]:
     return public_key, private_key
 
 
+class RSAKeyRing:
+    """RSAKeyRing class to load the RSA keys once and keep them in memory.
+
+    Keys are cached by file path together with the modification time of the file,
+    so a key replaced on disk is loaded again on its next use.
+    """
+
+    def __init__(self):
+        """Initialize an empty key ring."""
+        self._keys = {}
+        self._data_keys = {}
+        self._lock = threading.Lock()
+
+    def _load(self, key_file: str, loader: Callable[[bytes], object]):
+        """Return the key stored in a file, reading it only if it changed since the last read."""
+        mtime = os.stat(key_file).st_mtime_ns
+        cached = self._keys.get(key_file)
+        if cached is not None and cached[0] == mtime:
+            return cached[1]
+        with self._lock:
+            with open(key_file, "rb") as key_data:
+                key = loader(key_data.read())
+            self._keys[key_file] = (mtime, key)
+        return key
+
+    def get_public_key(self, key_path: str) -> PublicKey:
+        """Return the public key of a key directory, generating a key pair if none exists.
+
+        Args:
+            key_path (str): The directory path where the keys are stored.
+        Returns:
+            PublicKey: The public key.
+        """
+        key_file = os.path.join(BASE_DIR, key_path, "public_key.pem")
+        if not os.path.exists(key_file):
+            with self._lock:
+                if not os.path.exists(key_file):
+                    store_keys(*generate_keys(), os.path.join(BASE_DIR, key_path))
+        return self._load(key_file, lambda data: PublicKey.load_pkcs1(data, "PEM"))
+
+    def get_private_key(self, key_path: str) -> PrivateKey:
+        """Return the private key of a key directory.
+
+        Args:
+            key_path (str): The directory path where the keys are stored.
+        Returns:
+            PrivateKey: The private key.
+        Raises:
+            FileNotFoundError: If the private key file does not exist.
+        """
+        key_file = os.path.join(BASE_DIR, key_path, "private_key.pem")
+        if not os.path.exists(key_file):
+            raise FileNotFoundError("Key files not found. Please generate keys first.")
+        return self._load(key_file, lambda data: PrivateKey.load_pkcs1(data, "PEM"))
+
+    def invalidate(self, key_path: str | None = None) -> None:
+        """Forget the cached keys of a key directory, or all of them.
+
+        Args:
+            key_path (str | None): The directory path of the keys to forget, None to forget every key.
+        """
+        with self._lock:
+            if key_path is None:
+                self._keys.clear()
+                return
+            key_dir = os.path.join(BASE_DIR, key_path)
+            for key_file in list(self._keys):
+                if os.path.dirname(key_file) == key_dir:
+                    del self._keys[key_file]
+
+    def new_data_key(self, key_path: str) -> DataKey:
+        """Generate a random data key wrapped by the RSA public key of a key directory.
+
+        Args:
+            key_path (str): The directory path where the keys are stored.
+        Returns:
+            DataKey: The new data key, the wrapped key must be stored to decrypt its messages later.
+        """
+        key = AESGCM.generate_key(bit_length=256)
+        data_key = DataKey(
+            os.urandom(_KEY_ID_SIZE),
+            key,
+            rsa.encrypt(key, self.get_public_key(key_path)),
+        )
+        self._data_keys[data_key.key_id] = data_key
+        return data_key
+
+    def get_data_key(
+        self,
+        key_id: bytes,
+        key_path: str,
+        wrapped_key_lookup: Callable[[str], bytes] | None = None,
+    ) -> DataKey:
+        """Return a data key, unwrapping it with the RSA private key on its first use.
+
+        Args:
+            key_id (bytes): The id of the data key.
+            key_path (str): The directory path where the keys are stored.
+            wrapped_key_lookup (Callable[[str], bytes] | None): A function returning the wrapped key of a hex key id.
+        Returns:
+            DataKey: The data key.
+        Raises:
+            KeyError: If the data key is unknown and no lookup function is given.
+        """
+        data_key = self._data_keys.get(key_id)
+        if data_key is not None:
+            return data_key
+        if wrapped_key_lookup is None:
+            raise KeyError(f"Unknown data key {key_id.hex()}.")
+        wrapped_key = wrapped_key_lookup(key_id.hex())
+        data_key = DataKey(
+            key_id,
+            rsa.decrypt(wrapped_key, self.get_private_key(key_path)),
+            wrapped_key,
+        )
+        self._data_keys[key_id] = data_key
+        return data_key
+
+    def encrypt_many(self, messages: Iterable[str], key_path: str) -> list[bytes]:
+        """Encrypt several messages using the public key.
+
+        Args:
+            messages (Iterable[str]): The messages to encrypt.
+            key_path (str): The directory path where the public key is stored.
+        Returns:
+            list[bytes]: The encrypted messages, in the same order.
+        """
+        public_key = self.get_public_key(key_path)
+        return [
+            rsa.encrypt(message.encode("utf-8"), public_key) for message in messages
+        ]
+
+    def decrypt_many(
+        self,
+        encrypted_messages: Iterable[bytes],
+        key_path: str,
+        wrapped_key_lookup: Callable[[str], bytes] | None = None,
+    ) -> list[bytes]:
+        """Decrypt several messages encrypted with RSA or with envelope encryption.
+
+        Args:
+            encrypted_messages (Iterable[bytes]): The encrypted messages to decrypt.
+            key_path (str): The directory path where the private key is stored.
+            wrapped_key_lookup (Callable[[str], bytes] | None): A function returning the wrapped key of a hex key id.
+        Returns:
+            list[bytes]: The decrypted messages, in the same order.
+        """
+        return [
+            self.decrypt(encrypted_message, key_path, wrapped_key_lookup)
+            for encrypted_message in encrypted_messages
+        ]
+
+    def decrypt(
+        self,
+        encrypted_message: bytes,
+        key_path: str,
+        wrapped_key_lookup: Callable[[str], bytes] | None = None,
+    ) -> bytes:
+        """Decrypt a message encrypted with RSA or with envelope encryption.
+
+        Args:
+            encrypted_message (bytes): The encrypted message to decrypt, an `EnvelopeCiphertext` for envelope messages.
+            key_path (str): The directory path where the private key is stored.
+            wrapped_key_lookup (Callable[[str], bytes] | None): A function returning the wrapped key of a hex key id.
+        Returns:
+            bytes: The decrypted message.
+        """
+        if not isinstance(encrypted_message, EnvelopeCiphertext):
+            return rsa.decrypt(encrypted_message, self.get_private_key(key_path))
+        key_id = encrypted_message[len(ENVELOPE_VERSION) : _KEY_ID_END]
+        try:
+            data_key = self.get_data_key(key_id, key_path, wrapped_key_lookup)
+        except KeyError as unknown_key:
+            # a RSA message stored as a BLOB may start with ENVELOPE_VERSION, its key id is then unknown
+            try:
+                return rsa.decrypt(
+                    bytes(encrypted_message), self.get_private_key(key_path)
+                )
+            except rsa.DecryptionError:
+                raise unknown_key from None
+        return data_key.cipher.decrypt(
+            encrypted_message[_KEY_ID_END:_HEADER_SIZE],
+            encrypted_message[_HEADER_SIZE:],
+            key_id,
+        )
+
+
+key_ring = RSAKeyRing()
+
+
 def encrypt(message: str, key_path: str) -> bytes:
     """Encrypt a message using the public key.
 
@@ -65,23 +291,92 @@ def encrypt(message: str, key_path: str) -> bytes:
     Returns:
         bytes: The encrypted message as bytes.
     """
-    if not os.path.exists(os.path.join(BASE_DIR, key_path, "public_key.pem")):
-        store_keys(*generate_keys(), os.path.join(BASE_DIR, key_path))
-    public_key, _ = read_keys(key_path)
-    return rsa.encrypt(message.encode("utf-8"), public_key)
+    return rsa.encrypt(message.encode("utf-8"), key_ring.get_public_key(key_path))
 
 
-def decrypt(encrypted_message: bytes, key_path: str) -> bytes:
+def decrypt(
+    encrypted_message: bytes,
+    key_path: str,
+    wrapped_key_lookup: Callable[[str], bytes] | None = None,
+) -> bytes:
     """Decrypt a message using the private key.
 
     This function decrypts a given encrypted message using the private key stored in the specified directory.
+    Messages produced by the envelope encryption are decrypted with their data key, unwrapped by the private key.
     Args:
         encrypted_message (bytes): The encrypted message to decrypt.
         key_path (str): The directory path where the private key is stored.
+        wrapped_key_lookup (Callable[[str], bytes] | None): A function returning the wrapped key of a hex key id,
+            required to decrypt envelope messages whose data key was not generated by this process.
     Returns:
         bytes: The decrypted message as bytes.
     """
-    if not os.path.exists(os.path.join(BASE_DIR, key_path, "private_key.pem")):
-        raise FileNotFoundError("Key files not found. Please generate keys first.")
-    _, private_key = read_keys(key_path)
-    return rsa.decrypt(encrypted_message, private_key)
+    return key_ring.decrypt(encrypted_message, key_path, wrapped_key_lookup)
+
+
+def encrypt_many(messages: Iterable[str], key_path: str) -> list[bytes]:
+    """Encrypt several messages using the public key.
+
+    Args:
+        messages (Iterable[str]): The messages to encrypt.
+        key_path (str): The directory path where the public key is stored.
+    Returns:
+        list[bytes]: The encrypted messages, in the same order.
+    """
+    return key_ring.encrypt_many(messages, key_path)
+
+
+def decrypt_many(
+    encrypted_messages: Iterable[bytes],
+    key_path: str,
+    wrapped_key_lookup: Callable[[str], bytes] | None = None,
+) -> list[bytes]:
+    """Decrypt several messages using the private key.
+
+    Args:
+        encrypted_messages (Iterable[bytes]): The encrypted messages to decrypt.
+        key_path (str): The directory path where the private key is stored.
+        wrapped_key_lookup (Callable[[str], bytes] | None): A function returning the wrapped key of a hex key id.
+    Returns:
+        list[bytes]: The decrypted messages, in the same order.
+    """
+    return key_ring.decrypt_many(encrypted_messages, key_path, wrapped_key_lookup)
+
+
+def new_data_key(key_path: str) -> DataKey:
+    """Generate a random data key wrapped by the RSA public key.
+
+    Args:
+        key_path (str): The directory path where the public key is stored.
+    Returns:
+        DataKey: The new data key.
+    """
+    return key_ring.new_data_key(key_path)
+
+
+def envelope_encrypt_many(
+    messages: Iterable[str], data_key: DataKey
+) -> list[EnvelopeCiphertext]:
+    """Encrypt several messages with a data key using AES-GCM.
+
+    Each message is stored as ENVELOPE_VERSION, the data key id, a random nonce and the authenticated ciphertext. The key id is authenticated too, so a message can't be moved to another key.
+    Args:
+        messages (Iterable[str]): The messages to encrypt.
+        data_key (DataKey): The data key returned by `new_data_key`.
+    Returns:
+        list[EnvelopeCiphertext]: The encrypted messages, in the same order.
+    """
+    encrypted_messages = []
+    for message in messages:
+        nonce = os.urandom(_NONCE_SIZE)
+        encrypted_messages.append(
+            EnvelopeCiphertext(
+                ENVELOPE_VERSION
+                + data_key.key_id
+                + nonce
+                + data_key.cipher.encrypt(
+                    nonce, message.encode("utf-8"), data_key.key_id
+                )
+            )
+        )
+    return encrypted_messages
@@ -0,0 +1,228 @@
+"""This module runs the synchronization cycles in a long-running process instead of a crontab.
+
+The engines, connection pools and RSA keys loaded by the first cycle are kept for the next ones.
+A cycle never starts while another one holds the lock file, and SIGTERM stops the daemon once the
+running cycle is over.
+"""
+
+import logging
+import os
+import signal
+import threading
+from datetime import datetime, timedelta
+from typing import Callable
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - not available on Windows
+    fcntl = None
+
+logger = logging.getLogger("__main__")
+
+_CRON_FIELDS = (
+    ("minute", 0, 59),
+    ("hour", 0, 23),
+    ("day", 1, 31),
+    ("month", 1, 12),
+    # like cron, both 0 and 7 stand for sunday
+    ("weekday", 0, 7),
+)
+
+
+def _parse_cron_field(field: str, lowest: int, highest: int) -> set[int]:
+    """Return the values matched by a cron field made of `*`, values, ranges, steps and lists."""
+    values = set()
+    for part in field.split(","):
+        expression, _, step = part.partition("/")
+        if expression == "*":
+            start, end = lowest, highest
+        elif "-" in expression:
+            start, end = (int(bound) for bound in expression.split("-", 1))
+        else:
+            start = int(expression)
+            end = highest if step else start
+        if not lowest <= start <= end <= highest:
+            raise ValueError(f"Invalid cron field: {field}")
+        values.update(range(start, end + 1, int(step) if step else 1))
+    return values
+
+
+class CronSchedule:
+    """CronSchedule class to compute the run times of a 5 fields cron expression (minute hour day month weekday)."""
+
+    def __init__(self, expression: str):
+        """Initialize the schedule from a cron expression such as `*/2 * * * *`.
+
+        Raises:
+            ValueError: If the expression is not a valid 5 fields cron expression.
+        """
+        fields = expression.split()
+        if len(fields) != len(_CRON_FIELDS):
+            raise ValueError(f"Invalid cron expression: {expression}")
+        self.expression = expression
+        self.minutes, self.hours, self.days, self.months, weekdays = (
+            _parse_cron_field(field, lowest, highest)
+            for field, (_, lowest, highest) in zip(fields, _CRON_FIELDS)
+        )
+        # cron counts the weekdays from sunday, python from monday
+        self.weekdays = {(weekday - 1) % 7 for weekday in weekdays}
+        # like cron, a day matches either restriction when both the day and the weekday are restricted
+        self._any_day = fields[2] == "*"
+        self._any_weekday = fields[4] == "*"
+
+    def _day_matches(self, moment: datetime) -> bool:
+        """Tell whether the day of a moment matches the day and weekday fields."""
+        day_matches = moment.day in self.days
+        weekday_matches = moment.weekday() in self.weekdays
+        if self._any_day or self._any_weekday:
+            return day_matches and weekday_matches
+        return day_matches or weekday_matches
+
+    def next_run(self, after: datetime) -> datetime:
+        """Return the first run time strictly after a moment.
+
+        Args:
+            after: The moment to start from.
+        Returns:
+            datetime: The next run time, with the time zone of `after`.
+        """
+        moment = after.replace(second=0, microsecond=0) + timedelta(minutes=1)
+        limit = moment + timedelta(days=366 * 5)
+        while moment < limit:
+            if moment.month not in self.months:
+                moment = (moment.replace(day=1) + timedelta(days=32)).replace(
+                    day=1, hour=0, minute=0
+                )
+            elif not self._day_matches(moment):
+                moment = moment.replace(hour=0, minute=0) + timedelta(days=1)
+            elif moment.hour not in self.hours:
+                moment = moment.replace(minute=0) + timedelta(hours=1)
+            elif moment.minute not in self.minutes:
+                moment += timedelta(minutes=1)
+            else:
+                return moment
+        raise ValueError(f"The cron expression {self.expression} never matches.")
+
+
+class IntervalSchedule:
+    """IntervalSchedule class to run cycles at a fixed interval, measured between the starts of the cycles."""
+
+    def __init__(self, seconds: float):
+        """Initialize the schedule with the interval between two cycles, in seconds."""
+        if seconds <= 0:
+            raise ValueError("The interval must be positive.")
+        self.interval = timedelta(seconds=seconds)
+
+    def next_run(self, after: datetime) -> datetime:
+        """Return the run time following a cycle started at `after`."""
+        return after + self.interval
+
+
+class CycleLock:
+    """CycleLock class to hold an exclusive lock file while a cycle runs, across processes."""
+
+    def __init__(self, path: str):
+        """Initialize the lock with the path of its lock file."""
+        self.path = path
+        self._file = None
+
+    def acquire(self) -> bool:
+        """Take the lock without waiting.
+
+        Returns:
+            bool: True if the lock was taken, False if another process holds it.
+        """
+        self._file = open(self.path, "a+")
+        if fcntl is None:
+            return True
+        try:
+            fcntl.flock(self._file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            self._file.close()
+            self._file = None
+            return False
+        self._file.seek(0)
+        self._file.truncate()
+        self._file.write(str(os.getpid()))
+        self._file.flush()
+        return True
+
+    def release(self) -> None:
+        """Release the lock."""
+        if self._file is not None:
+            if fcntl is not None:
+                fcntl.flock(self._file, fcntl.LOCK_UN)
+            self._file.close()
+            self._file = None
+
+    def __enter__(self) -> bool:
+        """Take the lock without waiting, see `acquire`."""
+        return self.acquire()
+
+    def __exit__(self, *exc_info) -> None:
+        """Release the lock."""
+        self.release()
+
+
+class Daemon:
+    """Daemon class to run a synchronization cycle on a schedule until it is asked to stop."""
+
+    def __init__(
+        self,
+        cycle: Callable[[], None],
+        schedule: CronSchedule | IntervalSchedule,
+        lock: CycleLock,
+    ):
+        """Initialize the daemon with the function running one cycle, its schedule and its lock."""
+        self.cycle = cycle
+        self.schedule = schedule
+        self.lock = lock
+        self.stopping = threading.Event()
+
+    def stop(self, signum=None, frame=None) -> None:
+        """Ask the daemon to stop once the running cycle is over, usable as a signal handler."""
+        if signum is not None:
+            logger.info("Signal %s received, stopping the daemon", signum)
+        self.stopping.set()
+
+    def run_cycle(self) -> bool:
+        """Run one cycle, unless another one holds the lock.
+
+        The errors of the cycle are logged, so the next cycles still run.
+        Returns:
+            bool: True if the cycle ran, whatever its outcome.
+        """
+        with self.lock as acquired:
+            if not acquired:
+                logger.warning("A cycle is still running, this one is skipped")
+                return False
+            started = datetime.now()
+            try:
+                self.cycle()
+            except Exception:
+                logger.exception("The synchronization cycle failed")
+            logger.info(
+                "Synchronization cycle done in %.3fs",
+                (datetime.now() - started).total_seconds(),
+            )
+            return True
+
+    def run(self) -> None:
+        """Run the cycles on schedule until SIGTERM or SIGINT is received."""
+        for signum in (signal.SIGTERM, signal.SIGINT):
+            signal.signal(signum, self.stop)
+        logger.info("Daemon started")
+        next_run = datetime.now()
+        if isinstance(self.schedule, CronSchedule):
+            next_run = self.schedule.next_run(next_run)
+        while not self.stopping.is_set():
+            delay = (next_run - datetime.now()).total_seconds()
+            if delay > 0 and self.stopping.wait(delay):
+                break
+            started = datetime.now()
+            self.run_cycle()
+            next_run = self.schedule.next_run(started)
+            if next_run < datetime.now():
+                # a cycle longer than the interval is not made up for by running cycles back to back
+                next_run = self.schedule.next_run(datetime.now())
+        logger.info("Daemon stopped")
@@ -0,0 +1,301 @@
+"""This file is part of the ETL project for PostgreSQL to Turso migration.
+
+It implements the change-data-capture mode, which keeps the backup seconds behind the source.
+Triggers installed on the source tables log the key and the operation of every changed row in a changelog
+table, and notify a channel once per statement. The consumer drains the changelog in batches ordered by
+change id: the current rows of the changed keys are read from the source and upserted in the backup, the keys
+that no longer exist are deleted, then the consumed changes are acknowledged by deleting them from the changelog.
+Reading the current rows makes the changes idempotent, so a batch applied twice after a crash does no harm.
+"""
+
+import logging
+import select
+import threading
+from functools import lru_cache
+
+from sqlalchemy import TextClause, bindparam, text
+
+from config.default import (
+    CDC_BATCH_SIZE,
+    CDC_CHANGELOG_TABLE,
+    CDC_CHANNEL,
+    CDC_POLL_INTERVAL,
+)
+from core.load.iam_gateway import delete_rows, prepare_data_key
+from core.mapping.engine import insert_mapped_rows, to_destination_rows
+from core.mapping.tables import TableMapping
+
+logger = logging.getLogger("__main__")
+
+_CAPTURE_FUNCTION = "etl_capture_change"
+_NOTIFY_FUNCTION = "etl_notify_change"
+
+
+def install_cdc(pgsql_connection, mappings: tuple[TableMapping, ...]) -> None:
+    """Create the changelog table and the capture triggers of the source tables, and commit them.
+
+    The installation can be run again, it replaces the functions and triggers.
+    Args:
+        pgsql_connection: The source database connection object.
+        mappings: The mappings of the captured tables.
+    """
+    pgsql_connection.execute(
+        text(
+            f"CREATE TABLE IF NOT EXISTS {CDC_CHANGELOG_TABLE} (change_id BIGSERIAL PRIMARY KEY, table_name TEXT NOT NULL, operation CHAR(1) NOT NULL, row_key TEXT NOT NULL, changed_at TIMESTAMPTZ NOT NULL DEFAULT now())"  # nosec ignore SQL injection here as no input data is being inserted
+        )
+    )
+    pgsql_connection.execute(
+        text(
+            f"""CREATE OR REPLACE FUNCTION {_CAPTURE_FUNCTION}() RETURNS trigger AS $$
+            DECLARE
+                old_key TEXT;
+                new_key TEXT;
+            BEGIN
+                IF TG_OP <> 'INSERT' THEN
+                    old_key := to_jsonb(OLD) ->> TG_ARGV[0];
+                END IF;
+                IF TG_OP <> 'DELETE' THEN
+                    new_key := to_jsonb(NEW) ->> TG_ARGV[0];
+                END IF;
+                IF old_key IS NOT NULL AND old_key IS DISTINCT FROM new_key THEN
+                    INSERT INTO {CDC_CHANGELOG_TABLE} (table_name, operation, row_key) VALUES (TG_TABLE_NAME, 'D', old_key);
+                END IF;
+                IF new_key IS NOT NULL THEN
+                    INSERT INTO {CDC_CHANGELOG_TABLE} (table_name, operation, row_key) VALUES (TG_TABLE_NAME, left(TG_OP, 1), new_key);
+                END IF;
+                RETURN NULL;
+            END;
+            $$ LANGUAGE plpgsql"""  # nosec ignore SQL injection here as no input data is being inserted
+        )
+    )
+    pgsql_connection.execute(
+        text(
+            f"""CREATE OR REPLACE FUNCTION {_NOTIFY_FUNCTION}() RETURNS trigger AS $$
+            BEGIN
+                PERFORM pg_notify('{CDC_CHANNEL}', TG_TABLE_NAME);
+                RETURN NULL;
+            END;
+            $$ LANGUAGE plpgsql"""  # nosec ignore SQL injection here as no input data is being inserted
+        )
+    )
+    for mapping in mappings:
+        table = mapping.source_table
+        for trigger, level, function, arguments in (
+            (
+                f"{table}_{_CAPTURE_FUNCTION}",
+                "ROW",
+                _CAPTURE_FUNCTION,
+                f"'{mapping.key}'",
+            ),
+            (f"{table}_{_NOTIFY_FUNCTION}", "STATEMENT", _NOTIFY_FUNCTION, ""),
+        ):
+            pgsql_connection.execute(
+                text(
+                    f"DROP TRIGGER IF EXISTS {trigger} ON {table}"  # nosec ignore SQL injection here as no input data is being inserted
+                )
+            )
+            pgsql_connection.execute(
+                text(
+                    f"CREATE TRIGGER {trigger} AFTER INSERT OR UPDATE OR DELETE ON {table} FOR EACH {level} EXECUTE FUNCTION {function}({arguments})"  # nosec ignore SQL injection here as no input data is being inserted
+                )
+            )
+    pgsql_connection.commit()
+    logger.info(
+        "Change capture installed on %s",
+        ", ".join(mapping.source_table for mapping in mappings),
+    )
+
+
+def uninstall_cdc(pgsql_connection, mappings: tuple[TableMapping, ...]) -> None:
+    """Drop the capture triggers, their functions and the changelog table, and commit it.
+
+    Args:
+        pgsql_connection: The source database connection object.
+        mappings: The mappings of the captured tables.
+    """
+    for mapping in mappings:
+        for function in (_CAPTURE_FUNCTION, _NOTIFY_FUNCTION):
+            pgsql_connection.execute(
+                text(
+                    f"DROP TRIGGER IF EXISTS {mapping.source_table}_{function} ON {mapping.source_table}"  # nosec ignore SQL injection here as no input data is being inserted
+                )
+            )
+    for function in (_CAPTURE_FUNCTION, _NOTIFY_FUNCTION):
+        pgsql_connection.execute(
+            text(
+                f"DROP FUNCTION IF EXISTS {function}()"  # nosec ignore SQL injection here as no input data is being inserted
+            )
+        )
+    pgsql_connection.execute(
+        text(
+            f"DROP TABLE IF EXISTS {CDC_CHANGELOG_TABLE}"  # nosec ignore SQL injection here as no input data is being inserted
+        )
+    )
+    pgsql_connection.commit()
+    logger.info("Change capture uninstalled")
+
+
+@lru_cache(maxsize=64)
+def _build_rows_by_key_query(mapping: TableMapping) -> TextClause:
+    """Build the statement reading the current rows of a list of keys of a source table."""
+    return text(
+        f"SELECT {', '.join(mapping.source_columns)} FROM {mapping.source_table} WHERE {mapping.key} IN :keys"  # nosec ignore SQL injection risk, as the keys are bound parameters
+    ).bindparams(bindparam("keys", expanding=True))
+
+
+def read_changes(pgsql_connection, batch_size: int = CDC_BATCH_SIZE) -> list[tuple]:
+    """Read the oldest changes of the changelog.
+
+    Args:
+        pgsql_connection: The source database connection object.
+        batch_size: The greatest number of changes read.
+    Returns:
+        list[tuple]: The (change_id, table_name, row_key) changes, ordered by change id.
+    """
+    return pgsql_connection.execute(
+        text(
+            f"SELECT change_id, table_name, row_key FROM {CDC_CHANGELOG_TABLE} ORDER BY change_id LIMIT :limit"  # nosec ignore SQL injection here as values are bound parameters
+        ),
+        {"limit": batch_size},
+    ).all()
+
+
+def acknowledge_changes(pgsql_connection, change_ids: list[int]) -> None:
+    """Delete consumed changes from the changelog and commit it.
+
+    The changes are deleted by id rather than up to the greatest id, as a change with a smaller id
+    may be committed after the batch was read.
+    Args:
+        pgsql_connection: The source database connection object.
+        change_ids: The ids of the consumed changes.
+    """
+    pgsql_connection.execute(
+        text(
+            f"DELETE FROM {CDC_CHANGELOG_TABLE} WHERE change_id IN :change_ids"  # nosec ignore SQL injection here as values are bound parameters
+        ).bindparams(bindparam("change_ids", expanding=True)),
+        {"change_ids": change_ids},
+    )
+    pgsql_connection.commit()
+
+
+class CdcConsumer:
+    """CdcConsumer class to apply the changes logged by the capture triggers to the backup database."""
+
+    def __init__(
+        self,
+        turso_db_manager,
+        pgsql_db_manager,
+        mappings: tuple[TableMapping, ...],
+        batch_size: int = CDC_BATCH_SIZE,
+    ):
+        """Initialize the consumer with the connection managers of both databases and the captured tables."""
+        self.turso_db_manager = turso_db_manager
+        self.pgsql_db_manager = pgsql_db_manager
+        self.mappings = {mapping.source_table: mapping for mapping in mappings}
+        self.batch_size = batch_size
+        self.stopping = threading.Event()
+        self._data_key = None
+
+    def apply_batch(self, changes: list[tuple]) -> dict[str, dict[str, int]]:
+        """Apply a batch of changes to the backup database and commit it, without acknowledging it.
+
+        The tables are upserted in the order of the mappings, then their deleted keys are removed in reverse order,
+        so the rows referenced by foreign keys are written first and deleted last.
+        Args:
+            changes: The (change_id, table_name, row_key) changes returned by `read_changes`.
+        Returns:
+            dict[str, dict[str, int]]: The number of upserted and deleted rows per source table.
+        """
+        turso_connection = self.turso_db_manager.get_current_connection()
+        pgsql_connection = self.pgsql_db_manager.get_current_connection()
+        keys_by_table = {}
+        for _, table_name, row_key in changes:
+            keys_by_table.setdefault(table_name, set()).add(row_key)
+
+        counts = {}
+        deleted_keys = {}
+        data_key = self._data_key
+        for table_name, mapping in self.mappings.items():
+            keys = keys_by_table.pop(table_name, None)
+            if not keys:
+                continue
+            rows = pgsql_connection.execute(
+                _build_rows_by_key_query(mapping), {"keys": sorted(keys)}
+            ).all()
+            if mapping.encrypted_indexes and data_key is None:
+                data_key = prepare_data_key(turso_connection, True)
+            key_index = mapping.source_columns.index(mapping.key)
+            upserted = insert_mapped_rows(
+                turso_connection,
+                mapping,
+                to_destination_rows(
+                    mapping,
+                    rows,
+                    bool(mapping.encrypted_indexes),
+                    data_key,
+                ),
+                upsert=True,
+            )
+            deleted_keys[table_name] = sorted(
+                keys.difference(str(row[key_index]) for row in rows)
+            )
+            counts[table_name] = {"upserted": upserted, "deleted": 0}
+        for table_name in reversed(list(deleted_keys)):
+            mapping = self.mappings[table_name]
+            counts[table_name]["deleted"] = delete_rows(
+                turso_connection,
+                mapping.destination_table,
+                mapping.destination_key,
+                deleted_keys[table_name],
+            )
+        turso_connection.commit()
+        # the data key is stored in the batch transaction, it is only reused once committed
+        self._data_key = data_key
+        for table_name in keys_by_table:
+            logger.warning("Changes of the unmapped table %s are ignored", table_name)
+        return counts
+
+    def drain(self) -> dict[str, dict[str, int]]:
+        """Apply and acknowledge the changes of the changelog by batches until it is empty.
+
+        Returns:
+            dict[str, dict[str, int]]: The number of upserted and deleted rows per source table.
+        """
+        totals = {}
+        while not self.stopping.is_set():
+            pgsql_connection = self.pgsql_db_manager.get_current_connection()
+            changes = read_changes(pgsql_connection, self.batch_size)
+            if not changes:
+                pgsql_connection.rollback()
+                break
+            for table_name, counts in self.apply_batch(changes).items():
+                table_totals = totals.setdefault(
+                    table_name, {"upserted": 0, "deleted": 0}
+                )
+                for name, value in counts.items():
+                    table_totals[name] += value
+            acknowledge_changes(
+                pgsql_connection, [change_id for change_id, _, _ in changes]
+            )
+            logger.debug("%d changes applied", len(changes))
+        return totals
+
+    def stop(self, signum=None, frame=None) -> None:
+        """Ask the consumer to stop once the running batch is applied, usable as a signal handler."""
+        if signum is not None:
+            logger.info("Signal %s received, stopping the change consumer", signum)
+        self.stopping.set()
+
+    def wait_for_changes(self, listener, timeout: float = CDC_POLL_INTERVAL) -> None:
+        """Wait until a change is notified on the listening connection, or for at most `timeout` seconds.
+
+        Args:
+            listener: A psycopg2 connection listening on CDC_CHANNEL, None to only wait for the timeout.
+            timeout: The greatest wait, in seconds, so the changes are still polled if a notification is lost.
+        """
+        if listener is None:
+            self.stopping.wait(timeout)
+            return
+        if listener.notifies or select.select([listener], [], [], timeout)[0]:
+            listener.poll()
+            listener.notifies.clear()
@@ -0,0 +1,104 @@
+"""This file is part of the ETL project for PostgreSQL to Turso migration.
+
+It implements the gate skipping a synchronization cycle when the source tables have not changed.
+Every table gets a fingerprint computed on the server, either from its write counters in
+`pg_stat_user_tables` (cheap, but only tells that a write happened) or from a checksum of its rows
+(a full scan, but exact). The fingerprints of the last successful cycle are kept in the sync-state table.
+"""
+
+import logging
+
+from sqlalchemy import text
+
+from config.default import TABLE_NAME_1, TABLE_NAME_2
+from core.sync.state import create_sync_state_table, get_state, set_state
+
+logger = logging.getLogger("__main__")
+
+CHANGE_DETECTION_METHODS = ("stats", "checksum")
+
+
+def _get_stats_fingerprint(pgsql_connection, table_name: str) -> str | None:
+    """Return the write counters of a table, None if the statistics are not available."""
+    # the statistics are cached for the whole transaction otherwise
+    pgsql_connection.execute(text("SELECT pg_stat_clear_snapshot()"))
+    counters = pgsql_connection.execute(
+        text(
+            "SELECT n_tup_ins, n_tup_upd, n_tup_del, n_live_tup FROM pg_stat_user_tables WHERE relid = to_regclass(:table_name)"
+        ),
+        {"table_name": table_name},
+    ).one_or_none()
+    if counters is None:
+        return None
+    return ":".join(str(counter) for counter in counters)
+
+
+def _get_checksum_fingerprint(pgsql_connection, table_name: str) -> str:
+    """Return the row count and the sum of the row hashes of a table."""
+    count, checksum = pgsql_connection.execute(
+        text(
+            f"SELECT COUNT(*), SUM(('x' || substr(md5(ROW(source.*)::text), 1, 8))::bit(32)::bigint) FROM {table_name} AS source"  # nosec ignore SQL injection risk, as the input data is sanitized
+        )
+    ).one()
+    return f"{count}:{checksum or 0}"
+
+
+def capture_fingerprints(
+    pgsql_connection,
+    method: str = "stats",
+    table_names: tuple[str, ...] = (TABLE_NAME_1, TABLE_NAME_2),
+) -> dict[str, str | None]:
+    """Compute the fingerprints of the source tables.
+
+    They must be captured before extracting, so that changes made during the cycle trigger the next one.
+    Args:
+        pgsql_connection: The source database connection object.
+        method: The fingerprint to compute, 'stats' or 'checksum'.
+        table_names: The source tables.
+    Returns:
+        dict[str, str | None]: The fingerprints by sync-state key, None when it cannot be computed.
+    Raises:
+        ValueError: If the method is unknown.
+    """
+    if method == "stats":
+        get_fingerprint = _get_stats_fingerprint
+    elif method == "checksum":
+        get_fingerprint = _get_checksum_fingerprint
+    else:
+        raise ValueError(f"Unknown change detection method: {method}")
+    return {
+        f"{table_name}.{method}_fingerprint": get_fingerprint(
+            pgsql_connection, table_name
+        )
+        for table_name in table_names
+    }
+
+
+def has_changed(turso_connection, fingerprints: dict[str, str | None]) -> bool:
+    """Tell whether the source tables have changed since the last successful cycle.
+
+    Args:
+        turso_connection: The backup database connection object.
+        fingerprints: The fingerprints returned by `capture_fingerprints`.
+    Returns:
+        bool: False only if every fingerprint is known and equal to the stored one.
+    """
+    create_sync_state_table(turso_connection)
+    for state_key, fingerprint in fingerprints.items():
+        if fingerprint is None or get_state(turso_connection, state_key) != fingerprint:
+            return True
+    return False
+
+
+def save_fingerprints(turso_connection, fingerprints: dict[str, str | None]) -> None:
+    """Store the fingerprints of a successful cycle in the sync-state table and commit them.
+
+    Args:
+        turso_connection: The backup database connection object.
+        fingerprints: The fingerprints returned by `capture_fingerprints`.
+    """
+    create_sync_state_table(turso_connection)
+    for state_key, fingerprint in fingerprints.items():
+        if fingerprint is not None:
+            set_state(turso_connection, state_key, fingerprint)
+    turso_connection.commit()
@@ -0,0 +1,293 @@
+"""This file is part of the ETL project for PostgreSQL to Turso migration.
+
+It implements the diff synchronization mode, which does not rely on update timestamps.
+The source computes a hash of every row in SQL, and the backup keeps a ledger of the hashes of the rows
+it received, as its own rows may be encrypted and cannot be hashed the same way. Both sides are compared by key ranges through per-range row counts and hash sums, and only
+the ranges that differ are split again. Once a range is small enough, its differing rows are upserted and
+its missing rows deleted, so the data pulled over the network is proportional to the drift.
+Every mapped table is compared on its mapped source columns.
+"""
+
+import logging
+import uuid
+
+from sqlalchemy import bindparam, text
+
+from config.default import (
+    LOAD_BATCH_SIZE,
+    MERKLE_FANOUT,
+    MERKLE_LEAF_SIZE,
+    ROW_HASHES_TABLE,
+)
+from core.extract.partitioned import get_key_ranges, key_range_clause
+from core.helpers.batching import chunked
+from core.load.iam_gateway import delete_rows, insert_rows
+from core.mapping.engine import record_rows
+from core.mapping.tables import TableMapping, get_table_mappings
+
+logger = logging.getLogger("__main__")
+
+
+def _row_hash(mapping: TableMapping) -> str:
+    """Return the SQL expression hashing the mapped columns of a source row."""
+    return f"md5(ROW({', '.join(mapping.source_columns)})::text)"
+
+
+def _row_bucket(mapping: TableMapping) -> str:
+    """Return the SQL expression of the 32 bits integer summed by range, taken from the row hash."""
+    return f"('x' || substr({_row_hash(mapping)}, 1, 8))::bit(32)::bigint"
+
+
+def _normalize_key(key):
+    """Return a key in the representation compared the same way by PostgreSQL and SQLite."""
+    return str(key) if isinstance(key, uuid.UUID) else key
+
+
+def _range_parameters(key_range: tuple) -> dict:
+    """Return the bind parameters of a key range clause."""
+    return {"lower": key_range[0], "upper": key_range[1]}
+
+
+def _range_index_case(sub_ranges: list[tuple], key_column: str) -> tuple[str, dict]:
+    """Build the SQL expression returning the index of the sub-range holding a key."""
+    upper_bounds = [upper for _, upper in sub_ranges[:-1]]
+    if not upper_bounds:
+        return "0", {}
+    whens = " ".join(
+        f"WHEN {key_column} < :bound_{index} THEN {index}"
+        for index in range(len(upper_bounds))
+    )
+    parameters = {f"bound_{index}": bound for index, bound in enumerate(upper_bounds)}
+    return f"CASE {whens} ELSE {len(upper_bounds)} END", parameters
+
+
+def create_row_hashes_table(connection) -> None:
+    """Create the ledger of the row hashes in the backup database if it does not exist.
+
+    The row key has no declared type, so integer keys keep being compared as integers.
+    Args:
+        connection: The database connection object.
+    """
+    connection.execute(
+        text(
+            f"CREATE TABLE IF NOT EXISTS {ROW_HASHES_TABLE} (table_name TEXT NOT NULL, row_key NOT NULL, row_hash TEXT NOT NULL, bucket INTEGER NOT NULL, PRIMARY KEY (table_name, row_key))"  # nosec ignore SQL injection here as no input data is being inserted
+        )
+    )
+
+
+def _source_aggregates(
+    pgsql_connection, mapping: TableMapping, key_range: tuple, sub_ranges: list[tuple]
+) -> list[tuple[int, int]]:
+    """Return the row count and hash sum of every sub-range of the source table."""
+    case, parameters = _range_index_case(sub_ranges, mapping.key)
+    rows = pgsql_connection.execute(
+        text(
+            f"SELECT {case} AS range_index, COUNT(*), SUM({_row_bucket(mapping)}) FROM {mapping.source_table} WHERE {key_range_clause(key_range, mapping.key)} GROUP BY 1"  # nosec ignore SQL injection risk, as the input data is sanitized
+        ),
+        {**parameters, **_range_parameters(key_range)},
+    ).all()
+    aggregates = [(0, 0)] * len(sub_ranges)
+    for range_index, count, hash_sum in rows:
+        aggregates[range_index] = (count, int(hash_sum))
+    return aggregates
+
+
+def _destination_aggregates(
+    turso_connection, mapping: TableMapping, key_range: tuple, sub_ranges: list[tuple]
+) -> list[tuple[int, int]]:
+    """Return the row count and ledger hash sum of every sub-range of the backup table.
+
+    Rows are counted in the backup table itself, so rows written or removed outside of the synchronization
+    also make their range differ.
+    """
+    key_column = f"destination.{mapping.destination_key}"
+    case, parameters = _range_index_case(sub_ranges, key_column)
+    rows = turso_connection.execute(
+        text(
+            f"SELECT {case} AS range_index, COUNT(*), SUM(ledger.bucket) FROM {mapping.destination_table} AS destination LEFT JOIN {ROW_HASHES_TABLE} AS ledger ON ledger.table_name = :table_name AND ledger.row_key = {key_column} WHERE {key_range_clause(key_range, key_column)} GROUP BY 1"  # nosec ignore SQL injection here as values are bound parameters
+        ),
+        {
+            **parameters,
+            **_range_parameters(key_range),
+            "table_name": mapping.destination_table,
+        },
+    ).all()
+    aggregates = [(0, 0)] * len(sub_ranges)
+    for range_index, count, hash_sum in rows:
+        aggregates[range_index] = (count, int(hash_sum or 0))
+    return aggregates
+
+
+def _sync_range(
+    turso_connection,
+    pgsql_connection,
+    mapping: TableMapping,
+    key_range: tuple,
+    to_encrypt_database: bool,
+) -> tuple[int, int]:
+    """Upsert the rows of a key range whose hash differs and delete the rows missing from the source."""
+    source_rows = pgsql_connection.execute(
+        text(
+            f"SELECT {', '.join(mapping.source_columns)}, {_row_hash(mapping)} FROM {mapping.source_table} WHERE {key_range_clause(key_range, mapping.key)}"  # nosec ignore SQL injection risk, as the input data is sanitized
+        ),
+        _range_parameters(key_range),
+    ).all()
+    ledger = dict(
+        turso_connection.execute(
+            text(
+                f"SELECT row_key, row_hash FROM {ROW_HASHES_TABLE} WHERE table_name = :table_name AND {key_range_clause(key_range, 'row_key')}"  # nosec ignore SQL injection here as values are bound parameters
+            ),
+            {**_range_parameters(key_range), "table_name": mapping.destination_table},
+        ).all()
+    )
+    destination_keys = set(
+        turso_connection.execute(
+            text(
+                f"SELECT {mapping.destination_key} FROM {mapping.destination_table} WHERE {key_range_clause(key_range, mapping.destination_key)}"  # nosec ignore SQL injection here as values are bound parameters
+            ),
+            _range_parameters(key_range),
+        ).scalars()
+    )
+
+    key_index = mapping.source_columns.index(mapping.key)
+    changed_rows = [
+        row
+        for row in source_rows
+        if ledger.get(_normalize_key(row[key_index])) != row[-1]
+    ]
+    source_keys = {_normalize_key(row[key_index]) for row in source_rows}
+    deleted_keys = sorted((set(ledger) | destination_keys) - source_keys)
+
+    record_rows(
+        turso_connection,
+        mapping,
+        [row[:-1] for row in changed_rows],
+        commit=False,
+        to_encrypt_database=to_encrypt_database,
+        upsert=True,
+    )
+    for batch in chunked(changed_rows, LOAD_BATCH_SIZE):
+        insert_rows(
+            turso_connection,
+            ROW_HASHES_TABLE,
+            ("table_name", "row_key", "row_hash", "bucket"),
+            [
+                (
+                    mapping.destination_table,
+                    _normalize_key(row[key_index]),
+                    row[-1],
+                    int(row[-1][:8], 16),
+                )
+                for row in batch
+            ],
+            conflict_columns=("table_name", "row_key"),
+        )
+
+    delete_rows(
+        turso_connection,
+        mapping.destination_table,
+        mapping.destination_key,
+        deleted_keys,
+    )
+    for batch in chunked(deleted_keys, LOAD_BATCH_SIZE):
+        turso_connection.execute(
+            text(
+                f"DELETE FROM {ROW_HASHES_TABLE} WHERE table_name = :table_name AND row_key IN :keys"  # nosec ignore SQL injection here as keys are bound parameters
+            ).bindparams(bindparam("keys", expanding=True)),
+            {"table_name": mapping.destination_table, "keys": batch},
+        )
+    turso_connection.commit()
+    return len(changed_rows), len(deleted_keys)
+
+
+def diff_table(
+    turso_connection,
+    pgsql_connection,
+    mapping: TableMapping,
+    to_encrypt_database: bool = True,
+    fanout: int = MERKLE_FANOUT,
+    leaf_size: int = MERKLE_LEAF_SIZE,
+) -> dict[str, int]:
+    """Synchronize a backup table with its source by comparing the hashes of key ranges.
+
+    Args:
+        turso_connection: The backup database connection object.
+        pgsql_connection: The source database connection object.
+        mapping: The mapping of the compared table.
+        to_encrypt_database: Whether to encrypt the user data before storing it in the database.
+        fanout: The number of sub-ranges a differing range is split into.
+        leaf_size: The number of rows under which a differing range is synchronized row by row.
+    Returns:
+        dict[str, int]: The number of compared ranges, upserted rows and deleted rows.
+    """
+    create_row_hashes_table(turso_connection)
+    counts = {"ranges": 0, "upserted": 0, "deleted": 0}
+    pending_ranges = [(None, None)]
+    while pending_ranges:
+        key_range = pending_ranges.pop()
+        sub_ranges = [
+            tuple(_normalize_key(key) for key in sub_range)
+            for sub_range in get_key_ranges(
+                pgsql_connection,
+                mapping.source_table,
+                fanout,
+                key_column=mapping.key,
+                key_range=key_range,
+            )
+        ]
+        source_aggregates = _source_aggregates(
+            pgsql_connection, mapping, key_range, sub_ranges
+        )
+        destination_aggregates = _destination_aggregates(
+            turso_connection, mapping, key_range, sub_ranges
+        )
+        counts["ranges"] += len(sub_ranges)
+
+        for sub_range, source_aggregate, destination_aggregate in zip(
+            sub_ranges, source_aggregates, destination_aggregates
+        ):
+            if source_aggregate == destination_aggregate:
+                continue
+            row_count = max(source_aggregate[0], destination_aggregate[0])
+            if row_count <= leaf_size or len(sub_ranges) == 1:
+                upserted, deleted = _sync_range(
+                    turso_connection,
+                    pgsql_connection,
+                    mapping,
+                    sub_range,
+                    to_encrypt_database,
+                )
+                counts["upserted"] += upserted
+                counts["deleted"] += deleted
+            else:
+                pending_ranges.append(sub_range)
+
+    logger.info(
+        "Diff synchronization of %s done: %s", mapping.destination_table, counts
+    )
+    return counts
+
+
+def run_diff_sync(
+    turso_connection,
+    pgsql_connection,
+    to_encrypt_database: bool = True,
+    mappings: tuple[TableMapping, ...] | None = None,
+) -> dict[str, dict[str, int]]:
+    """Synchronize the backup database with the source database by hash comparison.
+
+    The first run ships every row, as the hash ledger of the backup is empty.
+    Args:
+        turso_connection: The backup database connection object.
+        pgsql_connection: The source database connection object.
+        to_encrypt_database: Whether to encrypt the user data before storing it in the database.
+        mappings: The mappings of the compared tables, the configured mappings by default.
+    Returns:
+        dict[str, dict[str, int]]: The counts of `diff_table` by table.
+    """
+    counts = {}
+    for mapping in mappings or get_table_mappings():
+        counts[mapping.destination_table] = diff_table(
+            turso_connection, pgsql_connection, mapping, to_encrypt_database
+        )
+    return counts
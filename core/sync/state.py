@@ -0,0 +1,64 @@
+"""This file is part of the ETL project for PostgreSQL to Turso migration.
+
+It handles the key/value sync-state table stored in the backup database, used to remember
+high-water marks and other bookkeeping values between runs.
+"""
+
+import logging
+
+from sqlalchemy import text
+
+from config.default import SYNC_STATE_TABLE
+
+logger = logging.getLogger("__main__")
+
+
+def create_sync_state_table(connection) -> None:
+    """Create the sync-state table in the backup database if it does not exist.
+
+    Args:
+        connection: The database connection object.
+    """
+    connection.execute(
+        text(
+            f"CREATE TABLE IF NOT EXISTS {SYNC_STATE_TABLE} (state_key TEXT PRIMARY KEY, state_value TEXT, date_updated TEXT)"  # nosec ignore SQL injection here as no input data is being inserted
+        )
+    )
+
+
+def get_state(connection, state_key: str) -> str | None:
+    """Read a value of the sync-state table.
+
+    Args:
+        connection: The database connection object.
+        state_key: The key of the value to read.
+    Returns:
+        str | None: The stored value, None if the key has never been set.
+    """
+    return connection.execute(
+        text(
+            f"SELECT state_value FROM {SYNC_STATE_TABLE} WHERE state_key = :state_key"  # nosec ignore SQL injection here as values are bound parameters
+        ),
+        {"state_key": state_key},
+    ).scalar()
+
+
+def set_state(connection, state_key: str, state_value) -> None:
+    """Write a value of the sync-state table.
+
+    The value is not committed, so it can be saved in the same transaction as the data it describes.
+    Args:
+        connection: The database connection object.
+        state_key: The key of the value to write.
+        state_value: The value to store, converted to a string.
+    """
+    connection.execute(
+        text(
+            f"INSERT INTO {SYNC_STATE_TABLE} (state_key, state_value, date_updated) VALUES (:state_key, :state_value, CURRENT_TIMESTAMP) ON CONFLICT (state_key) DO UPDATE SET state_value = excluded.state_value, date_updated = excluded.date_updated"  # nosec ignore SQL injection here as values are bound parameters
+        ),
+        {
+            "state_key": state_key,
+            "state_value": None if state_value is None else str(state_value),
+        },
+    )
+    logger.debug("Sync state %s set to %s", state_key, state_value)
@@ -1,23 +1,85 @@
 """ETL application to extract data from a PostgreSQL database and load it into a Turso database."""
 
+import atexit
 import logging
+import signal
 import sys
+from concurrent.futures import ThreadPoolExecutor
+from itertools import chain
+from logging.handlers import RotatingFileHandler
 from os.path import join
+from typing import Callable, Iterable, Iterator
 
 from config.default import *
 from core.database_managers.connection_managers import (
+    LocalFileDBConnectionManager,
     PgSQLDBConnectionManager,
     TursoDBConnectionManager,
 )
-from core.extract.iam_gateway import get_all_user_roles, get_all_users
+from core.extract.copy import iter_rows_copy
+from core.helpers.batching import chunked
+from core.helpers.logs import configure_queue_logging
+from core.helpers.metrics import metrics, payload_size
+from core.helpers.retry import retry
+from core.load.batch_sizing import get_batch_sizer
+from core.load.checkpoints import (
+    CheckpointTracker,
+    finish_run,
+    get_checkpoint,
+    get_unfinished_run,
+    save_checkpoint,
+    start_run,
+)
 from core.load.iam_gateway import (
-    User,
-    record_user,
-    record_user_role,
+    prepare_data_key,
     set_timestamp,
     truncate_tables,
 )
-from core.models.iam_gateway import UserRole
+from core.load.local_snapshot import (
+    build_local_indexes,
+    copy_table_definitions,
+    push_tables,
+)
+from core.load.schema import (
+    analyze_tables,
+    build_staging_indexes,
+    bulk_load_pragmas,
+    create_staging_tables,
+    drop_secondary_indexes,
+    ensure_destination_schema,
+    rebuild_secondary_indexes,
+    staging_table_name,
+    staging_tables_exist,
+    swap_staging_tables,
+)
+from core.mapping.engine import (
+    insert_mapped_rows,
+    iter_row_pages,
+    iter_rows,
+    iter_rows_partitioned,
+    to_destination_rows,
+)
+from core.mapping.tables import TableMapping, get_table_mappings
+from core.pipeline.runner import run_pipeline
+from core.scheduler.daemon import (
+    CronSchedule,
+    CycleLock,
+    Daemon,
+    IntervalSchedule,
+)
+from core.sync.cdc import CdcConsumer, install_cdc
+from core.sync.change_gate import (
+    CHANGE_DETECTION_METHODS,
+    capture_fingerprints,
+    has_changed,
+    save_fingerprints,
+)
+from core.sync.incremental import (
+    capture_high_water_marks,
+    run_incremental_sync,
+    save_high_water_marks,
+)
+from core.sync.merkle import run_diff_sync
 
 logger = logging.getLogger(__name__)
 
@@ -25,22 +87,27 @@ logger = logging.getLogger(__name__)
 def configure_loggers(log_level):
     """Configure the logging system for the app.
 
+    The records are written by a background thread, to the console and to a log file rotated every LOG_MAX_BYTES,
+    and only one debug or info record out of LOG_SAMPLE_EVERY is kept for each message.
     Args:
         log_level (str): The logging level for the app.
     """
     console_handler = logging.StreamHandler()
-    file_handler = logging.FileHandler(
-        join(BASE_DIR, "logs", "etl_pgsql_to_turso.log"), mode="a", encoding="utf-8"
+    file_handler = RotatingFileHandler(
+        join(BASE_DIR, "logs", "etl_pgsql_to_turso.log"),
+        mode="a",
+        maxBytes=LOG_MAX_BYTES,
+        backupCount=LOG_BACKUP_COUNT,
+        encoding="utf-8",
     )
-    a = BASE_DIR
     formatter = logging.Formatter(LOG_FORMAT, style="%", datefmt="%Y-%m-%d %H:%M")
     console_handler.setFormatter(formatter)
     file_handler.setFormatter(formatter)
 
-    logger.addHandler(console_handler)
-    logger.addHandler(file_handler)
-
-    logger.setLevel(log_level)
+    listener = configure_queue_logging(
+        logger, [console_handler, file_handler], log_level, LOG_SAMPLE_EVERY
+    )
+    atexit.register(listener.stop)
 
 
 def configure_app(environment: str) -> tuple[str, str, str]:
@@ -83,6 +150,8 @@ def init_databases(
         turso_auth_token (str): The authentication token for the Turso database.
         pgsql_connection_string (str): The connection string for the PostgreSQL database.
 
+    The connection to both databases is established concurrently, and retried on transient errors.
+
     Returns:
         tuple[TursoDBConnectionManager, PgSQLDBConnectionManager]: A tuple containing the Turso and PostgreSQL connection managers.
     """
@@ -92,91 +161,624 @@ def init_databases(
     pgsql_db_manager = PgSQLDBConnectionManager(
         sql_connection_string=pgsql_connection_string
     )
+    # Both databases are reached concurrently, so the startup waits for the slowest one only
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        for future in [
+            executor.submit(turso_db_manager.warm_up),
+            executor.submit(pgsql_db_manager.warm_up),
+        ]:
+            future.result()
 
     return turso_db_manager, pgsql_db_manager
 
 
-def extract_user_data(connection) -> list[User]:
-    """Extract user data from the PostgreSQL database.
+def extract_table_data(
+    pgsql_db_manager: PgSQLDBConnectionManager, mapping: TableMapping
+) -> Iterator[tuple]:
+    """Extract the rows of a mapped table from the PostgreSQL database.
+
+    The table is read concurrently by key ranges when EXTRACT_PARTITIONS is greater than 1,
+    and streamed with COPY instead of a cursor when EXTRACT_METHOD is 'copy'.
 
     Args:
-        connection: The database connection object.
+        pgsql_db_manager: The PostgreSQL connection manager.
+        mapping: The mapping of the table.
     Returns:
-        list[User]: A list of User objects representing all users in the database.
+        Iterator[tuple]: A stream of the source rows, ordered like the columns of the mapping.
     """
-    return get_all_users(connection)
+    extract = iter_rows_copy if EXTRACT_METHOD == "copy" else iter_rows
+    if EXTRACT_PARTITIONS > 1:
+        rows = iter_rows_partitioned(pgsql_db_manager, mapping, extract=extract)
+    else:
+        rows = extract(pgsql_db_manager.get_current_connection(), mapping)
+    return metrics.count_iter(f"extract_{mapping.name}", rows)
+
+
+def _load_batch(stage: str, rows: list[tuple], insert: Callable[[], int]) -> int:
+    """Insert a batch of rows and add its row count, size and batch to the metrics of a stage."""
+    inserted = insert()
+    size = payload_size(rows)
+    metrics.add(stage, rows=inserted, bytes=size, batches=1)
+    logger.debug("%s: batch of %d rows (%d bytes) loaded", stage, inserted, size)
+    return inserted
 
 
-def extract_user_role_data(connection) -> list[UserRole]:
-    """Extract user role data from the PostgreSQL database.
+def load_table_data(
+    connection,
+    mapping: TableMapping,
+    rows: Iterable[tuple],
+    table_name: str | None = None,
+):
+    """Load the rows of a mapped table into the Turso database.
+
+    The rows are read, converted, encrypted and recorded by batches in a pipeline, so reading the source,
+    encrypting and writing to the database overlap. The batches are sized from the latency of the previous
+    ones when LOAD_BATCH_ADAPTIVE is enabled, and hold LOAD_BATCH_SIZE rows otherwise.
+    The rows are upserted, so a load started over is idempotent, and the rows rejected by the backup database
+    are moved to DEAD_LETTERS_TABLE instead of failing the load.
 
     Args:
         connection: The database connection object.
-    Returns:
-        list[UserRole]: A list of UserRole objects representing all user roles in the database.
+        mapping: The mapping of the table.
+        rows: A list or an iterator of source rows to load into the database.
+        table_name: The table to load, the destination table of the mapping or its staging table.
     """
-    return get_all_user_roles(connection)
+    stage = f"load_{mapping.name}"
+    to_encrypt_database = bool(mapping.encrypted_indexes)
+    sizer = get_batch_sizer(mapping.destination_table)
+    with metrics.stage(stage):
+        data_key = prepare_data_key(connection, to_encrypt_database)
+        run_pipeline(
+            mapping.destination_table,
+            sizer.batches(rows) if sizer else chunked(rows, LOAD_BATCH_SIZE),
+            lambda batch: to_destination_rows(
+                mapping, batch, to_encrypt_database, data_key
+            ),
+            lambda batch_rows: _load_batch(
+                stage,
+                batch_rows,
+                lambda: insert_mapped_rows(
+                    connection,
+                    mapping,
+                    batch_rows,
+                    upsert=True,
+                    table_name=table_name,
+                    sizer=sizer,
+                ),
+            ),
+        )
+
+        connection.commit()
+    if sizer:
+        sizer.log_settled()
 
 
-def load_user_data(connection, users: list[User]):
-    """Load user data into the Turso database.
+def load_table_checkpointed(
+    connection,
+    pgsql_db_manager: PgSQLDBConnectionManager,
+    mapping: TableMapping,
+    run_id: str,
+    table_name: str | None = None,
+):
+    """Load the rows of a mapped table by batches committed with their checkpoint.
 
-    This function iterates over a list of User objects and records each user in the database.
+    The source is read in key order from the last committed key of the run, by keyset pagination or by a COPY
+    stream when EXTRACT_METHOD is 'copy', and every batch is
+    committed with the new checkpoint, so an interrupted load only redoes the batches that were not committed.
+    The rows are upserted, as the batches of a resumed run committed after the checkpoint may be read again.
 
     Args:
         connection: The database connection object.
-        users: A list of User objects to load into the database.
+        pgsql_db_manager: The PostgreSQL connection manager.
+        mapping: The mapping of the table.
+        run_id: The run id of the load.
+        table_name: The table to load, the destination table of the mapping or its staging table.
     """
-    for user in users:
-        record_user(connection, user, False, True)
+    table_name = table_name or mapping.destination_table
+    last_key, rows_loaded, completed = get_checkpoint(connection, run_id, table_name)
+    if completed:
+        logger.info("%s is already loaded by the run %s", table_name, run_id)
+        return
+    if last_key is not None:
+        logger.info(
+            "Resuming the load of %s after the key %s, %d rows already loaded",
+            table_name,
+            last_key,
+            rows_loaded,
+        )
+
+    stage = f"load_{mapping.name}"
+    key_index = mapping.source_columns.index(mapping.key)
+    to_encrypt_database = bool(mapping.encrypted_indexes)
+    tracker = CheckpointTracker(last_key, rows_loaded)
+    sizer = get_batch_sizer(mapping.destination_table)
+    if EXTRACT_METHOD == "copy":
+        source_rows = iter_rows_copy(
+            pgsql_db_manager.get_current_connection(),
+            mapping,
+            after=last_key,
+            ordered=True,
+        )
+    else:
+        source_rows = chain.from_iterable(
+            iter_row_pages(pgsql_db_manager.get_current_connection(), mapping, last_key)
+        )
+    rows = metrics.count_iter(f"extract_{mapping.name}", source_rows)
+
+    with metrics.stage(stage):
+        data_key = prepare_data_key(connection, to_encrypt_database)
+
+        def transform(numbered_batch: tuple[int, list]) -> tuple:
+            sequence, batch = numbered_batch
+            return (
+                sequence,
+                batch[-1][key_index],
+                to_destination_rows(mapping, batch, to_encrypt_database, data_key),
+            )
+
+        def commit_batch(sequence: int, batch_last_key, batch_rows: list) -> int:
+            inserted = insert_mapped_rows(
+                connection,
+                mapping,
+                batch_rows,
+                upsert=True,
+                table_name=table_name,
+                sizer=sizer,
+            )
+            checkpoint = tracker.commit(sequence, batch_last_key, inserted)
+            save_checkpoint(
+                connection, run_id, table_name, checkpoint, tracker.rows_loaded
+            )
+            connection.commit()
+            return inserted
+
+        run_pipeline(
+            mapping.destination_table,
+            enumerate(sizer.batches(rows) if sizer else chunked(rows, LOAD_BATCH_SIZE)),
+            transform,
+            lambda numbered_rows: _load_batch(
+                stage, numbered_rows[2], lambda: commit_batch(*numbered_rows)
+            ),
+        )
+
+        save_checkpoint(
+            connection,
+            run_id,
+            table_name,
+            tracker.last_key,
+            tracker.rows_loaded,
+            completed=True,
+        )
+        connection.commit()
+    if sizer:
+        sizer.log_settled()
 
-    connection.commit()
 
+def begin_load(connection, can_resume: bool) -> tuple[str | None, bool]:
+    """Start a checkpointed load, or resume the one interrupted by a previous cycle.
 
-def load_user_role_data(connection, user_roles: list[UserRole]):
-    """Load user role data into the Turso database.
+    Loads are not checkpointed when LOAD_CHECKPOINTS is disabled or the tables are read by key ranges,
+    as the rows of concurrent ranges are not read in key order.
 
-    This function iterates over a list of UserRole objects and records each user role in the database.
+    Args:
+        connection: The database connection object.
+        can_resume: Whether the tables written by an interrupted load are still there.
+    Returns:
+        tuple[str | None, bool]: The run id of the load, None when it is not checkpointed,
+            and whether it is resumed.
+    """
+    if not LOAD_CHECKPOINTS or EXTRACT_PARTITIONS > 1:
+        return None, False
+    run_id = get_unfinished_run(connection)
+    if run_id is not None and can_resume:
+        logger.info("Resuming the interrupted load %s", run_id)
+        return run_id, True
+    return start_run(connection), False
+
+
+def load_tables(
+    connection,
+    pgsql_db_manager: PgSQLDBConnectionManager,
+    mappings: tuple[TableMapping, ...],
+    table_names: Iterable[str],
+    run_id: str | None,
+):
+    """Load every mapped table, with checkpoints when the load has a run id.
 
     Args:
         connection: The database connection object.
-        user_roles: A list of UserRole objects to load into the database.
+        pgsql_db_manager: The PostgreSQL connection manager.
+        mappings: The mappings of the loaded tables.
+        table_names: The table to load for every mapping, its destination table or its staging table.
+        run_id: The run id of the checkpointed load, None to load without checkpoints.
+    """
+    for mapping, table_name in zip(mappings, table_names):
+        if run_id is None:
+            load_table_data(
+                connection,
+                mapping,
+                extract_table_data(pgsql_db_manager, mapping),
+                table_name,
+            )
+        else:
+            load_table_checkpointed(
+                connection, pgsql_db_manager, mapping, run_id, table_name
+            )
+
+
+def load_with_swap(
+    turso_db_manager: TursoDBConnectionManager,
+    pgsql_db_manager: PgSQLDBConnectionManager,
+    mappings: tuple[TableMapping, ...],
+):
+    """Load the backup tables through staging tables swapped with the live tables once complete.
+
+    The live tables keep serving the previous backup until the swap, instead of being emptied first.
+    The staging tables of an interrupted load are kept and completed. The staging tables are loaded without
+    indexes and under the BULK_LOAD_PRAGMAS, and the swapped tables are analyzed when LOAD_ANALYZE is enabled.
+
+    Args:
+        turso_db_manager: The Turso connection manager.
+        pgsql_db_manager: The PostgreSQL connection manager.
+        mappings: The mappings of the loaded tables.
+    """
+    connection = turso_db_manager.get_current_connection()
+    table_names = tuple(mapping.destination_table for mapping in mappings)
+    run_id, resumed = begin_load(
+        connection, staging_tables_exist(connection, table_names)
+    )
+    if resumed:
+        staging_tables = [staging_table_name(table_name) for table_name in table_names]
+    else:
+        with metrics.stage("create_staging"):
+            staging_tables = create_staging_tables(connection, table_names)
+    with bulk_load_pragmas(connection):
+        load_tables(connection, pgsql_db_manager, mappings, staging_tables, run_id)
+    with metrics.stage("set_timestamp"):
+        if not set_timestamp(connection, staging_tables):
+            raise RuntimeError("The staging tables could not be stamped.")
+    with metrics.stage("build_indexes"):
+        build_staging_indexes(connection, table_names)
+    with metrics.stage("swap"):
+        swap_staging_tables(connection, table_names)
+    if run_id is not None:
+        finish_run(connection, run_id)
+    if LOAD_ANALYZE:
+        with metrics.stage("analyze"):
+            analyze_tables(connection, table_names)
+
+
+def load_with_truncate(
+    turso_db_manager: TursoDBConnectionManager,
+    pgsql_db_manager: PgSQLDBConnectionManager,
+    mappings: tuple[TableMapping, ...],
+):
+    """Load the backup tables after emptying them.
+
+    The tables of an interrupted load are not emptied again, their load is completed.
+    When LOAD_DEFER_INDEXES is enabled, the secondary indexes are dropped during the load and rebuilt at its end.
+    The tables are loaded under the BULK_LOAD_PRAGMAS, and analyzed when LOAD_ANALYZE is enabled.
+
+    Args:
+        turso_db_manager: The Turso connection manager.
+        pgsql_db_manager: The PostgreSQL connection manager.
+        mappings: The mappings of the loaded tables.
+    """
+    connection = turso_db_manager.get_current_connection()
+    table_names = [mapping.destination_table for mapping in mappings]
+    run_id, resumed = begin_load(connection, can_resume=True)
+    if LOAD_DEFER_INDEXES:
+        with metrics.stage("drop_indexes"):
+            drop_secondary_indexes(connection, table_names)
+    if not resumed:
+        with metrics.stage("truncate"):
+            if not truncate_tables(connection, table_names):
+                raise RuntimeError("The backup tables could not be emptied.")
+    with bulk_load_pragmas(connection):
+        load_tables(connection, pgsql_db_manager, mappings, table_names, run_id)
+    with metrics.stage("set_timestamp"):
+        if not set_timestamp(connection, table_names):
+            raise RuntimeError("The backup tables could not be stamped.")
+    with metrics.stage("build_indexes"):
+        rebuild_secondary_indexes(connection)
+    if run_id is not None:
+        finish_run(connection, run_id)
+    if LOAD_ANALYZE:
+        with metrics.stage("analyze"):
+            analyze_tables(connection, table_names)
+
+
+def load_with_local_file(
+    turso_db_manager: TursoDBConnectionManager,
+    pgsql_db_manager: PgSQLDBConnectionManager,
+    mappings: tuple[TableMapping, ...],
+):
+    """Load the backup tables in the LOCAL_SNAPSHOT_FILE file, then push them to the Turso database in bulk.
+
+    The load itself does not wait for the network, and its checkpoints are kept in the local file,
+    so an interrupted load or push resumes from the local file.
+
+    Args:
+        turso_db_manager: The Turso connection manager.
+        pgsql_db_manager: The PostgreSQL connection manager.
+        mappings: The mappings of the loaded tables.
+    """
+    local_db_manager = LocalFileDBConnectionManager(LOCAL_SNAPSHOT_FILE)
+    try:
+        remote = turso_db_manager.get_current_connection()
+        local = local_db_manager.get_current_connection()
+        table_names = [mapping.destination_table for mapping in mappings]
+        run_id, resumed = begin_load(local, can_resume=True)
+        if not resumed:
+            with metrics.stage("create_local"):
+                copy_table_definitions(remote, local, table_names)
+        load_tables(local, pgsql_db_manager, mappings, table_names, run_id)
+        with metrics.stage("set_timestamp"):
+            if not set_timestamp(local, table_names):
+                raise RuntimeError("The local tables could not be stamped.")
+        with metrics.stage("build_indexes"):
+            build_local_indexes(remote, local, table_names)
+        with metrics.stage("push"):
+            counts = push_tables(local, remote, table_names)
+        metrics.add("push", rows=sum(counts.values()))
+        if run_id is not None:
+            finish_run(local, run_id)
+        if LOAD_ANALYZE:
+            with metrics.stage("analyze"):
+                analyze_tables(remote, table_names)
+    finally:
+        local_db_manager.dispose()
+
+
+def write_metrics_reports(status: str):
+    """Write the metrics reports of a cycle to METRICS_DIR, logging the errors instead of raising them.
+
+    The reports are written once the cycle is over, so an error writing them must not replace the error of the cycle.
+
+    Args:
+        status: The outcome of the cycle, 'success', 'failure' or 'skipped'.
     """
-    for user_role in user_roles:
-        # Assuming there's a function to record user roles similar to record_user
-        record_user_role(connection, user_role, False)
+    try:
+        metrics.write_reports(METRICS_DIR, status, RUN_BUDGET_SECONDS)
+    except Exception as e:
+        logger.error(
+            "The metrics reports could not be written to %s: %s", METRICS_DIR, e
+        )
+
 
-    connection.commit()
+def run_sync_with_retry(
+    sync: Callable,
+    turso_db_manager: TursoDBConnectionManager,
+    pgsql_db_manager: PgSQLDBConnectionManager,
+):
+    """Run a synchronization, starting it over on transient errors.
 
+    The incremental and diff synchronizations only commit consistent steps, so running them again is safe.
+
+    Args:
+        sync: The synchronization function, taking the Turso and PostgreSQL connections.
+        turso_db_manager: The Turso connection manager.
+        pgsql_db_manager: The PostgreSQL connection manager.
+    """
 
-def main(environment: str = "dev"):
+    def attempt():
+        turso_connection = turso_db_manager.get_current_connection()
+        pgsql_connection = pgsql_db_manager.get_current_connection()
+        try:
+            return sync(turso_connection, pgsql_connection)
+        except Exception:
+            for connection in (turso_connection, pgsql_connection):
+                try:
+                    connection.rollback()
+                except Exception as e:
+                    logger.warning("Rollback failed: %s", e)
+            raise
+
+    return retry(attempt)
+
+
+def run_cycle(
+    turso_db_manager: TursoDBConnectionManager,
+    pgsql_db_manager: PgSQLDBConnectionManager,
+    sync_mode: str = SYNC_MODE,
+):
+    """Run one synchronization cycle.
+
+    The cycle is skipped when CHANGE_DETECTION finds that the source tables have not changed since the last one.
+    The connections are returned to their pool at the end of the cycle, so no transaction stays open between cycles.
+    The metrics of the cycle are written to METRICS_DIR as JSON and as a Prometheus textfile.
+    Args:
+        turso_db_manager: The Turso connection manager.
+        pgsql_db_manager: The PostgreSQL connection manager.
+        sync_mode (str): The synchronization mode ('full', 'incremental' or 'diff').
+    """
+    metrics.reset()
+    status = "failure"
+    try:
+        with metrics.stage("connect"):
+            turso_db_manager.get_current_connection()
+            pgsql_db_manager.get_current_connection()
+
+        fingerprints = None
+        if CHANGE_DETECTION in CHANGE_DETECTION_METHODS:
+            with metrics.stage("check_changes"):
+                fingerprints = capture_fingerprints(
+                    pgsql_db_manager.get_current_connection(),
+                    CHANGE_DETECTION,
+                    tuple(mapping.source_table for mapping in get_table_mappings()),
+                )
+                changed = has_changed(
+                    turso_db_manager.get_current_connection(), fingerprints
+                )
+            if not changed:
+                logger.info("The source tables have not changed, the cycle is skipped")
+                status = "skipped"
+                return
+
+        if sync_mode == "incremental":
+            with metrics.stage("incremental_sync"):
+                counts = run_sync_with_retry(
+                    run_incremental_sync, turso_db_manager, pgsql_db_manager
+                )
+            metrics.add("incremental_sync", rows=sum(counts.values()))
+        elif sync_mode == "diff":
+            with metrics.stage("diff_sync"):
+                counts = run_sync_with_retry(
+                    run_diff_sync, turso_db_manager, pgsql_db_manager
+                )
+            metrics.add(
+                "diff_sync",
+                rows=sum(
+                    table_counts["upserted"] + table_counts["deleted"]
+                    for table_counts in counts.values()
+                ),
+            )
+        else:
+            mappings = get_table_mappings()
+            high_water_marks = capture_high_water_marks(
+                pgsql_db_manager.get_current_connection(), mappings
+            )
+
+            # Stream data from postgres DB into TursoDB
+            with metrics.stage("check_schema"):
+                ensure_destination_schema(
+                    turso_db_manager.get_current_connection(), mappings
+                )
+            if TURSO_WRITE_MODE == "local":
+                load_with_local_file(turso_db_manager, pgsql_db_manager, mappings)
+            elif LOAD_MODE == "swap":
+                load_with_swap(turso_db_manager, pgsql_db_manager, mappings)
+            else:
+                load_with_truncate(turso_db_manager, pgsql_db_manager, mappings)
+            save_high_water_marks(
+                turso_db_manager.get_current_connection(), high_water_marks
+            )
+
+        if fingerprints is not None:
+            save_fingerprints(turso_db_manager.get_current_connection(), fingerprints)
+        status = "success"
+    finally:
+        turso_db_manager.disconnect()
+        pgsql_db_manager.disconnect()
+        write_metrics_reports(status)
+
+
+def run_cdc(
+    turso_db_manager: TursoDBConnectionManager,
+    pgsql_db_manager: PgSQLDBConnectionManager,
+):
+    """Apply the changes captured in the source database to the backup database until SIGTERM is received.
+
+    The changelog is drained, then the consumer waits for a notification on CDC_CHANNEL, or for
+    CDC_POLL_INTERVAL seconds, before draining it again. The metrics of every drain applying changes
+    are written to METRICS_DIR.
+    Args:
+        turso_db_manager: The Turso connection manager.
+        pgsql_db_manager: The PostgreSQL connection manager.
+    """
+    consumer = CdcConsumer(turso_db_manager, pgsql_db_manager, get_table_mappings())
+    for signum in (signal.SIGTERM, signal.SIGINT):
+        signal.signal(signum, consumer.stop)
+
+    listener_connection = listener = None
+    if CDC_LISTEN:
+        listener_connection = pgsql_db_manager.checkout().execution_options(
+            isolation_level="AUTOCOMMIT"
+        )
+        listener_connection.exec_driver_sql(f"LISTEN {CDC_CHANNEL}")
+        listener = listener_connection.connection.dbapi_connection
+    logger.info("Change consumer started")
+    try:
+        while not consumer.stopping.is_set():
+            metrics.reset()
+            status = "failure"
+            counts = {}
+            try:
+                with metrics.stage("cdc"):
+                    counts = run_sync_with_retry(
+                        lambda turso_connection, pgsql_connection: consumer.drain(),
+                        turso_db_manager,
+                        pgsql_db_manager,
+                    )
+                status = "success"
+            except Exception as e:
+                logger.error("The changes could not be applied: %s", e)
+            if counts or status == "failure":
+                metrics.add(
+                    "cdc",
+                    rows=sum(
+                        table_counts["upserted"] + table_counts["deleted"]
+                        for table_counts in counts.values()
+                    ),
+                )
+                write_metrics_reports(status)
+            consumer.wait_for_changes(listener)
+    finally:
+        if listener_connection is not None:
+            listener_connection.close()
+        turso_db_manager.disconnect()
+        pgsql_db_manager.disconnect()
+    logger.info("Change consumer stopped")
+
+
+def main(environment: str = "dev", sync_mode: str = SYNC_MODE, daemon: bool = False):
     """Launch the ETL process.
 
     This function configures the application, initializes database connections,
+    then either reloads the backup tables ('full'), only applies the changes since the last run ('incremental'),
+    or only ships the rows whose hash differs between both databases ('diff').
+    The 'setup-cdc' mode installs the change capture in the source database, and the 'cdc' mode
+    applies the captured changes continuously.
+    In daemon mode, the cycles run every DAEMON_INTERVAL seconds, or on the DAEMON_CRON expression when it is set,
+    until SIGTERM is received. A cycle is skipped while another process holds the DAEMON_LOCK_FILE lock.
     Args:
         environment (str): The environment to run the ETL process in ('dev' or 'prod').
+        sync_mode (str): The synchronization mode ('full', 'incremental', 'diff', 'setup-cdc' or 'cdc').
+        daemon (bool): Whether to keep running cycles on a schedule instead of running a single one.
     """
+    if sync_mode not in ("full", "incremental", "diff", "setup-cdc", "cdc"):
+        raise ValueError("Invalid synchronization mode specified.")
     turso_connection_string, turso_auth_token, pgsql_connection_string, log_level = (
         configure_app(environment)
     )
     configure_loggers(log_level)
+    logger.info(
+        "Executing the application on environment %s in %s mode%s",
+        environment,
+        sync_mode,
+        " as a daemon" if daemon else "",
+    )
     turso_db_manager, pgsql_db_manager = init_databases(
         turso_connection_string, turso_auth_token, pgsql_connection_string
     )
 
-    # Extract data from postgres DB
-    users = extract_user_data(pgsql_db_manager.get_current_connection())
-    user_roles = extract_user_role_data(pgsql_db_manager.get_current_connection())
-
-    # Load data into TursoDB
-    truncate_tables(turso_db_manager.get_current_connection())
-    load_user_data(turso_db_manager.get_current_connection(), users)
-    load_user_role_data(turso_db_manager.get_current_connection(), user_roles)
-    set_timestamp(turso_db_manager.get_current_connection())
+    lock = CycleLock(DAEMON_LOCK_FILE)
+    if sync_mode == "setup-cdc":
+        install_cdc(pgsql_db_manager.get_current_connection(), get_table_mappings())
+        pgsql_db_manager.disconnect()
+    elif sync_mode == "cdc":
+        run_cdc(turso_db_manager, pgsql_db_manager)
+    elif daemon:
+        schedule = (
+            CronSchedule(DAEMON_CRON)
+            if DAEMON_CRON
+            else IntervalSchedule(DAEMON_INTERVAL)
+        )
+        Daemon(
+            lambda: run_cycle(turso_db_manager, pgsql_db_manager, sync_mode),
+            schedule,
+            lock,
+        ).run()
+    else:
+        with lock as acquired:
+            if acquired:
+                run_cycle(turso_db_manager, pgsql_db_manager, sync_mode)
+            else:
+                logger.warning("Another synchronization is running, exiting")
 
     # Close connections
-    turso_db_manager.disconnect()
-    pgsql_db_manager.disconnect()
+    turso_db_manager.dispose()
+    pgsql_db_manager.dispose()
 
 
 if __name__ == "__main__":
@@ -187,6 +789,16 @@ if __name__ == "__main__":
     else:
         raise ValueError("Please specify 'dev' or 'prod' as an environment argument.")
 
-    print("execute application on environment {}".format(environment))
+    sync_mode = "incremental" if "incremental" in sys.argv else SYNC_MODE
+    if "diff" in sys.argv:
+        sync_mode = "diff"
+    if "full" in sys.argv:
+        sync_mode = "full"
+    if "cdc" in sys.argv:
+        sync_mode = "cdc"
+    if "setup-cdc" in sys.argv:
+        sync_mode = "setup-cdc"
+
+    daemon = "daemon" in sys.argv
 
-    main(environment)
+    main(environment, sync_mode, daemon)
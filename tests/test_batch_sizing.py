@@ -0,0 +1,158 @@
+import unittest
+from unittest.mock import patch
+
+from sqlalchemy import create_engine, text
+from sqlalchemy.exc import OperationalError
+
+from core.load.batch_sizing import AdaptiveBatchSizer
+from core.load.iam_gateway import insert_rows_adaptive
+
+
+class TestAdaptiveBatchSizer(unittest.TestCase):
+
+    def test_additive_increase_and_multiplicative_decrease(self):
+        """
+        Test that fast batches grow the size step by step and a slow or failed batch halves it.
+        """
+        sizer = AdaptiveBatchSizer(
+            "items",
+            initial=100,
+            minimum=10,
+            maximum=250,
+            target_seconds=1,
+            increase=100,
+        )
+        sizer.record_success(100, 1000, 0.1)
+        self.assertEqual(200, sizer.size)
+        sizer.record_success(200, 2000, 0.1)
+        self.assertEqual(250, sizer.size)
+        sizer.record_success(250, 2500, 3)
+        self.assertEqual(125, sizer.size)
+        sizer.record_failure(TimeoutError("timeout"))
+        self.assertEqual(62, sizer.size)
+        for _ in range(5):
+            sizer.record_failure(TimeoutError("timeout"))
+        self.assertEqual(10, sizer.size)
+
+    def test_size_is_capped_by_the_byte_limit(self):
+        """
+        Test that the batch size is reduced so a batch stays within the byte limit.
+        """
+        sizer = AdaptiveBatchSizer(
+            "items", initial=1000, minimum=10, maximum=1000, max_bytes=5000
+        )
+        sizer.record_success(100, 10000, 0.1)
+        self.assertEqual(50, sizer.size)
+
+    def test_batches_follow_the_current_size(self):
+        """
+        Test that the batches are read with the size current when each one starts.
+        """
+        sizer = AdaptiveBatchSizer(
+            "items", initial=2, minimum=1, maximum=10, increase=1
+        )
+        batches = sizer.batches(range(10))
+        self.assertEqual([0, 1], next(batches))
+        sizer.record_success(2, 16, 0.1)
+        self.assertEqual([2, 3, 4], next(batches))
+
+
+class TestInsertRowsAdaptive(unittest.TestCase):
+
+    def setUp(self):
+        self.connection = create_engine("sqlite://").connect()
+        self.connection.execute(
+            text("CREATE TABLE items (id INTEGER PRIMARY KEY, name TEXT)")
+        )
+
+    def tearDown(self):
+        self.connection.close()
+
+    def test_statements_too_large_are_split(self):
+        """
+        Test that a statement rejected as too large is retried with smaller batches in the same transaction.
+        """
+        rows = [(key, f"item {key}") for key in range(40)]
+        sizer = AdaptiveBatchSizer(
+            "items", initial=40, minimum=5, maximum=40, increase=1
+        )
+        execute = self.connection.execute
+
+        def limited_execute(statement, parameters=None):
+            if parameters is not None and len(parameters) > 2 * 10:
+                raise OperationalError(
+                    str(statement), {}, Exception("too many SQL variables")
+                )
+            return execute(statement, parameters)
+
+        with patch.object(self.connection, "execute", side_effect=limited_execute):
+            self.assertEqual(
+                40,
+                insert_rows_adaptive(
+                    self.connection, "items", ("id", "name"), rows, sizer
+                ),
+            )
+        self.assertEqual(
+            40, self.connection.execute(text("SELECT COUNT(*) FROM items")).scalar()
+        )
+        self.assertLess(sizer.size, 40)
+
+    def test_statements_bind_at_most_the_sqlite_limit(self):
+        """
+        Test that the batches are capped to the number of rows binding at most MAX_BOUND_PARAMETERS values.
+        """
+        columns = tuple(f"c{index}" for index in range(10))
+        self.connection.execute(text(f"CREATE TABLE wide ({', '.join(columns)})"))
+        rows = [tuple(range(key, key + 10)) for key in range(5000)]
+        sizer = AdaptiveBatchSizer("wide", initial=5000, minimum=50, maximum=5000)
+        parameter_counts = []
+        execute = self.connection.execute
+
+        def counting_execute(statement, parameters=None):
+            parameter_counts.append(len(parameters))
+            return execute(statement, parameters)
+
+        with patch.object(self.connection, "execute", side_effect=counting_execute):
+            self.assertEqual(
+                5000,
+                insert_rows_adaptive(self.connection, "wide", columns, rows, sizer),
+            )
+        self.assertEqual([32760, 17240], parameter_counts)
+        # the cap is not a failure, the sizer keeps its size
+        self.assertEqual(5000, sizer.size)
+
+    def test_other_errors_are_raised(self):
+        """
+        Test that an error other than a statement too large shrinks the batches and is raised.
+        """
+        sizer = AdaptiveBatchSizer("items", initial=40, minimum=5, maximum=40)
+        with self.assertRaises(OperationalError):
+            insert_rows_adaptive(
+                self.connection, "missing", ("id", "name"), [(1, "a")], sizer
+            )
+        self.assertEqual(20, sizer.size)
+
+    def test_errors_are_classified_on_the_driver_error(self):
+        """
+        Test that a statement whose parameters contain a too-large marker is not split when the driver error is another one.
+        """
+        sizer = AdaptiveBatchSizer("items", initial=40, minimum=5, maximum=40)
+        calls = []
+
+        def failing_execute(statement, parameters=None):
+            calls.append(statement)
+            raise OperationalError(
+                str(statement), parameters, Exception("database is locked")
+            )
+
+        rows = [(key, "too large") for key in range(40)]
+        with patch.object(self.connection, "execute", side_effect=failing_execute):
+            with self.assertRaises(OperationalError):
+                insert_rows_adaptive(
+                    self.connection, "items", ("id", "name"), rows, sizer
+                )
+        self.assertEqual(1, len(calls))
+
+
+if __name__ == "__main__":
+    unittest.main()
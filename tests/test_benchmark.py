@@ -0,0 +1,30 @@
+import unittest
+
+from benchmarks.etl_benchmark import (
+    generate_user_roles,
+    generate_users,
+    percentile,
+)
+
+
+class TestBenchmark(unittest.TestCase):
+
+    def test_generated_data_is_reproducible(self):
+        """
+        Test that the same seed generates the same users and roles.
+        """
+        first = [repr(user) for user in generate_users(50, seed=3)]
+        second = [repr(user) for user in generate_users(50, seed=3)]
+        self.assertEqual(first, second)
+        roles = list(generate_user_roles(generate_users(50, seed=3), 2))
+        self.assertEqual(100, len(roles))
+        self.assertEqual(list(range(1, 101)), [role.id for role in roles])
+
+    def test_percentile(self):
+        """
+        Test the nearest-rank percentile.
+        """
+        values = [float(value) for value in range(1, 101)]
+        self.assertEqual(50.0, percentile(values, 0.5))
+        self.assertEqual(99.0, percentile(values, 0.99))
+        self.assertEqual(0.0, percentile([], 0.5))
@@ -0,0 +1,149 @@
+import unittest
+from unittest.mock import patch
+
+from sqlalchemy import bindparam, text
+
+from config.default import CDC_CHANGELOG_TABLE, FIELD_NAME_2
+from core.helpers.common_sql import decode_ciphertext
+from core.load import iam_gateway
+from core.load.data_keys import get_wrapped_key_lookup
+from core.mapping.tables import default_table_mappings
+from core.rsa_encrypt_decrypt.rsa_manager import RSAKeyRing
+from core.sync import cdc
+from core.sync.cdc import CdcConsumer, install_cdc, read_changes, uninstall_cdc
+from tests import BaseTestClass
+
+
+class TestCdc(BaseTestClass):
+
+    def setUp(self):
+        super().setUp()
+        self.mappings = default_table_mappings()
+        install_cdc(self.pg_connection, self.mappings)
+
+    def tearDown(self):
+        self.pg_connection.rollback()
+        uninstall_cdc(self.pg_connection, self.mappings)
+        super().tearDown()
+
+    def count_rows(self, table_name: str) -> int:
+        return self.turso_connection.execute(
+            text(f"SELECT COUNT(*) FROM {table_name}")
+        ).scalar()
+
+    def test_changes_are_applied_and_acknowledged(self):
+        """
+        Test that the inserted, updated and deleted source rows are applied to the backup, then removed from the changelog.
+        """
+        users, roles = self.mappings
+        role = self.roles[0]
+        user = self.users[1]
+        self.pg_connection.execute(
+            text(f"DELETE FROM {roles.source_table} WHERE id = :id"), {"id": role.id}
+        )
+        self.pg_connection.execute(
+            text(f"UPDATE {roles.source_table} SET role_id = 'auditor'")
+        )
+        self.pg_connection.execute(
+            text(f"UPDATE {users.source_table} SET active = NOT active WHERE id = :id"),
+            {"id": user.id},
+        )
+        self.pg_connection.commit()
+        self.assertEqual(3, len(read_changes(self.pg_connection)))
+        self.pg_connection.rollback()
+
+        counts = CdcConsumer(
+            self.turso_db_manager, self.pg_db_manager, self.mappings, batch_size=2
+        ).drain()
+
+        self.assertEqual({"upserted": 1, "deleted": 1}, counts[roles.source_table])
+        self.assertEqual({"upserted": 1, "deleted": 0}, counts[users.source_table])
+        # the backup may hold the roles of other tests, only the roles of this test are checked
+        self.assertEqual(
+            ["auditor"] * (len(self.roles) - 1),
+            self.turso_connection.execute(
+                text(
+                    f"SELECT role_id FROM {roles.destination_table} WHERE id IN :ids"
+                ).bindparams(bindparam("ids", expanding=True)),
+                {"ids": [role.id for role in self.roles]},
+            )
+            .scalars()
+            .all(),
+        )
+        self.assertEqual(
+            str(not user.active),
+            self.turso_connection.execute(
+                text(f"SELECT active FROM {users.destination_table} WHERE id = :id"),
+                {"id": user.id},
+            ).scalar(),
+        )
+        self.assertEqual(len(self.users), self.count_rows(users.destination_table))
+        self.assertEqual(
+            0,
+            self.pg_connection.execute(
+                text(f"SELECT COUNT(*) FROM {CDC_CHANGELOG_TABLE}")
+            ).scalar(),
+        )
+
+    def test_replayed_changes_are_idempotent(self):
+        """
+        Test that applying the same batch twice leaves the backup unchanged.
+        """
+        users, _ = self.mappings
+        self.pg_connection.execute(
+            text(f"UPDATE {users.source_table} SET admin = NOT admin")
+        )
+        self.pg_connection.commit()
+        consumer = CdcConsumer(self.turso_db_manager, self.pg_db_manager, self.mappings)
+        changes = read_changes(self.pg_connection)
+        consumer.apply_batch(changes)
+        consumer.apply_batch(changes)
+        self.assertEqual(len(self.users), self.count_rows(users.destination_table))
+
+    def test_data_key_of_a_failed_batch_is_not_reused(self):
+        """
+        Test that a batch retried after a rollback is encrypted with a data key stored in the backup.
+        """
+        users, _ = self.mappings
+        user = self.users[1]
+        self.pg_connection.execute(
+            text(f"UPDATE {users.source_table} SET admin = NOT admin WHERE id = :id"),
+            {"id": user.id},
+        )
+        self.pg_connection.commit()
+        consumer = CdcConsumer(self.turso_db_manager, self.pg_db_manager, self.mappings)
+        changes = read_changes(self.pg_connection)
+        with patch.object(iam_gateway, "ENCRYPTION_MODE", "envelope"):
+            with patch.object(
+                cdc, "insert_mapped_rows", side_effect=RuntimeError("batch failed")
+            ):
+                with self.assertRaises(RuntimeError):
+                    consumer.apply_batch(changes)
+            self.turso_connection.rollback()
+            consumer.apply_batch(changes)
+
+        expected = self.pg_connection.execute(
+            text(f"SELECT {FIELD_NAME_2} FROM {users.source_table} WHERE id = :id"),
+            {"id": user.id},
+        ).scalar()
+        stored = self.turso_connection.execute(
+            text(
+                f"SELECT {FIELD_NAME_2} FROM {users.destination_table} WHERE id = :id"
+            ),
+            {"id": user.id},
+        ).scalar()
+        # a new key ring only finds the data key in the backup
+        self.assertEqual(
+            expected,
+            RSAKeyRing()
+            .decrypt(
+                decode_ciphertext(stored),
+                "rsa_keys",
+                get_wrapped_key_lookup(self.turso_connection),
+            )
+            .decode("utf-8"),
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,34 @@
+import unittest
+
+from sqlalchemy import create_engine
+
+from core.sync.change_gate import has_changed, save_fingerprints
+
+
+class TestChangeGate(unittest.TestCase):
+
+    def setUp(self):
+        self.connection = create_engine("sqlite://").connect()
+
+    def tearDown(self):
+        self.connection.close()
+
+    def test_unchanged_after_save(self):
+        """
+        Test that the tables are reported as changed until their fingerprints are saved.
+        """
+        fingerprints = {"iam_user.stats_fingerprint": "10:2:1:9"}
+        self.assertTrue(has_changed(self.connection, fingerprints))
+        save_fingerprints(self.connection, fingerprints)
+        self.assertFalse(has_changed(self.connection, fingerprints))
+        self.assertTrue(
+            has_changed(self.connection, {"iam_user.stats_fingerprint": "11:2:1:10"})
+        )
+
+    def test_unknown_fingerprint_is_a_change(self):
+        """
+        Test that a table without statistics never skips a cycle.
+        """
+        fingerprints = {"iam_user.stats_fingerprint": None}
+        save_fingerprints(self.connection, fingerprints)
+        self.assertTrue(has_changed(self.connection, fingerprints))
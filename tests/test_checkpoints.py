@@ -0,0 +1,185 @@
+import unittest
+from unittest.mock import patch
+
+from sqlalchemy import create_engine, text
+
+import main
+from config.testing import TABLE_NAME_1
+from core.load.checkpoints import (
+    CheckpointTracker,
+    finish_run,
+    get_checkpoint,
+    get_unfinished_run,
+    save_checkpoint,
+    start_run,
+)
+from core.load.iam_gateway import record_user
+from core.mapping.engine import iter_row_pages
+from core.mapping.tables import (
+    ColumnMapping,
+    TableMapping,
+    default_table_mappings,
+)
+from tests import BaseTestClass
+
+
+class TestCheckpoints(unittest.TestCase):
+
+    def setUp(self):
+        self.connection = create_engine("sqlite://").connect()
+
+    def tearDown(self):
+        self.connection.close()
+
+    def test_run_lifecycle(self):
+        """
+        Test that an unfinished run and its checkpoints are kept until the run is finished.
+        """
+        self.assertIsNone(get_unfinished_run(self.connection))
+        run_id = start_run(self.connection)
+        save_checkpoint(self.connection, run_id, "users", 42, 100)
+        self.connection.commit()
+
+        self.assertEqual(run_id, get_unfinished_run(self.connection))
+        self.assertEqual(
+            ("42", 100, False), get_checkpoint(self.connection, run_id, "users")
+        )
+        self.assertEqual(
+            (None, 0, False), get_checkpoint(self.connection, run_id, "roles")
+        )
+
+        finish_run(self.connection, run_id)
+        self.assertIsNone(get_unfinished_run(self.connection))
+        self.assertEqual(
+            (None, 0, False), get_checkpoint(self.connection, run_id, "users")
+        )
+
+    def test_tracker_waits_for_the_previous_batches(self):
+        """
+        Test that the checkpoint only moves past the batches committed without a gap.
+        """
+        tracker = CheckpointTracker()
+        self.assertIsNone(tracker.commit(1, "b", 10))
+        self.assertEqual("b", tracker.commit(0, "a", 10))
+        self.assertEqual("b", tracker.commit(3, "d", 10))
+        self.assertEqual("d", tracker.commit(2, "c", 10))
+        self.assertEqual(40, tracker.rows_loaded)
+
+    def test_row_pages_resume_after_a_key(self):
+        """
+        Test that the keyset pagination reads the rows in key order from the given key.
+        """
+        self.connection.execute(
+            text("CREATE TABLE items (id INTEGER PRIMARY KEY, name TEXT)")
+        )
+        self.connection.execute(
+            text(
+                "INSERT INTO items VALUES (3, 'c'), (1, 'a'), (5, 'e'), (2, 'b'), (4, 'd')"
+            )
+        )
+        items = TableMapping(
+            "items", "items", "items", (ColumnMapping("id"), ColumnMapping("name"))
+        )
+
+        pages = list(iter_row_pages(self.connection, items, page_size=2))
+        self.assertEqual(
+            [[1, 2], [3, 4], [5]], [[row[0] for row in page] for page in pages]
+        )
+
+        pages = list(iter_row_pages(self.connection, items, after="3", page_size=2))
+        self.assertEqual([[4, 5]], [[row[0] for row in page] for page in pages])
+
+
+class TestCheckpointedLoad(BaseTestClass):
+
+    def setUp(self):
+        super().setUp()
+        self.users = self.create_fake_users(50)
+        for user in self.users[2:]:
+            record_user(self.pg_connection, user, False)
+        self.pg_connection.commit()
+        self.turso_connection.execute(text(f"DELETE FROM {TABLE_NAME_1}"))
+        self.turso_connection.commit()
+        self.mapping = default_table_mappings()[0]
+
+    def load(self, run_id: str, failing_batch: int | None = None) -> list:
+        """Load the users with batches of 10 rows, failing at a batch, and return the keys read from the source."""
+        read_keys = []
+        inserts = []
+        iter_pages = main.iter_row_pages
+        insert_rows = main.insert_mapped_rows
+
+        def spy_row_pages(*args, **kwargs):
+            for page in iter_pages(*args, **kwargs):
+                read_keys.extend(row[0] for row in page)
+                yield page
+
+        def failing_insert(*args, **kwargs):
+            inserts.append(None)
+            if len(inserts) == failing_batch:
+                raise RuntimeError("connection lost")
+            return insert_rows(*args, **kwargs)
+
+        with (
+            patch.object(main, "LOAD_BATCH_SIZE", 10),
+            patch.object(main, "get_batch_sizer", return_value=None),
+            patch.object(main, "iter_row_pages", side_effect=spy_row_pages),
+            patch.object(main, "insert_mapped_rows", side_effect=failing_insert),
+        ):
+            main.load_table_checkpointed(
+                self.turso_connection, self.pg_db_manager, self.mapping, run_id
+            )
+        return read_keys
+
+    def test_interrupted_load_resumes_after_the_checkpoint(self):
+        """
+        Test that a load interrupted after some batches only reads the remaining keys when it is run again.
+        """
+        keys = [
+            row[0]
+            for page in iter_row_pages(self.pg_connection, self.mapping)
+            for row in page
+        ]
+        self.pg_connection.rollback()
+        self.assertEqual(50, len(keys))
+
+        run_id = start_run(self.turso_connection)
+        with self.assertRaises(RuntimeError):
+            self.load(run_id, failing_batch=3)
+        self.turso_connection.rollback()
+        self.assertEqual(
+            (str(keys[19]), 20, False),
+            get_checkpoint(self.turso_connection, run_id, TABLE_NAME_1),
+        )
+
+        self.assertEqual((run_id, True), main.begin_load(self.turso_connection, True))
+        self.assertEqual(keys[20:], self.load(run_id))
+        self.assertEqual(
+            (str(keys[-1]), 50, True),
+            get_checkpoint(self.turso_connection, run_id, TABLE_NAME_1),
+        )
+        self.assertEqual(
+            (50, 50),
+            tuple(
+                self.turso_connection.execute(
+                    text(f"SELECT COUNT(*), COUNT(DISTINCT id) FROM {TABLE_NAME_1}")
+                ).one()
+            ),
+        )
+        finish_run(self.turso_connection, run_id)
+
+    def test_failed_truncate_stops_the_load(self):
+        """
+        Test that the load is not run on top of the previous backup when its tables could not be emptied.
+        """
+        with (
+            patch.object(main, "LOAD_DEFER_INDEXES", False),
+            patch.object(main, "begin_load", return_value=(None, False)),
+            patch.object(main, "truncate_tables", return_value=False),
+            patch.object(main, "load_tables") as load_tables,
+        ):
+            with self.assertRaises(RuntimeError):
+                main.load_with_truncate(
+                    self.turso_db_manager, self.pg_db_manager, (self.mapping,)
+                )
+        load_tables.assert_not_called()
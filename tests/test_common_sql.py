@@ -3,10 +3,23 @@ import unittest
 import faker
 
 from core.helpers.common_sql import (
+    bind_rows,
+    build_insert_query,
     convert_bytes_to_sql_string,
     convert_sql_string_to_bytes,
+    decode_ciphertext,
+    decode_ciphertexts,
+    encode_ciphertext,
+    encode_ciphertexts,
+)
+from core.rsa_encrypt_decrypt.rsa_manager import (
+    ENVELOPE_VERSION,
+    EnvelopeCiphertext,
+    decrypt,
+    encrypt,
+    envelope_encrypt_many,
+    new_data_key,
 )
-from core.rsa_encrypt_decrypt.rsa_manager import decrypt, encrypt
 
 
 class TestCommonSQL(unittest.TestCase):
@@ -38,3 +51,93 @@ class TestCommonSQL(unittest.TestCase):
             self.assertEqual(encrypted_data, sql_bytes)
             decrypted_data = decrypt(sql_bytes, "rsa_keys")
             self.assertEqual(message, decrypted_data.decode("utf-8"))
+
+    def test_build_multi_row_insert_query(self):
+        """
+        Test that a multi-row insert statement is built once per batch shape.
+        """
+        query = build_insert_query("users", ("id", "name"), 2, (("password", "'x'"),))
+        self.assertIs(
+            query,
+            build_insert_query("users", ("id", "name"), 2, (("password", "'x'"),)),
+        )
+        self.assertEqual(
+            str(query),
+            "INSERT INTO users (id, name, password) VALUES (:r0c0, :r0c1, 'x'), (:r1c0, :r1c1, 'x')",
+        )
+        self.assertEqual(
+            bind_rows([("1", "a"), ("2", "b")]),
+            {"r0c0": "1", "r0c1": "a", "r1c0": "2", "r1c1": "b"},
+        )
+
+    def test_ciphertext_codecs(self):
+        """
+        Test that encrypted data round-trips through the blob and base64 codecs.
+        """
+        encrypted_data = [
+            encrypt(message, "rsa_keys") for message in self.list_of_messages
+        ]
+
+        blobs = encode_ciphertexts(encrypted_data, "blob")
+        self.assertTrue(all(isinstance(blob, bytes) for blob in blobs))
+        self.assertEqual(encrypted_data, decode_ciphertexts(blobs))
+
+        strings = encode_ciphertexts(encrypted_data, "base64")
+        self.assertTrue(all(isinstance(string, str) for string in strings))
+        self.assertEqual(encrypted_data, decode_ciphertexts(strings))
+        self.assertLess(
+            len(strings[0]), len(convert_bytes_to_sql_string(encrypted_data[0]))
+        )
+
+        with self.assertRaises(ValueError):
+            encode_ciphertext(encrypted_data[0], "hex")
+
+    def test_envelope_ciphertext_codecs(self):
+        """
+        Test that envelope encrypted data is stored as a marked BLOB or a prefixed string and decrypted as an envelope.
+        """
+        data_key = new_data_key("rsa_keys")
+        encrypted_data = envelope_encrypt_many(self.list_of_messages, data_key)
+        blobs = encode_ciphertexts(encrypted_data, "blob")
+        self.assertTrue(all(type(value) is bytes for value in blobs))
+        self.assertEqual([bytes(value) for value in encrypted_data], blobs)
+        strings = encode_ciphertexts(encrypted_data, "base64")
+        self.assertTrue(all(value.startswith("env:") for value in strings))
+        for values in (blobs, strings):
+            decoded_data = decode_ciphertexts(values)
+            self.assertTrue(
+                all(isinstance(value, EnvelopeCiphertext) for value in decoded_data)
+            )
+            self.assertEqual(
+                self.list_of_messages,
+                [decrypt(value, "rsa_keys").decode("utf-8") for value in decoded_data],
+            )
+
+    def test_rsa_blob_starting_with_the_envelope_version(self):
+        """
+        Test that a RSA ciphertext stored as a BLOB starting with the envelope version byte is still decrypted.
+        """
+        message = self.list_of_messages[0]
+        encrypted_data = encrypt(message, "rsa_keys")
+        while not encrypted_data.startswith(ENVELOPE_VERSION):
+            encrypted_data = encrypt(message, "rsa_keys")
+        value = decode_ciphertext(encode_ciphertext(encrypted_data, "blob"))
+        self.assertIsInstance(value, EnvelopeCiphertext)
+        self.assertEqual(message, decrypt(value, "rsa_keys").decode("utf-8"))
+        # the base64 strings are prefixed, so they are never taken for an envelope
+        self.assertNotIsInstance(
+            decode_ciphertext(encode_ciphertext(encrypted_data, "base64")),
+            EnvelopeCiphertext,
+        )
+        # an envelope whose data key is unknown is not decrypted
+        with self.assertRaises(KeyError):
+            decrypt(EnvelopeCiphertext(ENVELOPE_VERSION + bytes(60)), "rsa_keys")
+
+    def test_decode_legacy_escaped_ciphertext(self):
+        """
+        Test that values stored by convert_bytes_to_sql_string are still decoded.
+        """
+        for message in self.list_of_messages:
+            encrypted_data = encrypt(message, "rsa_keys")
+            legacy_value = convert_bytes_to_sql_string(encrypted_data)
+            self.assertEqual(encrypted_data, decode_ciphertext(legacy_value))
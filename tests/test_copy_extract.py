@@ -0,0 +1,139 @@
+import unittest
+from datetime import datetime
+
+from sqlalchemy import text
+from sqlalchemy.exc import DBAPIError
+
+from core.extract.copy import iter_rows_copy, parse_line, unescape
+from core.helpers.retry import is_transient_error
+from core.mapping.engine import iter_rows
+from core.mapping.tables import (
+    ColumnMapping,
+    TableMapping,
+    default_table_mappings,
+)
+from tests import BaseTestClass
+
+
+class TestCopyFormat(unittest.TestCase):
+
+    def test_unescape(self):
+        """
+        Test that the escape sequences of the COPY text format are decoded.
+        """
+        self.assertEqual("plain", unescape("plain"))
+        self.assertEqual("a\tb\nc\\d", unescape("a\\tb\\nc\\\\d"))
+        self.assertEqual("A", unescape("\\101"))
+
+    def test_parse_line(self):
+        """
+        Test that a line is split into typed values, NULL values being None.
+        """
+        self.assertEqual(
+            (1, None, True, datetime(2025, 1, 1, 12, 30), "x\ty"),
+            parse_line(
+                "1\t\\N\tt\t2025-01-01 12:30:00\tx\\ty",
+                (int, str, lambda value: value == "t", datetime.fromisoformat, str),
+            ),
+        )
+
+
+class TestCopyExtract(BaseTestClass):
+
+    def test_copy_matches_the_cursor_extraction(self):
+        """
+        Test that the COPY stream yields the same rows as the cursor extraction.
+        """
+        for mapping in default_table_mappings():
+            self.assertEqual(
+                sorted(tuple(row) for row in iter_rows(self.pg_connection, mapping)),
+                sorted(iter_rows_copy(self.pg_connection, mapping)),
+            )
+
+    def test_copy_in_key_order_after_a_key(self):
+        """
+        Test that an ordered COPY stream starts after the given key.
+        """
+        users, _ = default_table_mappings()
+        keys = sorted(user.id for user in self.users)
+        rows = list(
+            iter_rows_copy(self.pg_connection, users, after=keys[0], ordered=True)
+        )
+        self.assertEqual(keys[1:], [str(row[0]) for row in rows])
+
+    def test_stopping_the_stream_early(self):
+        """
+        Test that the connection is still usable once a COPY stream is closed before its end.
+        """
+        users, _ = default_table_mappings()
+        stream = iter_rows_copy(self.pg_connection, users)
+        next(stream)
+        stream.close()
+        self.pg_connection.rollback()
+        self.assertEqual(1, self.pg_connection.execute(text("SELECT 1")).scalar())
+
+    def test_json_and_bytea_are_parsed(self):
+        """
+        Test that the json, jsonb and bytea columns are parsed like the cursor extraction returns them.
+        """
+        self.pg_connection.execute(
+            text(
+                "CREATE TEMPORARY TABLE documents (id INTEGER PRIMARY KEY, body JSON, tags JSONB, content BYTEA)"
+            )
+        )
+        self.pg_connection.execute(
+            text(
+                "INSERT INTO documents VALUES (1, :body, :tags, :content), (2, NULL, '[]', '')"
+            ),
+            {
+                "body": '{"name": "tab\\there", "size": 1.5}',
+                "tags": '["a", {"b": null}]',
+                "content": b"\x00\\\tbinary\xff",
+            },
+        )
+        documents = TableMapping(
+            "documents",
+            "documents",
+            "documents",
+            tuple(ColumnMapping(name) for name in ("id", "body", "tags", "content")),
+        )
+        # the cursor returns the bytea values as memoryviews
+        self.assertEqual(
+            [
+                (*row[:-1], bytes(row[-1]))
+                for row in iter_rows(self.pg_connection, documents)
+            ],
+            list(iter_rows_copy(self.pg_connection, documents)),
+        )
+        self.pg_connection.rollback()
+
+    def test_unparsed_types_are_rejected(self):
+        """
+        Test that the COPY extraction refuses the array and interval columns instead of copying their text.
+        """
+        self.pg_connection.execute(
+            text(
+                "CREATE TEMPORARY TABLE periods (id INTEGER PRIMARY KEY, days INTEGER[], duration INTERVAL)"
+            )
+        )
+        for column in ("days", "duration"):
+            periods = TableMapping(
+                "periods",
+                "periods",
+                "periods",
+                (ColumnMapping("id"), ColumnMapping(column)),
+            )
+            with self.assertRaisesRegex(ValueError, column):
+                next(iter_rows_copy(self.pg_connection, periods))
+        self.pg_connection.rollback()
+
+    def test_driver_errors_are_wrapped(self):
+        """
+        Test that the errors of the driver are raised as SQLAlchemy errors, classified by the retry.
+        """
+        missing = TableMapping("missing", "missing", "missing", (ColumnMapping("id"),))
+        with self.assertRaises(DBAPIError) as raised:
+            next(iter_rows_copy(self.pg_connection, missing))
+        self.assertEqual("42P01", raised.exception.orig.pgcode)
+        self.assertFalse(is_transient_error(raised.exception))
+        self.pg_connection.rollback()
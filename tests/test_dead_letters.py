@@ -0,0 +1,97 @@
+import json
+import unittest
+
+from sqlalchemy import create_engine, text
+from sqlalchemy.exc import OperationalError
+
+from config.default import DEAD_LETTERS_TABLE
+from core.load.dead_letters import is_row_error
+from core.load.iam_gateway import insert_rows_isolating
+
+
+class TestDeadLetters(unittest.TestCase):
+
+    def setUp(self):
+        self.connection = create_engine("sqlite://").connect()
+        self.connection.execute(
+            text("CREATE TABLE items (id INTEGER PRIMARY KEY, name TEXT NOT NULL)")
+        )
+
+    def tearDown(self):
+        self.connection.close()
+
+    def test_bad_rows_are_isolated(self):
+        """
+        Test that the rows rejected by the database are moved to the dead-letter table and the others are committed.
+        """
+        rows = [(key, None if key in (3, 40) else f"item {key}") for key in range(64)]
+        statements = []
+        execute = self.connection.execute
+
+        def counting_execute(statement, parameters=None):
+            if str(statement).startswith("INSERT INTO items"):
+                statements.append(statement)
+            return execute(statement, parameters)
+
+        self.connection.execute = counting_execute
+        try:
+            inserted = insert_rows_isolating(
+                self.connection, "items", ("id", "name"), rows, conflict_columns=("id",)
+            )
+        finally:
+            del self.connection.execute
+        self.connection.commit()
+
+        self.assertEqual(62, inserted)
+        self.assertEqual(
+            62, self.connection.execute(text("SELECT COUNT(*) FROM items")).scalar()
+        )
+        letters = self.connection.execute(
+            text(
+                f"SELECT table_name, row_key, row_data, error FROM {DEAD_LETTERS_TABLE} ORDER BY row_key"
+            )
+        ).all()
+        self.assertEqual(["3", "40"], [letter.row_key for letter in letters])
+        self.assertEqual({"id": 3, "name": None}, json.loads(letters[0].row_data))
+        self.assertEqual("NOT NULL constraint failed: items.name", letters[0].error)
+        # two statements per bad row and halving of the batch
+        self.assertLessEqual(len(statements), 1 + 2 * 2 * 6)
+
+    def test_upserts_are_idempotent(self):
+        """
+        Test that inserting the same rows again updates them instead of failing.
+        """
+        rows = [(1, "a"), (2, "b")]
+        for _ in range(2):
+            insert_rows_isolating(
+                self.connection, "items", ("id", "name"), rows, conflict_columns=("id",)
+            )
+        self.assertEqual(
+            2, self.connection.execute(text("SELECT COUNT(*) FROM items")).scalar()
+        )
+
+    def test_other_errors_are_raised(self):
+        """
+        Test that an error which is not caused by the values of a row fails the batch.
+        """
+        self.assertFalse(
+            is_row_error(
+                OperationalError("INSERT", {}, Exception("no such table: missing"))
+            )
+        )
+        self.assertTrue(is_row_error(ValueError("UNIQUE constraint failed: items.id")))
+        self.assertFalse(
+            is_row_error(
+                OperationalError(
+                    "INSERT INTO items (id, name) VALUES (?, ?)",
+                    (1, "constraint failed"),
+                    Exception("database is locked"),
+                )
+            )
+        )
+        with self.assertRaises(OperationalError):
+            insert_rows_isolating(self.connection, "missing", ("id",), [(1,)])
+
+
+if __name__ == "__main__":
+    unittest.main()
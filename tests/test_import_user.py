@@ -3,7 +3,7 @@ import unittest
 from sqlalchemy import text
 
 from config.default import FIELD_NAME_1, FIELD_NAME_5
-from core.helpers.common_sql import convert_sql_string_to_bytes
+from core.helpers.common_sql import decode_ciphertext
 from core.rsa_encrypt_decrypt.rsa_manager import decrypt
 from tests import (
     FIELD_NAME_2,
@@ -56,27 +56,21 @@ class TestImportUser(BaseTestClass):
         # )
         self.assertEqual(
             decrypt(
-                convert_sql_string_to_bytes(
-                    fetched_user[0].__getattribute__(FIELD_NAME_5)
-                ),
+                decode_ciphertext(fetched_user[0].__getattribute__(FIELD_NAME_5)),
                 "rsa_keys",
             ).decode(),
             self.users[0].token_activation,
         )
         self.assertEqual(
             decrypt(
-                convert_sql_string_to_bytes(
-                    fetched_user[0].__getattribute__(FIELD_NAME_2)
-                ),
+                decode_ciphertext(fetched_user[0].__getattribute__(FIELD_NAME_2)),
                 "rsa_keys",
             ).decode(),
             self.users[0].username,
         )
         self.assertEqual(
             decrypt(
-                convert_sql_string_to_bytes(
-                    fetched_user[0].__getattribute__(FIELD_NAME_3)
-                ),
+                decode_ciphertext(fetched_user[0].__getattribute__(FIELD_NAME_3)),
                 "rsa_keys",
             ).decode(),
             self.users[0].email,
@@ -0,0 +1,156 @@
+import unittest
+from unittest.mock import patch
+
+from sqlalchemy import text
+
+from config.testing import (
+    FIELD_NAME_8,
+    FIELD_NAME_12,
+    SYNC_STATE_TABLE,
+    TABLE_NAME_1,
+    TABLE_NAME_2,
+)
+from core.mapping.tables import TableMapping, default_table_mappings
+from core.sync import incremental
+from core.sync.incremental import (
+    capture_high_water_marks,
+    remove_deleted_rows,
+    run_incremental_sync,
+    save_high_water_marks,
+)
+from core.sync.state import create_sync_state_table, get_state, set_state
+from tests import BaseTestClass
+
+
+class TestIncrementalSync(BaseTestClass):
+
+    def setUp(self):
+        super().setUp()
+        self.turso_connection.execute(text(f"DELETE FROM {TABLE_NAME_2}"))
+        self.turso_connection.execute(text(f"DROP TABLE IF EXISTS {SYNC_STATE_TABLE}"))
+        self.turso_connection.commit()
+        self.users_mapping = default_table_mappings()[0]
+
+    def test_state_round_trip(self):
+        """
+        Test that the sync-state values are stored as strings, overwritten and read back.
+        """
+        create_sync_state_table(self.turso_connection)
+        self.assertIsNone(get_state(self.turso_connection, "missing"))
+        set_state(self.turso_connection, "key", 1)
+        set_state(self.turso_connection, "key", 2)
+        self.turso_connection.commit()
+        self.assertEqual("2", get_state(self.turso_connection, "key"))
+
+    def test_high_water_marks_round_trip(self):
+        """
+        Test that the saved high-water marks are read back by the next run, which only upserts the rows changed since.
+        """
+        high_water_marks = capture_high_water_marks(self.pg_connection)
+        save_high_water_marks(self.turso_connection, high_water_marks)
+        for state_key, high_water_mark in high_water_marks.items():
+            self.assertEqual(
+                str(high_water_mark), get_state(self.turso_connection, state_key)
+            )
+
+        user = self.users[0]
+        self.pg_connection.execute(
+            text(
+                f"UPDATE {TABLE_NAME_1} SET {FIELD_NAME_8} = '2100-01-01 00:00:00' WHERE id = :id"
+            ),
+            {"id": user.id},
+        )
+        self.pg_connection.commit()
+        counts = run_incremental_sync(self.turso_connection, self.pg_connection, False)
+        self.assertGreaterEqual(counts[f"{TABLE_NAME_1}.upserted"], 1)
+        self.assertEqual(
+            str(
+                capture_high_water_marks(self.pg_connection)[
+                    f"{TABLE_NAME_1}.high_water_mark"
+                ]
+            ),
+            get_state(self.turso_connection, f"{TABLE_NAME_1}.high_water_mark"),
+        )
+
+        # only the row at the new high-water mark is read again
+        counts = run_incremental_sync(self.turso_connection, self.pg_connection, False)
+        self.assertEqual(1, counts[f"{TABLE_NAME_1}.upserted"])
+
+    def test_deleted_rows_are_detected_from_the_row_counts(self):
+        """
+        Test that the keys are compared by default, only when the row counts differ with 'count', and never with 'none'.
+        """
+        run_incremental_sync(self.turso_connection, self.pg_connection, False)
+        with patch.object(incremental, "delete_missing_rows") as delete_missing_rows:
+            self.assertEqual(
+                0,
+                remove_deleted_rows(
+                    self.turso_connection,
+                    self.pg_connection,
+                    self.users_mapping,
+                    "count",
+                ),
+            )
+            delete_missing_rows.assert_not_called()
+            # the keys are compared on every run by default
+            remove_deleted_rows(
+                self.turso_connection, self.pg_connection, self.users_mapping
+            )
+            delete_missing_rows.assert_called_once()
+
+        deleted = self.users[1]
+        self.pg_connection.execute(
+            text(f"DELETE FROM {TABLE_NAME_2} WHERE {FIELD_NAME_12} = :id"),
+            {"id": deleted.id},
+        )
+        self.pg_connection.execute(
+            text(f"DELETE FROM {TABLE_NAME_1} WHERE id = :id"), {"id": deleted.id}
+        )
+        self.pg_connection.commit()
+        for detection, expected in (("none", 0), ("count", 1), ("keys", 0)):
+            self.assertEqual(
+                expected,
+                remove_deleted_rows(
+                    self.turso_connection,
+                    self.pg_connection,
+                    self.users_mapping,
+                    detection,
+                ),
+            )
+        self.turso_connection.commit()
+        self.assertIsNone(
+            self.turso_connection.execute(
+                text(f"SELECT id FROM {TABLE_NAME_1} WHERE id = :id"),
+                {"id": deleted.id},
+            ).scalar()
+        )
+        with self.assertRaises(ValueError):
+            remove_deleted_rows(
+                self.turso_connection,
+                self.pg_connection,
+                self.users_mapping,
+                "all",
+            )
+
+    def test_tables_without_watermark_fields_are_rejected(self):
+        """
+        Test that the incremental synchronization fails before writing when a mapped table has no watermark fields.
+        """
+        users, roles = default_table_mappings()
+        roles = TableMapping(
+            roles.name, roles.source_table, roles.destination_table, roles.columns
+        )
+        with self.assertRaises(ValueError):
+            run_incremental_sync(
+                self.turso_connection, self.pg_connection, False, (users, roles)
+            )
+        self.assertEqual(
+            0,
+            self.turso_connection.execute(
+                text(f"SELECT COUNT(*) FROM {TABLE_NAME_2}")
+            ).scalar(),
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,95 @@
+import os
+import tempfile
+import unittest
+
+from sqlalchemy import create_engine, text
+
+from config.default import DATA_KEYS_TABLE
+from core.database_managers.connection_managers import (
+    LocalFileDBConnectionManager,
+)
+from core.load.local_snapshot import (
+    build_local_indexes,
+    copy_table_definitions,
+    push_tables,
+)
+
+_TABLES = ["parent", "child"]
+
+
+class TestLocalSnapshot(unittest.TestCase):
+
+    def setUp(self):
+        self.remote = create_engine("sqlite://").connect()
+        self.remote.execute(text("CREATE TABLE parent (id TEXT PRIMARY KEY)"))
+        self.remote.execute(
+            text(
+                "CREATE TABLE child (id INTEGER PRIMARY KEY, parent_id TEXT REFERENCES parent(id))"
+            )
+        )
+        self.remote.execute(text("CREATE INDEX ix_child ON child (parent_id)"))
+        self.remote.execute(text("INSERT INTO parent VALUES ('old')"))
+        self.remote.commit()
+
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.local_db_manager = LocalFileDBConnectionManager(
+            os.path.join(directory.name, "snapshot.db")
+        )
+        self.addCleanup(self.local_db_manager.dispose)
+        self.local = self.local_db_manager.get_current_connection()
+
+    def tearDown(self):
+        self.remote.close()
+
+    def test_local_file_is_tuned_for_bulk_loads(self):
+        """
+        Test that the connections of the local file use the bulk load PRAGMAs.
+        """
+        self.assertEqual(
+            "wal", self.local.execute(text("PRAGMA journal_mode")).scalar()
+        )
+        self.assertEqual(0, self.local.execute(text("PRAGMA synchronous")).scalar())
+
+    def test_push_replaces_the_remote_tables(self):
+        """
+        Test that the tables loaded in the local file replace the remote tables with their indexes and data keys.
+        """
+        copy_table_definitions(self.remote, self.local, _TABLES)
+        self.local.execute(text("INSERT INTO parent VALUES ('a'), ('b')"))
+        self.local.execute(text("INSERT INTO child VALUES (1, 'a'), (2, 'b')"))
+        self.local.execute(
+            text(
+                f"CREATE TABLE {DATA_KEYS_TABLE} (key_id TEXT PRIMARY KEY, wrapped_key TEXT NOT NULL, date_created TEXT)"
+            )
+        )
+        self.local.execute(
+            text(f"INSERT INTO {DATA_KEYS_TABLE} VALUES ('k1', 'w', NULL)")
+        )
+        self.local.commit()
+        build_local_indexes(self.remote, self.local, _TABLES)
+
+        counts = push_tables(self.local, self.remote, _TABLES, batch_size=1)
+
+        self.assertEqual({"parent": 2, "child": 2}, counts)
+        self.assertEqual(
+            ["a", "b"],
+            list(
+                self.remote.execute(text("SELECT id FROM parent ORDER BY id")).scalars()
+            ),
+        )
+        self.assertEqual(
+            ["k1"],
+            list(
+                self.remote.execute(
+                    text(f"SELECT key_id FROM {DATA_KEYS_TABLE}")
+                ).scalars()
+            ),
+        )
+        for connection in (self.local, self.remote):
+            indexes = connection.execute(
+                text(
+                    "SELECT tbl_name FROM sqlite_master WHERE type = 'index' AND sql IS NOT NULL"
+                )
+            ).scalars()
+            self.assertEqual(["child"], list(indexes))
@@ -0,0 +1,50 @@
+import logging
+import unittest
+
+from core.helpers.logs import SamplingFilter, configure_queue_logging
+
+
+class _ListHandler(logging.Handler):
+    def __init__(self):
+        super().__init__()
+        self.messages = []
+
+    def emit(self, record):
+        self.messages.append(record.getMessage())
+
+
+class TestLogs(unittest.TestCase):
+
+    def test_sampling_keeps_warnings(self):
+        """
+        Test that one info record out of `every` is kept per message, and every warning.
+        """
+        sampling = SamplingFilter(every=10)
+        kept_infos = sum(
+            sampling.filter(logging.makeLogRecord({"msg": "batch %d", "levelno": 20}))
+            for _ in range(100)
+        )
+        kept_warnings = sum(
+            sampling.filter(logging.makeLogRecord({"msg": "slow", "levelno": 30}))
+            for _ in range(100)
+        )
+        self.assertEqual(10, kept_infos)
+        self.assertEqual(100, kept_warnings)
+
+    def test_queue_logging_writes_from_the_listener(self):
+        """
+        Test that the records reach the handlers once the listener is stopped.
+        """
+        target = logging.getLogger("tests.queue_logging")
+        handler = _ListHandler()
+        listener = configure_queue_logging(target, [handler], logging.INFO)
+        try:
+            for index in range(5):
+                target.info("batch %d loaded", index)
+            target.debug("ignored")
+        finally:
+            listener.stop()
+            target.handlers.clear()
+        self.assertEqual(
+            [f"batch {index} loaded" for index in range(5)], handler.messages
+        )
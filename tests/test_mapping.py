@@ -0,0 +1,159 @@
+import os
+import tempfile
+import unittest
+from datetime import datetime
+
+from sqlalchemy import create_engine, text
+
+from core.load.iam_gateway import user_role_to_row, user_to_row
+from core.mapping.engine import (
+    build_extract_query,
+    iter_rows,
+    record_rows,
+    to_destination_rows,
+)
+from core.mapping.tables import (
+    ColumnMapping,
+    TableMapping,
+    default_table_mappings,
+    load_table_mappings,
+)
+from core.models.iam_gateway import User, UserRole
+
+_MAPPINGS_FILE = """
+[[tables]]
+name = "orders"
+source_table = "src_orders"
+destination_table = "dst_orders"
+key = "order_id"
+watermark_fields = ["updated"]
+constants = { origin = "'pg'" }
+columns = [
+    { source = "order_id", destination = "id" },
+    { source = "customer", encrypted = true },
+    { source = "paid", convert = "int" },
+    { source = "updated", convert = "isoformat" },
+]
+"""
+
+
+class TestMapping(unittest.TestCase):
+
+    def setUp(self):
+        with tempfile.NamedTemporaryFile(
+            "w", suffix=".toml", delete=False
+        ) as mappings_file:
+            mappings_file.write(_MAPPINGS_FILE)
+        self.addCleanup(os.remove, mappings_file.name)
+        (self.orders,) = load_table_mappings(mappings_file.name)
+
+        self.connection = create_engine("sqlite://").connect()
+        self.connection.execute(
+            text(
+                "CREATE TABLE src_orders (order_id INTEGER PRIMARY KEY, customer TEXT, paid BOOLEAN, updated TEXT)"
+            )
+        )
+        self.connection.execute(
+            text(
+                "CREATE TABLE dst_orders (id TEXT PRIMARY KEY, customer TEXT, paid INTEGER, updated TEXT, origin TEXT)"
+            )
+        )
+        self.connection.execute(
+            text(
+                "INSERT INTO src_orders VALUES (1, 'alice', 1, '2025-01-01'), (2, NULL, 0, '2025-02-01')"
+            )
+        )
+
+    def tearDown(self):
+        self.connection.close()
+
+    def test_load_mappings_from_file(self):
+        """
+        Test that a table declared in a TOML file is mapped with its key, encrypted columns and conversions.
+        """
+        self.assertEqual(
+            ("id", "customer", "paid", "updated"), self.orders.destination_columns
+        )
+        self.assertEqual("id", self.orders.destination_key)
+        self.assertEqual((1,), self.orders.encrypted_indexes)
+        self.assertEqual((("origin", "'pg'"),), self.orders.constants)
+
+    def test_invalid_mappings_are_rejected(self):
+        """
+        Test that an unknown conversion and an unmapped key are rejected.
+        """
+        with self.assertRaises(ValueError):
+            ColumnMapping("paid", convert="money")
+        with self.assertRaises(ValueError):
+            TableMapping("orders", "src", "dst", (ColumnMapping("name"),), key="id")
+
+    def test_extract_query_is_generated_once(self):
+        """
+        Test that the extract statement of a mapping is cached per shape of its WHERE clause.
+        """
+        query = build_extract_query(self.orders, lower=True)
+        self.assertIs(query, build_extract_query(self.orders, lower=True))
+        self.assertEqual(
+            "SELECT order_id, customer, paid, updated FROM src_orders WHERE order_id >= :lower",
+            query.text,
+        )
+
+    def test_iter_rows_and_record_rows(self):
+        """
+        Test that the rows of a source table are copied to the destination table with their conversions.
+        """
+        rows = list(iter_rows(self.connection, self.orders, key_range=(2, None)))
+        self.assertEqual([(2, None, 0, "2025-02-01")], [tuple(row) for row in rows])
+
+        recorded = record_rows(
+            self.connection, self.orders, iter_rows(self.connection, self.orders)
+        )
+        self.assertEqual(2, recorded)
+        self.assertEqual(
+            [("1", "alice", 1, "2025-01-01", "pg"), ("2", None, 0, "2025-02-01", "pg")],
+            self.connection.execute(text("SELECT * FROM dst_orders ORDER BY id")).all(),
+        )
+
+    def test_conversions(self):
+        """
+        Test that the values are converted column by column, None being kept.
+        """
+        updated = datetime(2025, 1, 1, 12, 30)
+        self.assertEqual(
+            [("1", "bob", 1, "2025-01-01T12:30:00"), ("2", None, None, None)],
+            to_destination_rows(
+                self.orders, [(1, "bob", True, updated), (2, None, None, None)]
+            ),
+        )
+
+    def test_default_mappings_match_the_record_functions(self):
+        """
+        Test that the default mappings write the same rows as the user and user role record functions.
+        """
+        users, user_roles = default_table_mappings()
+        user = User(
+            "u1",
+            "name",
+            "mail",
+            datetime(2025, 1, 1),
+            "token",
+            True,
+            None,
+            None,
+            False,
+            True,
+        )
+        user_role = UserRole(1, "u1", 2, datetime(2025, 1, 1))
+        self.assertEqual(
+            [user_to_row(user)],
+            to_destination_rows(
+                users, [tuple(getattr(user, slot) for slot in User.__slots__)]
+            ),
+        )
+        self.assertEqual(
+            [user_role_to_row(user_role)],
+            to_destination_rows(
+                user_roles,
+                [tuple(getattr(user_role, slot) for slot in UserRole.__slots__)],
+            ),
+        )
@@ -0,0 +1,148 @@
+import unittest
+from unittest.mock import patch
+
+from sqlalchemy import text
+
+from config.testing import (
+    FIELD_NAME_2,
+    FIELD_NAME_12,
+    ROW_HASHES_TABLE,
+    TABLE_NAME_1,
+    TABLE_NAME_2,
+)
+from core.extract.partitioned import key_range_clause
+from core.load.iam_gateway import record_user, record_user_role
+from core.mapping.tables import default_table_mappings
+from core.sync import merkle
+from core.sync.merkle import diff_table, run_diff_sync
+from tests import BaseTestClass
+
+
+class TestDiffSync(BaseTestClass):
+
+    def setUp(self):
+        super().setUp()
+        self.turso_connection.execute(text(f"DELETE FROM {TABLE_NAME_2}"))
+        self.turso_connection.execute(text(f"DROP TABLE IF EXISTS {ROW_HASHES_TABLE}"))
+        self.turso_connection.commit()
+        self.users = self.create_fake_users(60)
+        for user in self.users[2:]:
+            record_user(self.pg_connection, user, False)
+        for index, role in enumerate(self.create_fake_user_roles(60)[2:]):
+            # the fake ids have 5 digits and may collide
+            role.id = 100000 + index
+            record_user_role(self.pg_connection, role, False)
+        self.pg_connection.commit()
+
+    def get_rows(self, connection, table_name: str, columns: str) -> list[tuple]:
+        return sorted(
+            tuple(str(value) for value in row)
+            for row in connection.execute(
+                text(f"SELECT {columns} FROM {table_name}")
+            ).all()
+        )
+
+    def assert_backup_matches_source(self):
+        self.assertEqual(
+            self.get_rows(self.pg_connection, TABLE_NAME_1, f"id, {FIELD_NAME_2}"),
+            self.get_rows(self.turso_connection, TABLE_NAME_1, f"id, {FIELD_NAME_2}"),
+        )
+        self.assertEqual(
+            self.get_rows(self.pg_connection, TABLE_NAME_2, "id"),
+            self.get_rows(self.turso_connection, TABLE_NAME_2, "id"),
+        )
+        self.pg_connection.rollback()
+
+    def test_first_sync_ships_every_row(self):
+        """
+        Test that the first diff synchronization ships every source row and the next one ships nothing.
+        """
+        counts = run_diff_sync(self.turso_connection, self.pg_connection, False)
+        self.assertEqual(60, counts[TABLE_NAME_1]["upserted"])
+        self.assertEqual(60, counts[TABLE_NAME_2]["upserted"])
+        self.assert_backup_matches_source()
+
+        counts = run_diff_sync(self.turso_connection, self.pg_connection, False)
+        for table_counts in counts.values():
+            self.assertEqual(0, table_counts["upserted"])
+            self.assertEqual(0, table_counts["deleted"])
+
+    def test_only_differing_ranges_are_shipped(self):
+        """
+        Test that changed, inserted and deleted source rows converge by syncing only the ranges holding them.
+        """
+        run_diff_sync(self.turso_connection, self.pg_connection, False)
+        changed, deleted = self.users[10], self.users[20]
+        self.pg_connection.execute(
+            text(
+                f"UPDATE {TABLE_NAME_1} SET {FIELD_NAME_2} = 'renamed' WHERE id = :id"
+            ),
+            {"id": changed.id},
+        )
+        self.pg_connection.execute(
+            text(f"DELETE FROM {TABLE_NAME_2} WHERE {FIELD_NAME_12} = :id"),
+            {"id": deleted.id},
+        )
+        self.pg_connection.execute(
+            text(f"DELETE FROM {TABLE_NAME_1} WHERE id = :id"), {"id": deleted.id}
+        )
+        self.pg_connection.commit()
+        record_user(self.pg_connection, self.create_fake_user(), True)
+
+        synced_ranges = []
+        sync_range = merkle._sync_range
+
+        def spy_sync_range(turso_connection, pgsql_connection, table, key_range, *args):
+            synced_ranges.append(key_range)
+            return sync_range(
+                turso_connection, pgsql_connection, table, key_range, *args
+            )
+
+        with patch.object(merkle, "_sync_range", side_effect=spy_sync_range):
+            counts = diff_table(
+                self.turso_connection,
+                self.pg_connection,
+                default_table_mappings()[0],
+                False,
+                fanout=4,
+                leaf_size=5,
+            )
+
+        self.assertEqual(2, counts["upserted"])
+        self.assertEqual(1, counts["deleted"])
+        # at most one leaf range per difference, each of them holding a few rows
+        self.assertLessEqual(len(synced_ranges), 3)
+        for key_range in synced_ranges:
+            self.assertLessEqual(
+                self.pg_connection.execute(
+                    text(
+                        f"SELECT COUNT(*) FROM {TABLE_NAME_1} WHERE {key_range_clause(key_range)}"
+                    ),
+                    {"lower": key_range[0], "upper": key_range[1]},
+                ).scalar(),
+                5,
+            )
+        self.pg_connection.rollback()
+
+        self.assertEqual(
+            "renamed",
+            self.turso_connection.execute(
+                text(f"SELECT {FIELD_NAME_2} FROM {TABLE_NAME_1} WHERE id = :id"),
+                {"id": changed.id},
+            ).scalar(),
+        )
+        counts = diff_table(
+            self.turso_connection,
+            self.pg_connection,
+            default_table_mappings()[0],
+            False,
+        )
+        self.assertEqual((0, 0), (counts["upserted"], counts["deleted"]))
+        self.assertEqual(
+            self.get_rows(self.pg_connection, TABLE_NAME_1, f"id, {FIELD_NAME_2}"),
+            self.get_rows(self.turso_connection, TABLE_NAME_1, f"id, {FIELD_NAME_2}"),
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,94 @@
+import json
+import os
+import tempfile
+import unittest
+from unittest.mock import MagicMock, patch
+
+import main
+from core.helpers.metrics import RunMetrics, payload_size
+
+
+class TestMetrics(unittest.TestCase):
+
+    def test_stage_counters(self):
+        """
+        Test that the stages accumulate their time, rows, bytes and batches.
+        """
+        metrics = RunMetrics()
+        with metrics.stage("load_users"):
+            metrics.add("load_users", rows=500, bytes=1000, batches=1)
+            metrics.add("load_users", rows=200, bytes=400, batches=1)
+        self.assertEqual(3, len(list(metrics.count_iter("extract_users", "abc"))))
+        metrics.increment("retries")
+
+        report = metrics.report("success", budget=120)
+        self.assertEqual(700, report["stages"]["load_users"]["rows"])
+        self.assertEqual(2, report["stages"]["load_users"]["batches"])
+        self.assertGreater(report["stages"]["load_users"]["seconds"], 0)
+        self.assertEqual(3, report["stages"]["extract_users"]["rows"])
+        self.assertEqual(1, report["retries"])
+        self.assertFalse(report["over_budget"])
+
+        metrics.reset()
+        self.assertEqual({}, metrics.report("success")["stages"])
+
+    def test_count_iter_adds_the_counts_once(self):
+        """
+        Test that a counted stream adds its rows to the stage once, even when it is closed before its end.
+        """
+        metrics = RunMetrics()
+        with patch.object(metrics, "add", wraps=metrics.add) as add:
+            self.assertEqual(
+                1000, len(list(metrics.count_iter("extract", range(1000))))
+            )
+            stream = metrics.count_iter("extract_closed", range(1000))
+            next(stream)
+            next(stream)
+            stream.close()
+        self.assertEqual(2, add.call_count)
+        report = metrics.report("success")
+        self.assertEqual(1000, report["stages"]["extract"]["rows"])
+        self.assertEqual(2, report["stages"]["extract_closed"]["rows"])
+
+    def test_write_reports(self):
+        """
+        Test that the JSON report and the Prometheus textfile are written.
+        """
+        metrics = RunMetrics()
+        metrics.add("load_roles", rows=10, seconds=0.5)
+        with tempfile.TemporaryDirectory() as directory:
+            metrics.write_reports(directory, "failure", budget=0)
+            with open(os.path.join(directory, "etl_metrics.json")) as file:
+                report = json.load(file)
+            with open(os.path.join(directory, "etl_metrics.prom")) as file:
+                textfile = file.read()
+        self.assertEqual("failure", report["status"])
+        self.assertTrue(report["over_budget"])
+        self.assertIn("etl_run_success 0\n", textfile)
+        self.assertIn('etl_stage_rows{stage="load_roles"} 10\n', textfile)
+        self.assertIn('etl_stage_rows_per_second{stage="load_roles"} 20.0\n', textfile)
+
+    def test_payload_size(self):
+        """
+        Test the approximate size of rows.
+        """
+        self.assertEqual(5, payload_size([("abc", b"de", None, "")]))
+
+    def test_report_errors_do_not_hide_the_cycle_error(self):
+        """
+        Test that a cycle failing while its reports cannot be written raises its own error.
+        """
+        turso_db_manager = MagicMock()
+        turso_db_manager.get_current_connection.side_effect = ConnectionError(
+            "turso unreachable"
+        )
+        with (
+            patch.object(
+                main.metrics, "write_reports", side_effect=OSError("disk full")
+            ) as write_reports,
+            self.assertLogs("main", "ERROR") as logs,
+        ):
+            with self.assertRaisesRegex(ConnectionError, "turso unreachable"):
+                main.run_cycle(turso_db_manager, MagicMock(), "full")
+        write_reports.assert_called_once()
+        self.assertIn("disk full", logs.output[0])
@@ -0,0 +1,50 @@
+import unittest
+
+from core.models.iam_gateway import User, UserRole
+
+_USER_ROW = (
+    "322e6085-360e-4f4a-8935-40259ea4cd74",
+    "rubiobryce",
+    "wesley92@example.com",
+    "2025-01-01T10:00:00",
+    "c965a68a-de64-4913-8c7a-4f2cb276af82",
+    True,
+    "2025-01-02T10:00:00",
+    None,
+    False,
+    False,
+)
+
+
+class TestModels(unittest.TestCase):
+
+    def test_user_from_row_matches_keyword_constructor(self):
+        """
+        Test that a user built from a row has the attributes of a user built by name.
+        """
+        user = User.from_row(_USER_ROW)
+        expected = User(
+            **{
+                "id": _USER_ROW[0],
+                "username": _USER_ROW[1],
+                "email": _USER_ROW[2],
+                "date_created": _USER_ROW[3],
+                "token_activation": _USER_ROW[4],
+                "active": _USER_ROW[5],
+                "date_activated": _USER_ROW[6],
+                "date_deactivated": _USER_ROW[7],
+                "deleted": _USER_ROW[8],
+                "admin": _USER_ROW[9],
+            }
+        )
+        self.assertEqual(repr(expected), repr(user))
+        self.assertFalse(hasattr(user, "__dict__"))
+
+    def test_user_role_from_row(self):
+        """
+        Test that a user role is built from a row.
+        """
+        role = UserRole.from_row((1, _USER_ROW[0], "Admin", "2025-01-01T10:00:00"))
+        self.assertEqual(1, role.id)
+        self.assertEqual(_USER_ROW[0], role.user_id)
+        self.assertEqual("Admin", role.role_id)
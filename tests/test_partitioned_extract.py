@@ -0,0 +1,97 @@
+import unittest
+
+from config.testing import TABLE_NAME_1
+from core.extract.iam_gateway import iter_user_roles, iter_users
+from core.extract.partitioned import (
+    get_key_ranges,
+    iter_user_roles_partitioned,
+    iter_users_partitioned,
+)
+from core.load.iam_gateway import record_user, record_user_role
+from tests import BaseTestClass
+
+
+def as_tuples(records) -> list[tuple]:
+    """Return the values of records, so they can be compared."""
+    return [
+        tuple(getattr(record, field) for field in record.__slots__)
+        for record in records
+    ]
+
+
+class TestPartitionedExtract(BaseTestClass):
+
+    def setUp(self):
+        super().setUp()
+        # enough rows for every partition to hold some of them
+        self.users = self.create_fake_users(40)
+        for user in self.users[2:]:
+            record_user(self.pg_connection, user, False)
+        for index, role in enumerate(self.create_fake_user_roles(40)[2:]):
+            # the fake ids have 5 digits and may collide
+            role.id = 100000 + index
+            record_user_role(self.pg_connection, role, False)
+        self.pg_connection.commit()
+
+    def test_partitions_yield_every_row_once(self):
+        """
+        Test that the partitioned extraction yields exactly the rows of the sequential one, for one and several partitions.
+        """
+        users = sorted(as_tuples(iter_users(self.pg_connection)))
+        roles = sorted(as_tuples(iter_user_roles(self.pg_connection)))
+        self.pg_connection.rollback()
+        self.assertEqual(40, len(users))
+
+        for partitions in (1, 3, 8):
+            with self.subTest(partitions=partitions):
+                self.assertEqual(
+                    users,
+                    sorted(
+                        as_tuples(
+                            iter_users_partitioned(self.pg_db_manager, partitions)
+                        )
+                    ),
+                )
+                self.assertEqual(
+                    roles,
+                    sorted(
+                        as_tuples(
+                            iter_user_roles_partitioned(self.pg_db_manager, partitions)
+                        )
+                    ),
+                )
+
+    def test_key_ranges_cover_the_table(self):
+        """
+        Test that the key ranges are contiguous, unbounded at both ends and hold about the same number of rows.
+        """
+        self.assertEqual(
+            [(None, None)], get_key_ranges(self.pg_connection, TABLE_NAME_1, 1)
+        )
+        key_ranges = get_key_ranges(self.pg_connection, TABLE_NAME_1, 4)
+        self.assertEqual(4, len(key_ranges))
+        self.assertIsNone(key_ranges[0][0])
+        self.assertIsNone(key_ranges[-1][1])
+        for (_, upper), (lower, _) in zip(key_ranges, key_ranges[1:]):
+            self.assertEqual(upper, lower)
+        counts = [
+            len(list(iter_users(self.pg_connection, key_range=key_range)))
+            for key_range in key_ranges
+        ]
+        self.assertEqual(40, sum(counts))
+        for count in counts:
+            self.assertAlmostEqual(10, count, delta=1)
+        self.pg_connection.rollback()
+
+    def test_rows_written_during_the_extraction_are_not_read(self):
+        """
+        Test that the partitions read the snapshot exported when the extraction started.
+        """
+        stream = iter_users_partitioned(self.pg_db_manager, 4)
+        first = next(stream)
+        record_user(self.pg_connection, self.create_fake_user(), True)
+        self.assertEqual(40, len([first, *stream]))
+
+
+if __name__ == "__main__":
+    unittest.main()
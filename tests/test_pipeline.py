@@ -0,0 +1,49 @@
+import unittest
+
+from core.pipeline.runner import Pipeline, run_pipeline
+
+
+class TestPipeline(unittest.TestCase):
+
+    def test_pipeline_loads_every_batch(self):
+        """
+        Test that every extracted batch is transformed and loaded.
+        """
+        loaded_rows = []
+
+        def load(rows):
+            loaded_rows.extend(rows)
+            return len(rows)
+
+        batches = ([index, index + 1] for index in range(0, 100, 2))
+        loaded = Pipeline("test", queue_size=2, transform_workers=3).run(
+            batches, lambda batch: [value * 10 for value in batch], [load]
+        )
+
+        self.assertEqual(100, loaded)
+        self.assertEqual(sorted(loaded_rows), [value * 10 for value in range(100)])
+
+    def test_pipeline_stops_on_extract_error(self):
+        """
+        Test that an error of the source stops the pipeline and is raised.
+        """
+
+        def batches():
+            yield [1]
+            raise RuntimeError("source lost")
+
+        with self.assertRaises(RuntimeError):
+            run_pipeline("test", batches(), lambda batch: batch, len)
+
+    def test_pipeline_stops_on_load_error(self):
+        """
+        Test that an error of the loader stops the producer instead of blocking it.
+        """
+
+        def load(rows):
+            raise ValueError("bad row")
+
+        with self.assertRaises(ValueError):
+            run_pipeline(
+                "test", ([index] for index in range(1000)), lambda batch: batch, load
+            )
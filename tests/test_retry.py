@@ -0,0 +1,154 @@
+import threading
+import unittest
+from unittest.mock import MagicMock, patch
+
+from sqlalchemy.exc import IntegrityError, OperationalError
+
+from core.database_managers.connection_managers import BaseDBConnectionManager
+from core.helpers.retry import backoff_delay, is_transient_error, retry
+
+
+class TestRetry(unittest.TestCase):
+
+    @patch("core.helpers.retry.time.sleep")
+    def test_retry_until_success(self, sleep):
+        """
+        Test that an operation failing on transient errors is called again until it succeeds.
+        """
+        outcomes = [
+            OperationalError("SELECT 1", {}, Exception("database is locked"))
+        ] * 2
+        outcomes.append("done")
+
+        def operation():
+            outcome = outcomes.pop(0)
+            if isinstance(outcome, Exception):
+                raise outcome
+            return outcome
+
+        self.assertEqual("done", retry(operation, attempts=3))
+        self.assertEqual(2, sleep.call_count)
+
+    @patch("core.helpers.retry.time.sleep")
+    def test_no_retry_on_permanent_error(self, sleep):
+        """
+        Test that an error which is not transient is raised at once.
+        """
+        calls = []
+
+        def operation():
+            calls.append(1)
+            raise ValueError("no such table: iam_user")
+
+        with self.assertRaises(ValueError):
+            retry(operation, attempts=5)
+        self.assertEqual(1, len(calls))
+        sleep.assert_not_called()
+
+    def test_transient_errors(self):
+        """
+        Test the classification of the transient errors.
+        """
+        self.assertTrue(is_transient_error(ConnectionResetError()))
+        self.assertTrue(is_transient_error(Exception("HTTP status 503")))
+        self.assertFalse(is_transient_error(ValueError("UNIQUE constraint failed")))
+
+    def test_wrapped_errors_are_classified_on_the_driver_error(self):
+        """
+        Test that the errors wrapped by SQLAlchemy are classified on the driver error, not on the statement and its parameters.
+        """
+        self.assertTrue(
+            is_transient_error(
+                OperationalError("SELECT 1", {}, Exception("database is locked"))
+            )
+        )
+        self.assertFalse(
+            is_transient_error(
+                OperationalError(
+                    "SELECT * FROM missing", {}, Exception("no such table: missing")
+                )
+            )
+        )
+        self.assertFalse(
+            is_transient_error(
+                OperationalError(
+                    "SELECT * FROM", {}, Exception('near "FROM": syntax error')
+                )
+            )
+        )
+        self.assertFalse(
+            is_transient_error(
+                IntegrityError(
+                    "INSERT INTO iam_user (id, email) VALUES (?, ?)",
+                    ("503-timeout", "user503@example.com"),
+                    Exception("UNIQUE constraint failed: iam_user.id"),
+                )
+            )
+        )
+
+    def test_sqlstate_classification(self):
+        """
+        Test that the PostgreSQL errors are classified on their SQLSTATE.
+        """
+
+        class DriverError(Exception):
+            def __init__(self, message, pgcode):
+                super().__init__(message)
+                self.pgcode = pgcode
+
+        self.assertTrue(
+            is_transient_error(
+                OperationalError("SELECT 1", {}, DriverError("deadlock", "40P01"))
+            )
+        )
+        self.assertFalse(
+            is_transient_error(
+                IntegrityError(
+                    "INSERT", {}, DriverError("duplicate key, timeout", "23505")
+                )
+            )
+        )
+
+    def test_backoff_delay_is_capped(self):
+        """
+        Test that the jittered delay never exceeds the exponential backoff nor the maximum delay.
+        """
+        for attempt in range(10):
+            delay = backoff_delay(attempt, base_delay=0.5, max_delay=4)
+            self.assertGreaterEqual(delay, 0)
+            self.assertLessEqual(delay, min(4, 0.5 * 2**attempt))
+
+
+class TestConnectTimeout(unittest.TestCase):
+
+    @patch("core.helpers.retry.time.sleep")
+    def test_hung_checkouts_time_out(self, sleep):
+        """
+        Test that a checkout hanging past the connect timeout fails with a retried timeout, and its late connection is closed.
+        """
+        released = threading.Event()
+        connections = []
+
+        def hung_connect():
+            released.wait()
+            connection = MagicMock()
+            connections.append(connection)
+            return connection
+
+        engine = MagicMock()
+        engine.connect.side_effect = hung_connect
+        manager = BaseDBConnectionManager(engine, connect_timeout=0.05)
+        with self.assertRaises(TimeoutError):
+            manager.checkout()
+        self.assertGreater(engine.connect.call_count, 1)
+
+        released.set()
+        for thread in threading.enumerate():
+            if thread.name == "connect":
+                thread.join(1)
+        self.assertEqual(engine.connect.call_count, len(connections))
+        for connection in connections:
+            connection.close.assert_called_once()
+
+        engine.connect.side_effect = None
+        self.assertIs(engine.connect.return_value, manager.checkout())
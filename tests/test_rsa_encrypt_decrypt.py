@@ -1,7 +1,17 @@
+import os
 import unittest
 
 from config.testing import *
-from core.rsa_encrypt_decrypt.rsa_manager import decrypt, encrypt
+from core.rsa_encrypt_decrypt.rsa_manager import (
+    RSAKeyRing,
+    decrypt,
+    decrypt_many,
+    encrypt,
+    encrypt_many,
+    envelope_encrypt_many,
+    key_ring,
+    new_data_key,
+)
 
 
 class TestRsaManager(unittest.TestCase):
@@ -67,3 +77,64 @@ class TestRsaManager(unittest.TestCase):
         decrypted_data = decrypt(encrypted_data, "rsa_keys").decode("utf-8")
 
         self.assertEqual(original_data, decrypted_data)
+
+    def test_key_ring_caches_keys(self):
+        public_key = key_ring.get_public_key("rsa_keys")
+        self.assertIs(public_key, key_ring.get_public_key("rsa_keys"))
+        private_key = key_ring.get_private_key("rsa_keys")
+        self.assertIs(private_key, key_ring.get_private_key("rsa_keys"))
+
+    def test_key_ring_reloads_modified_keys(self):
+        public_key = key_ring.get_public_key("rsa_keys")
+        key_file = os.path.join(BASE_DIR, "rsa_keys", "public_key.pem")
+        stat = os.stat(key_file)
+        os.utime(key_file, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000))
+
+        reloaded_key = key_ring.get_public_key("rsa_keys")
+        self.assertIsNot(public_key, reloaded_key)
+        self.assertEqual(public_key, reloaded_key)
+
+    def test_encrypt_decrypt_many(self):
+        original_data = ["rubiobryce", "wesley92@example.com", "322e6085"]
+        encrypted_data = encrypt_many(original_data, "rsa_keys")
+        self.assertEqual(len(original_data), len(encrypted_data))
+
+        decrypted_data = decrypt_many(encrypted_data, "rsa_keys")
+        self.assertEqual(
+            original_data, [message.decode("utf-8") for message in decrypted_data]
+        )
+
+    def test_envelope_encrypt_decrypt(self):
+        original_data = ["rubiobryce", "wesley92@example.com", "x" * 1024]
+        data_key = new_data_key("rsa_keys")
+        encrypted_data = envelope_encrypt_many(original_data, data_key)
+
+        # the data key is cached by the key ring which generated it
+        decrypted_data = decrypt_many(encrypted_data, "rsa_keys")
+        self.assertEqual(
+            original_data, [message.decode("utf-8") for message in decrypted_data]
+        )
+
+    def test_envelope_decrypt_with_wrapped_key(self):
+        original_data = "322e6085-360e-4f4a-8935-40259ea4cd74"
+        data_key = new_data_key("rsa_keys")
+        encrypted_data = envelope_encrypt_many([original_data], data_key)[0]
+
+        wrapped_keys = {data_key.key_id.hex(): data_key.wrapped_key}
+        decrypted_data = RSAKeyRing().decrypt(
+            encrypted_data, "rsa_keys", wrapped_keys.__getitem__
+        )
+        self.assertEqual(original_data, decrypted_data.decode("utf-8"))
+
+    def test_decrypt_supports_rsa_and_envelope_messages(self):
+        original_data = "rubiobryce"
+        data_key = new_data_key("rsa_keys")
+        encrypted_data = [
+            encrypt(original_data, "rsa_keys"),
+            envelope_encrypt_many([original_data], data_key)[0],
+        ]
+
+        for message in encrypted_data:
+            self.assertEqual(
+                original_data, decrypt(message, "rsa_keys").decode("utf-8")
+            )
@@ -0,0 +1,99 @@
+import os
+import tempfile
+import unittest
+from datetime import datetime
+
+from core.scheduler.daemon import (
+    CronSchedule,
+    CycleLock,
+    Daemon,
+    IntervalSchedule,
+)
+
+
+class TestScheduler(unittest.TestCase):
+
+    def test_cron_every_two_minutes(self):
+        """
+        Test that a step expression runs on the next multiple of the step.
+        """
+        schedule = CronSchedule("*/2 * * * *")
+        self.assertEqual(
+            datetime(2025, 1, 1, 10, 2),
+            schedule.next_run(datetime(2025, 1, 1, 10, 0, 30)),
+        )
+        self.assertEqual(
+            datetime(2025, 1, 1, 11, 0),
+            schedule.next_run(datetime(2025, 1, 1, 10, 59)),
+        )
+
+    def test_cron_daily_and_weekday(self):
+        """
+        Test the hour, month rollover and weekday fields.
+        """
+        self.assertEqual(
+            datetime(2025, 2, 1, 3, 30),
+            CronSchedule("30 3 * * *").next_run(datetime(2025, 1, 31, 4, 0)),
+        )
+        # 2025-01-01 is a wednesday, the next monday is 2025-01-06
+        self.assertEqual(
+            datetime(2025, 1, 6, 0, 0),
+            CronSchedule("0 0 * * 1").next_run(datetime(2025, 1, 1, 12, 0)),
+        )
+        # like cron, both 0 and 7 stand for sunday, the next one is 2025-01-05
+        for expression, expected in (
+            ("0 0 * * 0", datetime(2025, 1, 5, 0, 0)),
+            ("0 0 * * 7", datetime(2025, 1, 5, 0, 0)),
+            ("0 0 * * 6-7", datetime(2025, 1, 4, 0, 0)),
+        ):
+            with self.subTest(expression=expression):
+                self.assertEqual(
+                    expected,
+                    CronSchedule(expression).next_run(datetime(2025, 1, 1, 12, 0)),
+                )
+
+    def test_invalid_cron_expression(self):
+        """
+        Test that an invalid cron expression is rejected.
+        """
+        with self.assertRaises(ValueError):
+            CronSchedule("* * *")
+        with self.assertRaises(ValueError):
+            CronSchedule("61 * * * *")
+        with self.assertRaises(ValueError):
+            CronSchedule("* * * * 8")
+
+    def test_lock_is_exclusive(self):
+        """
+        Test that a cycle is skipped while the lock is held by another cycle.
+        """
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "etl.lock")
+            calls = []
+            daemon = Daemon(
+                lambda: calls.append(1), IntervalSchedule(60), CycleLock(path)
+            )
+            with CycleLock(path) as acquired:
+                self.assertTrue(acquired)
+                self.assertFalse(daemon.run_cycle())
+            self.assertTrue(daemon.run_cycle())
+            self.assertEqual([1], calls)
+
+    def test_daemon_stops_after_the_running_cycle(self):
+        """
+        Test that a stop request ends the daemon once the running cycle is over.
+        """
+        with tempfile.TemporaryDirectory() as directory:
+            calls = []
+
+            def cycle():
+                calls.append(1)
+                daemon.stop()
+
+            daemon = Daemon(
+                cycle,
+                IntervalSchedule(0.01),
+                CycleLock(os.path.join(directory, "etl.lock")),
+            )
+            daemon.run()
+            self.assertEqual([1], calls)
@@ -0,0 +1,158 @@
+import unittest
+
+from sqlalchemy import create_engine, text
+
+from core.load.schema import (
+    analyze_tables,
+    build_staging_indexes,
+    bulk_load_pragmas,
+    create_staging_tables,
+    drop_secondary_indexes,
+    ensure_destination_schema,
+    rebuild_secondary_indexes,
+    staging_tables_exist,
+    swap_staging_tables,
+)
+from core.mapping.tables import ColumnMapping, TableMapping
+
+_TABLES = ["parent", "child"]
+
+
+class TestSchema(unittest.TestCase):
+
+    def setUp(self):
+        self.connection = create_engine("sqlite://").connect()
+        self.connection.execute(text("PRAGMA foreign_keys = ON"))
+        self.connection.execute(text("CREATE TABLE parent (id TEXT PRIMARY KEY)"))
+        self.connection.execute(
+            text(
+                "CREATE TABLE child (id INTEGER PRIMARY KEY, parent_id TEXT REFERENCES parent(id))"
+            )
+        )
+        self.connection.execute(text("CREATE INDEX ix_child ON child (parent_id)"))
+        self.connection.execute(text("INSERT INTO parent VALUES ('old')"))
+        self.connection.execute(text("INSERT INTO child VALUES (1, 'old')"))
+        self.connection.commit()
+
+    def tearDown(self):
+        self.connection.close()
+
+    def _load_generation(self, value: str):
+        parent, child = create_staging_tables(self.connection, _TABLES)
+        self.connection.execute(text(f"INSERT INTO {parent} VALUES ('{value}')"))
+        self.connection.execute(text(f"INSERT INTO {child} VALUES (1, '{value}')"))
+        self.connection.commit()
+        build_staging_indexes(self.connection, _TABLES)
+        swap_staging_tables(self.connection, _TABLES)
+
+    def test_swap_replaces_the_live_tables(self):
+        """
+        Test that the staging data replaces the live data and that no staging or old table is left.
+        """
+        self._load_generation("new")
+        self.assertEqual(
+            [(1, "new")],
+            self.connection.execute(text("SELECT * FROM child")).all(),
+        )
+        tables = self.connection.execute(
+            text("SELECT name FROM sqlite_master WHERE type = 'table' ORDER BY name")
+        ).scalars()
+        self.assertEqual(["child", "parent"], list(tables))
+
+    def test_swap_keeps_references_and_indexes(self):
+        """
+        Test that the foreign keys and indexes of the live tables survive several swaps.
+        """
+        self._load_generation("new")
+        self._load_generation("newer")
+        ddl = self.connection.execute(
+            text("SELECT sql FROM sqlite_master WHERE name = 'child'")
+        ).scalar()
+        self.assertIn('REFERENCES "parent"', ddl)
+        indexes = self.connection.execute(
+            text(
+                "SELECT name FROM sqlite_master WHERE type = 'index' AND tbl_name = 'child'"
+            )
+        ).scalars()
+        self.assertEqual(["ix_child"], list(indexes))
+
+    def test_staging_tables_exist(self):
+        """
+        Test that the staging tables of an interrupted load are detected until they are swapped in.
+        """
+        self.assertFalse(staging_tables_exist(self.connection, _TABLES))
+        create_staging_tables(self.connection, _TABLES)
+        self.assertTrue(staging_tables_exist(self.connection, _TABLES))
+        swap_staging_tables(self.connection, _TABLES)
+        self.assertFalse(staging_tables_exist(self.connection, _TABLES))
+
+    def _index_names(self) -> list[str]:
+        return list(
+            self.connection.execute(
+                text(
+                    "SELECT name FROM sqlite_master WHERE type = 'index' AND sql IS NOT NULL ORDER BY name"
+                )
+            ).scalars()
+        )
+
+    def test_deferred_indexes_are_rebuilt(self):
+        """
+        Test that the dropped indexes are rebuilt, even when the drop is repeated by a resumed load.
+        """
+        self.connection.execute(
+            text("CREATE UNIQUE INDEX ux_child ON child (parent_id, id)")
+        )
+        self.assertEqual(["ix_child"], drop_secondary_indexes(self.connection, _TABLES))
+        self.assertEqual(["ux_child"], self._index_names())
+        self.assertEqual(["ix_child"], drop_secondary_indexes(self.connection, _TABLES))
+
+        self.assertEqual(["ix_child"], rebuild_secondary_indexes(self.connection))
+        self.assertEqual(["ix_child", "ux_child"], self._index_names())
+        self.assertEqual([], rebuild_secondary_indexes(self.connection))
+
+    def test_destination_schema_is_created_or_checked(self):
+        """
+        Test that a missing destination table is created and that a table lacking mapped columns is refused.
+        """
+        items = TableMapping(
+            "items",
+            "items",
+            "items",
+            (ColumnMapping("id", convert="int"), ColumnMapping("name")),
+        )
+        ensure_destination_schema(self.connection, (items,))
+        self.connection.execute(
+            text("INSERT INTO items (id, name, date_insertion) VALUES (1, 'a', NULL)")
+        )
+        ensure_destination_schema(self.connection, (items,))
+
+        parent = TableMapping(
+            "parent", "parent", "parent", (ColumnMapping("id"), ColumnMapping("name"))
+        )
+        with self.assertRaises(ValueError):
+            ensure_destination_schema(self.connection, (parent,))
+
+    def test_pragmas_are_restored(self):
+        """
+        Test that the bulk load PRAGMAs are applied during the load only, the unknown ones being skipped.
+        """
+        cache_size = self.connection.execute(text("PRAGMA cache_size")).scalar()
+        with bulk_load_pragmas(self.connection, "cache_size=-1024,not a pragma=1"):
+            self.assertEqual(
+                -1024, self.connection.execute(text("PRAGMA cache_size")).scalar()
+            )
+        self.assertEqual(
+            cache_size, self.connection.execute(text("PRAGMA cache_size")).scalar()
+        )
+
+    def test_analyze_tables(self):
+        """
+        Test that the statistics of the analyzed tables are collected.
+        """
+        analyze_tables(self.connection, _TABLES)
+        self.assertIn(
+            "child",
+            self.connection.execute(text("SELECT tbl FROM sqlite_stat1"))
+            .scalars()
+            .all(),
+        )